@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Товарные позиции, итог и НДС счёта прямо из ячеек Excel (.xlsx/.xlsm/.xls)
+
+Плоский текст office_to_text теряет колонки, поэтому позиции читаются из сетки:
+  1. находится строка шапки таблицы (№, Наименование/Товары, Кол-во, Ед., Цена, Сумма);
+  2. колонки таблицы читаются целиком до строки итогов ("Итого", "Всего к оплате",
+     "В том числе НДС"): xlrd col_values для .xls; для .xlsx строки берутся одним
+     проходом по XML листа (только ячейки со значениями) и транспонируются;
+  3. числа берутся из типизированных значений ячеек, текст "1 234,50" приводится
+     к float без регулярных выражений.
+
+Итог и НДС берутся из ячеек-подписей ниже таблицы ("Всего к оплате:", "В том числе
+НДС 20%:"): число правее в той же строке или под подписью - без превращения чисел
+в текст и обратного разбора регулярными выражениями.
+
+Позиция: {"position", "name", "quantity", "unit", "price", "total"} - как items
+в SmartInvoiceAnalyzer. Поля передаются в UltimateInvoiceParser.parse_invoice(resolved=...),
+и извлекатели итога и НДС по тексту не запускаются.
+"""
+
+import re
+import sys
+import json
+from html import unescape
+from typing import Any, Dict, List, Optional
+
+# Колонки шапки: точные названия (лучше) и начала названий (хуже)
+HEADER_COLUMNS = {
+    'position': (('№', '№ п/п', 'n', 'n п/п'), ('№ п',)),
+    'name': (('наименование', 'товар', 'товары'), ('наименование', 'товар', 'работ', 'услуг', 'номенклатура')),
+    'quantity': (('кол-во', 'количество', 'кол.'), ('кол-во', 'количество', 'кол.')),
+    'unit': (('ед.', 'ед', 'ед. изм.', 'единица измерения'), ('ед.', 'ед ', 'единица')),
+    'price': (('цена',), ('цена',)),
+    'total': (('сумма', 'стоимость'), ('сумма', 'стоимость')),
+}
+
+# Строка таблицы с такой подписью - итоги: позиции закончились
+TOTALS_ROW_LABELS = ('итого', 'всего', 'в том числе', 'в т.ч', 'ндс')
+
+# Подписи итога и НДС в ячейках, в порядке приоритета ("к оплате" надёжнее "итого")
+TOTAL_CELL_LABELS = ('всего к оплате', 'итого к оплате', 'итого с ндс', 'итого')
+VAT_CELL_LABELS = ('в том числе ндс', 'в т.ч. ндс', 'итого ндс', 'сумма ндс', 'ндс')
+
+_RE_RATE = re.compile(r'(\d{1,2})\s*%')
+
+# Шапка ищется в первых строках листа (ниже - сама таблица и подвал)
+MAX_HEADER_ROW = 200
+
+
+def _normalize_header(value: Any) -> str:
+    """'Коли-\\nчество' -> 'количество', 'Кол-во\\nст/п' -> 'кол-во ст/п'"""
+    text = str(value).lower().replace('-\n', '').replace('\n', ' ').strip(' :')
+    return ' '.join(text.split())
+
+
+def _match_header(text: str) -> Dict[str, int]:
+    """Поля таблицы, которым подходит название колонки: поле -> ранг (0 - точное совпадение)"""
+    matches = {}
+    for field, (exact, prefixes) in HEADER_COLUMNS.items():
+        # "Сумма НДС", "Ставка НДС" - не сумма и не цена позиции
+        if field in ('price', 'total') and 'ндс' in text and 'с ндс' not in text:
+            continue
+        if text in exact:
+            matches[field] = 0
+        elif text.startswith(prefixes):
+            matches[field] = 1
+    return matches
+
+
+def find_header(row: tuple) -> Optional[Dict[str, int]]:
+    """
+    Колонки таблицы позиций, если строка - её шапка: поле -> индекс колонки.
+    Нужны наименование, сумма и цена или количество; при нескольких подходящих
+    колонках ("Кол-во ст/п" и "Количество") берётся точное название, затем левая.
+    """
+    best: Dict[str, tuple] = {}
+    for index, value in enumerate(row):
+        if not isinstance(value, str) or not value.strip():
+            continue
+        for field, rank in _match_header(_normalize_header(value)).items():
+            if field not in best or rank < best[field][0]:
+                best[field] = (rank, index)
+
+    columns = {field: index for field, (rank, index) in best.items()}
+    if 'name' in columns and 'total' in columns and ('price' in columns or 'quantity' in columns):
+        return columns
+    return None
+
+
+def _is_totals_row(row: tuple) -> bool:
+    for value in row:
+        if isinstance(value, str) and value.strip().lower().startswith(TOTALS_ROW_LABELS):
+            return True
+    return False
+
+
+def _to_number(value: Any) -> Optional[float]:
+    """Число из ячейки: 2.0, 2780, '1 234,50', '5 560.00' -> float, иначе None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace('\xa0', '').replace(' ', '').replace(',', '.')
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _to_text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _unit_column(columns: Dict[str, int], first_row: tuple) -> Optional[int]:
+    """
+    Без колонки "Ед." единица обычно стоит в объединённой ячейке "Количество"
+    (26 | м): первая непустая колонка между количеством и следующей колонкой шапки
+    """
+    if 'unit' in columns:
+        return columns['unit']
+    if 'quantity' not in columns:
+        return None
+    start = columns['quantity'] + 1
+    following = [index for index in columns.values() if index >= start]
+    end = min(following) if following else len(first_row)
+    for index in range(start, min(end, len(first_row))):
+        if isinstance(first_row[index], str) and first_row[index].strip():
+            return index
+    return None
+
+
+def _ends_table(name: Any, get_row) -> bool:
+    """
+    Строка итогов: "Итого"/"Всего" в колонке наименования или пустое наименование
+    и подпись итогов в другой колонке (get_row вызывается только для таких строк)
+    """
+    text = name.strip().lower() if isinstance(name, str) else _to_text(name)
+    if text:
+        return text.startswith(('итого', 'всего'))
+    return _is_totals_row(get_row())
+
+
+def items_from_columns(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Позиции из колонок таблицы (поле -> значения по строкам до итогов).
+    Строки без наименования или без суммы и цены (подзаголовки, пустые) пропускаются.
+    """
+    count = len(columns['name'])
+    empty = [None] * count
+    items = []
+    for position, name, quantity, unit, price, total in zip(
+            columns.get('position', empty), columns['name'], columns.get('quantity', empty),
+            columns.get('unit', empty), columns.get('price', empty), columns.get('total', empty)):
+        name = _to_text(name)
+        total = _to_number(total)
+        price = _to_number(price)
+        if not name or (total is None and price is None):
+            continue
+        number = _to_number(position)
+        items.append({
+            "position": int(number) if number is not None else len(items) + 1,
+            "name": name,
+            "quantity": _to_number(quantity),
+            "unit": _to_text(unit) or None,
+            "price": price,
+            "total": total,
+        })
+    return items
+
+
+def _pad(row: tuple, width: int) -> tuple:
+    return row if len(row) >= width else tuple(row) + (None,) * (width - len(row))
+
+
+# Ячейка .xlsx со значением; пустые оформленные ячейки <c r="C13" s="10"/> (в выгрузках 1С
+# их ~50 на строку) не совпадают уже на "/" - в атрибутах ячейки косой черты не бывает
+_RE_XLSX_CELL = re.compile(r'<c r="([A-Z]+)(\d+)"([^>/]*)>(.*?)</c>', re.S)
+_RE_XLSX_TEXT = re.compile(r'<t[^>]*>(.*?)</t>', re.S)
+# Фонетические подсказки в тексте ячейки - openpyxl их в значение не включает
+_RE_XLSX_PHONETIC = re.compile(r'<rPh\b.*?</rPh>', re.S)
+
+# Версии openpyxl, на которых быстрый разбор сверен с iter_rows (tests/test_excel_grid.py):
+# он читает XML листа через внутренние атрибуты книги, на других версиях - обычный iter_rows
+FAST_XLSX_OPENPYXL_VERSIONS = ('3.0', '3.1')
+
+_column_indexes: Dict[str, int] = {}
+
+
+def _column_index(letters: str) -> int:
+    """'A' -> 0, 'AC' -> 28"""
+    if letters not in _column_indexes:
+        index = 0
+        for letter in letters:
+            index = index * 26 + ord(letter) - 64
+        _column_indexes[letters] = index - 1
+    return _column_indexes[letters]
+
+
+def _between(text: str, start: str, end: str) -> Optional[str]:
+    begin = text.find(start)
+    if begin < 0:
+        return None
+    begin += len(start)
+    return text[begin:text.find(end, begin)]
+
+
+def _xlsx_cell_value(attrs: str, inner: str, shared_strings: list) -> Any:
+    """Значение ячейки как у openpyxl values_only: str, int, float, bool или None (даты - числом)"""
+    if 't="inlineStr"' in attrs:
+        return unescape(''.join(_RE_XLSX_TEXT.findall(_RE_XLSX_PHONETIC.sub('', inner))))
+    value = _between(inner, '<v>', '</v>')
+    if value is None or 't="e"' in attrs:
+        return None
+    if 't="s"' in attrs:
+        return shared_strings[int(value)]
+    if 't="str"' in attrs:
+        return unescape(value)
+    if 't="b"' in attrs:
+        return value == '1'
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def iter_xlsx_rows(xml: str, shared_strings: list):
+    """
+    Строки листа (кортежи значений, как sheet.iter_rows(values_only=True)) одним проходом
+    регулярного выражения по XML листа: разбираются только ячейки со значениями.
+    На выгрузках 1С с оформленными пустыми ячейками в разы быстрее разбора openpyxl.
+    """
+    row_number, cells = 1, {}
+    for match in _RE_XLSX_CELL.finditer(xml):
+        number = int(match.group(2))
+        if number != row_number:
+            if cells:
+                row = [None] * (max(cells) + 1)
+                for index, value in cells.items():
+                    row[index] = value
+                yield tuple(row)
+                row_number += 1
+            # Строки без значений - пустые кортежи, чтобы номер строки совпадал с openpyxl
+            for _ in range(row_number, number):
+                yield ()
+            row_number, cells = number, {}
+        cells[_column_index(match.group(1))] = _xlsx_cell_value(match.group(3), match.group(4), shared_strings)
+    if cells:
+        row = [None] * (max(cells) + 1)
+        for index, value in cells.items():
+            row[index] = value
+        yield tuple(row)
+
+
+def _fast_xlsx_supported() -> bool:
+    import openpyxl
+
+    return '.'.join(openpyxl.__version__.split('.')[:2]) in FAST_XLSX_OPENPYXL_VERSIONS
+
+
+def _sheet_rows(workbook, sheet) -> List[tuple]:
+    """
+    Строки листа. Быстрый разбор XML листа (XML читается в память целиком); обычный
+    iter_rows - на непроверенной версии openpyxl, если её внутренности другие, если
+    теги ячеек с префиксом пространства имён (<x:c>), хотя бы одна ячейка без адреса
+    r="A1", есть ячейки-даты t="d" (openpyxl отдаёт их datetime) или значение ячейки
+    не разобралось. Строки собираются сразу, чтобы ошибка разбора не всплыла у вызывающего.
+    """
+    if not _fast_xlsx_supported():
+        return list(sheet.iter_rows(values_only=True))
+    try:
+        xml = workbook._archive.read(sheet._worksheet_path).decode('utf-8')
+        shared_strings = sheet._shared_strings
+    except (AttributeError, KeyError):
+        return list(sheet.iter_rows(values_only=True))
+    addressed = xml.count('<c r="')
+    if not addressed or addressed != xml.count('<c ') + xml.count('<c>') or 't="d"' in xml:
+        return list(sheet.iter_rows(values_only=True))
+    try:
+        return list(iter_xlsx_rows(xml, shared_strings))
+    except (ValueError, IndexError):
+        return list(sheet.iter_rows(values_only=True))
+
+
+def _xlsx_sheet_items(rows: List[tuple]) -> tuple:
+    """
+    Строки листа до итогов, затем колонки транспонированием.
+    Возвращает (позиции, индекс строки итогов; 0 - таблицы нет).
+    """
+    columns = None
+    for header_index, row in enumerate(rows[:MAX_HEADER_ROW]):
+        columns = find_header(row)
+        if columns:
+            break
+    if not columns:
+        return [], 0
+
+    width = max(columns.values()) + 1
+    name_column = columns['name']
+    table = []
+    end = len(rows)
+    for index in range(header_index + 1, len(rows)):
+        row = _pad(rows[index], width)
+        if not table and not any(row):
+            continue
+        if _ends_table(row[name_column], lambda: row):
+            end = index
+            break
+        table.append(row)
+    if not table:
+        return [], 0
+
+    unit_column = _unit_column(columns, _first_item_row(table, name_column))
+    if unit_column is not None:
+        columns['unit'] = unit_column
+        width = max(width, unit_column + 1)
+        table = [_pad(row, width) for row in table]
+
+    grid = list(zip(*table))
+    return items_from_columns({field: grid[index] for field, index in columns.items()}), end
+
+
+def _xls_sheet_items(sheet) -> tuple:
+    """
+    Лист xlrd: шапка построчно, таблица - col_values по колонкам до строки итогов.
+    Возвращает (позиции, номер строки итогов; 0 - таблицы нет).
+    """
+    columns = None
+    header_row = 0
+    for header_row in range(min(sheet.nrows, MAX_HEADER_ROW)):
+        columns = find_header(sheet.row_values(header_row))
+        if columns:
+            break
+    if not columns:
+        return [], 0
+
+    start = header_row + 1
+    name_values = sheet.col_values(columns['name'], start) if columns['name'] < sheet.ncols else []
+    end = start
+    for offset, name in enumerate(name_values):
+        if _ends_table(name, lambda: sheet.row_values(start + offset)):
+            break
+        end = start + offset + 1
+    if end == start:
+        return [], 0
+
+    first_row = sheet.row_values(start + _first_item_offset(name_values[:end - start]))
+    unit_column = _unit_column(columns, first_row)
+    if unit_column is not None:
+        columns['unit'] = unit_column
+
+    return items_from_columns({
+        field: sheet.col_values(index, start, end) if index < sheet.ncols else [None] * (end - start)
+        for field, index in columns.items()
+    }), end
+
+
+def _first_item_offset(names: List[Any]) -> int:
+    for offset, name in enumerate(names):
+        if _to_text(name):
+            return offset
+    return 0
+
+
+def _first_item_row(table: List[tuple], name_column: int) -> tuple:
+    return table[_first_item_offset([row[name_column] for row in table])]
+
+
+def iter_sheet_tables(file_path: str):
+    """
+    Листы книги по одному: (позиции таблицы, строки от итогов до конца листа).
+    Если таблицы позиций на листе нет - (пустой список, все строки листа).
+    """
+    if file_path.lower().endswith(('.xlsx', '.xlsm')):
+        import openpyxl
+        import warnings
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                sheet.reset_dimensions()
+                rows = _sheet_rows(workbook, sheet)
+                items, end = _xlsx_sheet_items(rows)
+                yield items, rows[end:]
+        finally:
+            workbook.close()
+    else:
+        from office_to_text import iter_xls_sheets
+
+        for _, sheet in iter_xls_sheets(file_path, ragged_rows=False):
+            items, end = _xls_sheet_items(sheet)
+            yield items, [sheet.row_values(row) for row in range(end, sheet.nrows)]
+
+
+def extract_excel_items(file_path: str) -> List[Dict[str, Any]]:
+    """Позиции всех листов книги, у которых найдена шапка таблицы"""
+    items = []
+    for sheet_items, _ in iter_sheet_tables(file_path):
+        items.extend(sheet_items)
+    return items
+
+
+def _normalize_label(value: str) -> str:
+    return ' '.join(value.lower().split()).strip(' :')
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _label_value(rows: List[tuple], row_index: int, column: int) -> Optional[float]:
+    """Первое число правее подписи в той же строке, иначе число под подписью"""
+    for value in rows[row_index][column + 1:]:
+        if _is_number(value):
+            return float(value)
+    below = rows[row_index + 1] if row_index + 1 < len(rows) else ()
+    if column < len(below) and _is_number(below[column]):
+        return float(below[column])
+    return None
+
+
+def _find_label_amount(labels: List[tuple], rows: List[tuple], candidates: tuple, total: bool) -> Optional[tuple]:
+    """(текст подписи, сумма) по первой подписи из candidates, у которой нашлось число"""
+    for label in candidates:
+        for text, row_index, column in labels:
+            # "Итого НДС" - не итог к оплате
+            if not text.startswith(label) or (total and 'ндс' in text and 'с ндс' not in text):
+                continue
+            amount = _label_value(rows, row_index, column)
+            if amount is not None:
+                return text, amount
+    return None
+
+
+def find_amounts(rows: List[tuple]) -> Dict[str, Any]:
+    """
+    Итог и НДС по ячейкам-подписям: число правее в той же строке или под подписью.
+    Подписи перебираются в порядке приоритета (как в pdf_layout), внутри подписи -
+    в порядке листа. В ответе только найденное: total_amount, vat_amount, vat_rate.
+    """
+    labels = [(_normalize_label(value), row_index, column)
+              for row_index, row in enumerate(rows)
+              for column, value in enumerate(row)
+              if isinstance(value, str) and value.strip()]
+
+    fields: Dict[str, Any] = {}
+    total = _find_label_amount(labels, rows, TOTAL_CELL_LABELS, total=True)
+    if total:
+        fields["total_amount"] = total[1]
+    vat = _find_label_amount(labels, rows, VAT_CELL_LABELS, total=False)
+    if vat:
+        rate = _RE_RATE.search(vat[0])
+        fields["vat_amount"] = vat[1]
+        fields["vat_rate"] = float(rate.group(1)) if rate else None
+    return fields
+
+
+def extract_excel_fields(file_path: str) -> Dict[str, Any]:
+    """
+    Поля счёта из ячеек книги для UltimateInvoiceParser.parse_invoice(resolved=...).
+    В ответе только найденное: items, total_amount, vat_amount (+ vat_rate).
+    Итог и НДС ищутся ниже таблицы позиций (или по всему листу без таблицы);
+    с нескольких листов берётся первое найденное значение.
+    """
+    fields: Dict[str, Any] = {}
+    items = []
+    for sheet_items, footer in iter_sheet_tables(file_path):
+        items.extend(sheet_items)
+        for field, value in find_amounts(footer).items():
+            fields.setdefault(field, value)
+    if items:
+        fields["items"] = items
+    return fields
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(json.dumps({"success": False, "error": "Usage: excel_grid.py <file.xlsx|file.xls>"}, ensure_ascii=False))
+        sys.exit(1)
+
+    try:
+        result = {"success": True, **extract_excel_fields(sys.argv[1])}
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Долгоживущий Python-воркер для распознавания счетов.
+
+Запускается один раз (из Node.js) и обрабатывает запросы в формате NDJSON:
+одна JSON-строка запроса на stdin -> одна JSON-строка ответа на stdout.
+PyMuPDF, openpyxl, xlrd и парсер импортируются при старте, поэтому запросы
+не платят за запуск интерпретатора и импорт библиотек.
+
+Запрос:  {"id": "42", "op": "extract_pdf_text", "path": "/tmp/a.pdf", "min_chars": 50}
+Ответ:   {"id": "42", "ok": true, "result": {...}}
+Ошибка:  {"id": "42", "ok": false, "error": "..."}
+
+Операции:
+  extract_pdf_text    path, min_chars=50,  -> pdf_extract_text.extract_text_from_pdf
+                      lazy, max_pages,        (lazy - до нахождения полей счёта,
+                      layout                   layout - layout_fields по координатам слов)
+  extract_pdf_hybrid  path, dpi=200,       -> pdf_extract_text.extract_pdf_hybrid
+                      output_dir=None,        (текст или OCR-рендер по каждой странице)
+                      lazy, max_pages, layout,
+                      colorspace, format,
+                      quality, crop, ocr_cache
+  render_pdf          path, dpi=200,       -> pdf_to_png.convert_pdf_to_images_pymupdf
+                      output_dir=None,        (с output_dir - файлы картинок вместо base64;
+                      colorspace, format,      colorspace rgb|gray|bw, format png|jpeg|webp,
+                      quality, crop,           crop - обрезка белых полей, см. page_encoding;
+                      ocr_cache=false          ocr_cache - страницы из кэша OCR без картинки)
+  page_ocr_store      page_hash, text      -> result_cache.put_page_ocr
+                                              (текст OCR страницы по её отпечатку: повторная
+                                               страница придёт из рендера с ocr_text)
+  office_to_text      path                 -> office_to_text.convert_office_file
+  excel_fields        path                 -> excel_grid.extract_excel_fields
+                                              (позиции, итог и НДС из ячеек Excel - для parse resolved)
+  parse               text | file,         -> UltimateInvoiceParser.parse_invoice
+                      timings, resolved       (timings - _meta.timings по извлекателям,
+                                               resolved - готовые поля, например layout_fields)
+  parse_stream        path | text          -> UltimateInvoiceParser.parse_stream
+                                              (PDF по страницам, Excel по листам - до нахождения полей)
+  ping                                     -> {"pong": true}
+  cache_stats                              -> счётчики кэша результатов (result_cache)
+
+Текст PDF, Excel/Word и результат парсинга кэшируются по SHA-256 содержимого
+(python-scripts/result_cache.py), поэтому повторная загрузка того же счёта
+отвечается из кэша.
+
+Ответы несут id запроса, поэтому клиент может отправлять запросы, не дожидаясь
+ответов на предыдущие. Всё, что библиотеки печатают в stdout, перенаправляется
+в stderr, чтобы не ломать протокол.
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import importlib
+from contextlib import redirect_stdout
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+for _path in (SCRIPTS_DIR, PROJECT_ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# Библиотеки, которые office_to_text импортирует лениво - в воркере грузим их заранее
+PRELOAD_MODULES = ['openpyxl', 'xlrd', 'docx']
+
+# Протокольный поток: только ответы воркера
+_protocol_out = None
+
+
+def load_handlers():
+    """Импортирует модули пайплайна и возвращает таблицу операций"""
+    with redirect_stdout(sys.stderr):
+        from pdf_to_png import convert_pdf_to_images_pymupdf, page_encoding, DEFAULT_QUALITY
+        from ultimate_invoice_parser import UltimateInvoiceParser, iter_text_chunks
+        from pdf_extract_text import iter_pdf_chunks
+        from office_to_text import iter_excel_chunks
+        from result_cache import (cached_extract_text_from_pdf, cached_extract_pdf_hybrid,
+                                  cached_convert_office_file, cached_excel_fields, cached_parse_invoice,
+                                  get_cache, put_page_ocr)
+
+        for module_name in PRELOAD_MODULES:
+            try:
+                importlib.import_module(module_name)
+            except ImportError:
+                pass
+
+    invoice_parser = UltimateInvoiceParser(debug=False)
+
+    def lazy_options(request):
+        """lazy=true - читать страницы, пока не найдены все поля счёта (с НДС и ИНН), max_pages - лимит страниц"""
+        max_pages = request.get('max_pages')
+        return {
+            "max_pages": int(max_pages) if max_pages else None,
+            "parser": invoice_parser if request.get('lazy') else None,
+            "layout": bool(request.get('layout'))
+        }
+
+    def encoding_options(request):
+        """Цвет, формат и обрезка полей отрендеренных страниц (по умолчанию PNG RGB)"""
+        return page_encoding(request.get('colorspace', 'rgb'), request.get('format', 'png'),
+                             request.get('quality', DEFAULT_QUALITY), request.get('crop', False))
+
+    def op_extract_pdf_text(request):
+        return cached_extract_text_from_pdf(request['path'], int(request.get('min_chars', 50)),
+                                            **lazy_options(request))
+
+    def op_extract_pdf_hybrid(request):
+        return cached_extract_pdf_hybrid(request['path'], int(request.get('dpi', 200)),
+                                         request.get('output_dir'), encoding=encoding_options(request),
+                                         ocr_cache=bool(request.get('ocr_cache')), **lazy_options(request))
+
+    def op_render_pdf(request):
+        return convert_pdf_to_images_pymupdf(request['path'], int(request.get('dpi', 200)),
+                                             request.get('output_dir'), bool(request.get('ocr_cache')),
+                                             encoding=encoding_options(request))
+
+    def op_page_ocr_store(request):
+        return {"stored": put_page_ocr(request['page_hash'], request.get('text') or '')}
+
+    def op_office_to_text(request):
+        return cached_convert_office_file(request['path'])
+
+    def op_excel_fields(request):
+        return cached_excel_fields(request['path'])
+
+    def op_parse(request):
+        if 'text' in request:
+            text = request['text']
+        else:
+            with open(request['file'], 'r', encoding='utf-8') as f:
+                text = f.read()
+        resolved = request.get('resolved') or None
+        if request.get('timings'):
+            # Замеры нужны с текущего прогона, поэтому мимо кэша
+            return invoice_parser.parse_invoice(text, timings=True, resolved=resolved)
+        return cached_parse_invoice(invoice_parser, text, resolved)
+
+    def op_parse_stream(request):
+        if 'text' in request:
+            chunks = iter_text_chunks(request['text'])
+        elif request['path'].lower().endswith('.pdf'):
+            chunks = iter_pdf_chunks(request['path'])
+        elif request['path'].lower().endswith(('.xlsx', '.xlsm', '.xls')):
+            chunks = iter_excel_chunks(request['path'])
+        else:
+            with open(request['path'], 'r', encoding='utf-8') as f:
+                chunks = iter_text_chunks(f.read())
+        return invoice_parser.parse_stream(chunks)
+
+    def op_ping(request):
+        return {"pong": True, "pid": os.getpid()}
+
+    def op_cache_stats(request):
+        cache = get_cache()
+        return cache.stats() if cache else {"enabled": False}
+
+    return {
+        'extract_pdf_text': op_extract_pdf_text,
+        'extract_pdf_hybrid': op_extract_pdf_hybrid,
+        'render_pdf': op_render_pdf,
+        'page_ocr_store': op_page_ocr_store,
+        'office_to_text': op_office_to_text,
+        'excel_fields': op_excel_fields,
+        'parse': op_parse,
+        'parse_stream': op_parse_stream,
+        'ping': op_ping,
+        'cache_stats': op_cache_stats,
+    }
+
+
+def handle_line(line, handlers):
+    """Обрабатывает одну строку запроса и возвращает ответ"""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": None, "ok": False, "error": f"Некорректный JSON запроса: {e}"}
+
+    if not isinstance(request, dict):
+        return {"id": None, "ok": False, "error": "Запрос должен быть JSON-объектом"}
+
+    request_id = request.get('id')
+    op = request.get('op')
+    handler = handlers.get(op)
+    if handler is None:
+        return {"id": request_id, "ok": False, "error": f"Неизвестная операция: {op}"}
+
+    started = time.perf_counter()
+    try:
+        result = handler(request)
+    except KeyError as e:
+        return {"id": request_id, "ok": False, "error": f"Не указан параметр {e} для операции {op}"}
+    except Exception as e:
+        return {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    return {
+        "id": request_id,
+        "ok": True,
+        "result": result,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+def write_response(response):
+    _protocol_out.write(json.dumps(response, ensure_ascii=False) + '\n')
+    _protocol_out.flush()
+
+
+def main():
+    global _protocol_out
+
+    # stdout принадлежит протоколу; любые print() библиотек и отладки уходят в stderr
+    _protocol_out = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='\n')
+    sys.stdout = sys.stderr
+
+    handlers = load_handlers()
+    write_response({"id": None, "ok": True, "result": {"ready": True, "ops": sorted(handlers)}})
+
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        write_response(handle_line(line, handlers))
+
+
+if __name__ == '__main__':
+    main()
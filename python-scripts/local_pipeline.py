@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный пайплайн распознавания счетов без HTTP и Next.js сервера.
+
+Повторяет шаги /api/smart-invoice для файлов на диске:
+  PDF            -> текстовый слой (pdf_extract_text)
+  Excel / Word   -> текст (office_to_text), для Excel - позиции, итог и НДС из ячеек (excel_grid)
+  затем          -> UltimateInvoiceParser
+
+Результаты этапов берутся из кэша result_cache, если файл уже обрабатывался.
+
+Сканы и изображения требуют Google Vision OCR, поэтому локально не распознаются
+и возвращаются со статусом needs_ocr.
+
+Для пакетной обработки файлы раздаются по ProcessPoolExecutor: каждый процесс
+один раз импортирует PyMuPDF/openpyxl/xlrd и создаёт парсер (init_worker),
+дальше файлы обрабатываются без повторных импортов.
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+for _path in (SCRIPTS_DIR, PROJECT_ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+from result_cache import cached_excel_fields, cached_extract_text_from_pdf, cached_office_text, cached_parse_invoice
+
+PDF_EXTENSIONS = {'.pdf'}
+EXCEL_EXTENSIONS = {'.xlsx', '.xls', '.xlsm'}
+WORD_EXTENSIONS = {'.docx', '.doc'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+# Библиотеки, которые модули пайплайна импортируют лениво - в процессах пула грузим заранее
+PRELOAD_MODULES = ['fitz', 'openpyxl', 'xlrd', 'docx']
+
+# Лимит страниц PDF (None - без лимита, чтение всё равно останавливается на найденных полях)
+MAX_PDF_PAGES = None
+
+# Парсер процесса пула (создаётся в init_worker)
+_parser = None
+
+
+def init_worker():
+    """Инициализатор процесса пула: прогревает тяжёлые импорты и создаёт парсер"""
+    global _parser
+    import importlib
+
+    with redirect_stdout(sys.stderr):
+        for module_name in PRELOAD_MODULES:
+            try:
+                importlib.import_module(module_name)
+            except ImportError:
+                pass
+
+        from ultimate_invoice_parser import UltimateInvoiceParser
+        _parser = UltimateInvoiceParser(debug=False)
+
+
+def _get_parser():
+    if _parser is None:
+        init_worker()
+    return _parser
+
+
+def extract_text(file_path: str) -> Dict[str, Any]:
+    """
+    Извлекает текст из файла в зависимости от формата.
+    Возвращает {"text": ..., "method": ...} или {"error": ..., "needs_ocr": bool}.
+    Для PDF с текстовым слоем в "resolved" - поля, найденные по координатам слов,
+    для Excel - поля из ячеек (позиции, итог, НДС).
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+
+    if extension in PDF_EXTENSIONS:
+        # Страницы читаются, пока не найдены все поля счёта с НДС и ИНН (как в /api/smart-invoice)
+        result = cached_extract_text_from_pdf(file_path, max_pages=MAX_PDF_PAGES, parser=_get_parser(),
+                                              layout=True)
+        if not result.get('success'):
+            return {"error": result.get('error', 'Ошибка чтения PDF'), "needs_ocr": True}
+        if result.get('needs_ocr'):
+            return {"error": f"Нужен OCR: {result.get('reason', 'нет текстового слоя')}", "needs_ocr": True}
+        return {"text": result['text'], "method": result.get('method', 'pymupdf_text'),
+                "resolved": result.get('layout_fields') or None}
+
+    if extension in EXCEL_EXTENSIONS or extension in WORD_EXTENSIONS:
+        text = cached_office_text(file_path)
+        if text.startswith("Ошибка"):
+            return {"error": text, "needs_ocr": False}
+        return {"text": text, "method": extension.lstrip('.'), "resolved": _excel_fields(file_path, extension)}
+
+    if extension in IMAGE_EXTENSIONS:
+        return {"error": "Нужен OCR: изображения распознаются только через API (Google Vision)", "needs_ocr": True}
+
+    return {"error": f"Неподдерживаемый тип файла: {extension}", "needs_ocr": False}
+
+
+def _excel_fields(file_path: str, extension: str) -> Optional[Dict[str, Any]]:
+    """Поля из ячеек Excel; ошибка разбора сетки не мешает разбору текста"""
+    if extension not in EXCEL_EXTENSIONS:
+        return None
+    try:
+        return cached_excel_fields(file_path) or None
+    except Exception as e:
+        print(f"⚠️ Ячейки Excel не прочитаны ({file_path}): {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+
+def to_parsed_fields(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Приводит результат парсера к плоским полям, как parseInvoiceWithPython в route.ts
+    (включая расчёт НДС по ставке, если сумма НДС не найдена)
+    """
+    invoice = parsed.get('invoice') or {}
+    contractor = parsed.get('contractor') or {}
+
+    total_amount = float(invoice['total_amount']) if invoice.get('total_amount') else None
+    vat_amount = float(invoice['vat_amount']) if invoice.get('vat_amount') else None
+    vat_rate = float(invoice['vat_rate']) if invoice.get('vat_rate') else None
+
+    if not vat_amount and vat_rate and total_amount:
+        # НДС = Сумма * Ставка / (100 + Ставка)
+        vat_amount = round(total_amount * vat_rate / (100 + vat_rate), 2)
+
+    return {
+        'invoice_number': invoice.get('number') or None,
+        'invoice_date': invoice.get('date') or None,
+        'total_amount': total_amount,
+        'vat_amount': vat_amount,
+        'supplier_name': contractor.get('name') or None,
+        'supplier_inn': contractor.get('inn') or None,
+    }
+
+
+def process_file(file_path: str) -> Dict[str, Any]:
+    """
+    Обрабатывает один файл: извлечение текста + парсинг.
+    Никогда не бросает исключений - ошибки возвращаются в поле error.
+    """
+    try:
+        extracted = extract_text(file_path)
+        if 'error' in extracted:
+            return {
+                "success": False,
+                "file_path": file_path,
+                "needs_ocr": extracted['needs_ocr'],
+                "error": extracted['error']
+            }
+
+        if not extracted['text'].strip():
+            return {"success": False, "file_path": file_path, "needs_ocr": False,
+                    "error": "Не удалось распознать текст"}
+
+        with redirect_stdout(sys.stderr):
+            parsed = cached_parse_invoice(_get_parser(), extracted['text'], extracted.get('resolved'))
+
+        return {
+            "success": True,
+            "file_path": file_path,
+            "method": extracted['method'],
+            "text_length": len(extracted['text']),
+            "invoice": parsed.get('invoice') or {},
+            "contractor": parsed.get('contractor') or {},
+            "items": parsed.get('items') or [],
+            "parsed": to_parsed_fields(parsed)
+        }
+    except Exception as e:
+        return {"success": False, "file_path": file_path, "needs_ocr": False,
+                "error": f"{type(e).__name__}: {e}"}
+
+
+def process_files(file_paths: Iterable[str],
+                  max_workers: Optional[int] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Обрабатывает файлы в пуле процессов (по умолчанию - по числу ядер).
+    Отдаёт пары (путь, результат) по мере готовности, а не в исходном порядке.
+    """
+    file_paths = [str(path) for path in file_paths]
+    if not file_paths:
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_workers = min(max_workers, len(file_paths))
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+        futures = {executor.submit(process_file, path): path for path in file_paths}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
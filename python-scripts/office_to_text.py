@@ -4,72 +4,124 @@
 import sys
 import json
 import os
-
-# Принудительно устанавливаем UTF-8 кодировку для stdout
 import io
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-def extract_text_from_excel(file_path):
-    """Извлекает текст из Excel файлов (.xlsx, .xls)"""
+SUPPORTED_EXTENSIONS = ['.xlsx', '.xlsm', '.xls', '.docx', '.doc']
+
+def iter_xlsx_lines(file_path):
+    """
+    Построчно отдаёт текст .xlsx/.xlsm (формат "=== ЛИСТ: ... ===" + строки ячеек через пробел).
+    openpyxl в режиме read_only читает лист потоком: DataFrame не строится,
+    память не растёт с числом строк.
+    """
+    import openpyxl
+    import warnings
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    
     try:
-        import pandas as pd
-        import warnings
-        
-        # Подавляем warning сообщения от xlrd
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            
-            # Читаем все листы
-            if file_path.lower().endswith('.xlsx'):
-                sheets = pd.read_excel(file_path, sheet_name=None, engine='openpyxl')
-            else:  # .xls
-                # Для .xls файлов подавляем все выводы xlrd и пытаемся разные кодировки
-                import os
-                from contextlib import redirect_stdout, redirect_stderr
-                with open(os.devnull, 'w') as devnull:
-                    with redirect_stdout(devnull), redirect_stderr(devnull):
-                        try:
-                            # Пытаемся с Windows-1251 (русская кодировка)
-                            import xlrd
-                            book = xlrd.open_workbook(file_path, encoding_override='cp1251')
-                            sheets = {}
-                            for sheet_name in book.sheet_names():
-                                sheet = book.sheet_by_name(sheet_name)
-                                data = []
-                                for row_idx in range(sheet.nrows):
-                                    row_data = []
-                                    for col_idx in range(sheet.ncols):
-                                        cell_value = sheet.cell_value(row_idx, col_idx)
-                                        row_data.append(cell_value)
-                                    data.append(row_data)
-                                df = pd.DataFrame(data)
-                                sheets[sheet_name] = df
-                        except:
-                            # Если не сработало, используем стандартный способ
-                            sheets = pd.read_excel(file_path, sheet_name=None, engine='xlrd')
-        
-        all_text = []
-        
-        for sheet_name, df in sheets.items():
-            all_text.append(f"=== ЛИСТ: {sheet_name} ===")
+        for sheet in workbook.worksheets:
+            yield f"=== ЛИСТ: {sheet.title} ==="
             
-            # Конвертируем DataFrame в текст построчно
-            df_clean = df.fillna('')
-            
-            for _, row in df_clean.iterrows():
+            # Размер листа из метаданных файла бывает неверным - читаем все строки как есть
+            sheet.reset_dimensions()
+            for row in sheet.iter_rows(values_only=True):
                 row_text = []
                 for value in row:
+                    if value is None:
+                        continue
                     str_value = str(value).strip()
-                    if str_value and str_value != 'nan' and str_value != 'None':
+                    if str_value:
                         row_text.append(str_value)
                 
                 if row_text:
-                    all_text.append(' '.join(row_text))
+                    yield ' '.join(row_text)
+    finally:
+        workbook.close()
+
+# Кодировка старых .xls (BIFF5/7) без записи CODEPAGE - русская Windows
+XLS_DEFAULT_ENCODING = 'cp1251'
+
+def iter_xls_sheets(file_path, ragged_rows=True):
+    """
+    Отдаёт листы .xls по одному: (имя листа, xlrd.sheet.Sheet).
+    Листы загружаются по требованию (on_demand) и выгружаются после обработки.
+    ragged_rows=False выравнивает строки по ширине листа (нужно для col_values).
+    Файл разбирается один раз: кодировка берётся из записи CODEPAGE книги,
+    а если её нет (BIFF5/7) - используется cp1251.
+    """
+    import xlrd
+    
+    with open(os.devnull, 'w') as devnull:
+        book = xlrd.open_workbook(file_path, on_demand=True, ragged_rows=ragged_rows, logfile=devnull)
         
-        return '\n'.join(all_text)
+        try:
+            # Без CODEPAGE xlrd декодирует строки BIFF5/7 как iso-8859-1. Это обратимо,
+            # поэтому имена листов перекодируем, а ячейки листов (они ещё не загружены)
+            # сразу читаются в нужной кодировке
+            sheet_names = book.sheet_names()
+            if book.codepage is None and book.biff_version < 80:
+                book.encoding = XLS_DEFAULT_ENCODING
+                sheet_names = [name.encode('iso-8859-1').decode(XLS_DEFAULT_ENCODING, errors='replace')
+                               for name in sheet_names]
+            
+            for sheet_index, sheet_name in enumerate(sheet_names):
+                yield sheet_name, book.sheet_by_index(sheet_index)
+                book.unload_sheet(sheet_index)
+        finally:
+            book.release_resources()
+
+def iter_xls_lines(file_path):
+    """
+    Построчно отдаёт текст .xls в том же формате, что и iter_xlsx_lines.
+    Листы читаются целыми строками (row_values).
+    """
+    for sheet_name, sheet in iter_xls_sheets(file_path):
+        yield f"=== ЛИСТ: {sheet_name} ==="
+        
+        for row_idx in range(sheet.nrows):
+            row_text = []
+            for value in sheet.row_values(row_idx):
+                str_value = str(value).strip()
+                if str_value:
+                    row_text.append(str_value)
+            
+            if row_text:
+                yield ' '.join(row_text)
+
+# Сколько строк листа входит в одну часть при потоковом разборе
+EXCEL_CHUNK_LINES = 200
+
+def iter_excel_chunks(file_path, max_lines=EXCEL_CHUNK_LINES):
+    """
+    Отдаёт текст книги частями для UltimateInvoiceParser.parse_stream: каждый лист -
+    отдельная часть (большие листы - по max_lines строк). Следующие части не читаются,
+    если разбор остановился раньше.
+    """
+    lines = iter_xlsx_lines(file_path) if file_path.lower().endswith(('.xlsx', '.xlsm')) else iter_xls_lines(file_path)
+    chunk = []
+    for line in lines:
+        if chunk and (line.startswith('=== ЛИСТ:') or len(chunk) >= max_lines):
+            yield '\n'.join(chunk)
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield '\n'.join(chunk)
+
+def extract_text_from_excel(file_path):
+    """Извлекает текст из Excel файлов (.xlsx, .xlsm, .xls)"""
+    try:
+        # .xlsx/.xlsm - потоковое чтение openpyxl без pandas
+        if file_path.lower().endswith(('.xlsx', '.xlsm')):
+            return '\n'.join(iter_xlsx_lines(file_path))
+        
+        # .xls - xlrd, без pandas
+        return '\n'.join(iter_xls_lines(file_path))
         
     except ImportError:
-        return "Ошибка: Не установлена библиотека pandas или openpyxl/xlrd"
+        return "Ошибка: Не установлена библиотека openpyxl/xlrd"
     except Exception as e:
         return f"Ошибка чтения Excel файла: {str(e)}"
 
@@ -116,7 +168,48 @@ def extract_text_from_word(file_path):
     except Exception as e:
         return f"Ошибка чтения Word файла: {str(e)}"
 
+def convert_office_file(file_path):
+    """Извлекает текст из офисного файла и возвращает результат в формате JSON-ответа скрипта"""
+    if not os.path.exists(file_path):
+        return {
+            "error": f"Файл не найден: {file_path}",
+            "text": "",
+            "text_length": 0
+        }
+    
+    # Определяем тип файла
+    file_extension = os.path.splitext(file_path)[1].lower()
+    
+    if file_extension in ['.xlsx', '.xlsm', '.xls']:
+        text = extract_text_from_excel(file_path)
+    elif file_extension in ['.docx', '.doc']:
+        text = extract_text_from_word(file_path)
+    else:
+        return {
+            "error": f"Неподдерживаемый тип файла: {file_extension}. Поддерживаются: .xlsx, .xlsm, .xls, .docx, .doc",
+            "text": "",
+            "text_length": 0
+        }
+    
+    # Проверяем, нет ли ошибки в тексте
+    if text.startswith("Ошибка"):
+        return {
+            "error": text,
+            "text": "",
+            "text_length": 0
+        }
+    
+    return {
+        "text": text,
+        "text_length": len(text),
+        "file_path": file_path,
+        "file_type": file_extension
+    }
+
 def main():
+    # Принудительно устанавливаем UTF-8 кодировку для stdout
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    
     try:
         if len(sys.argv) != 2:
             result = {
@@ -128,50 +221,15 @@ def main():
             sys.exit(1)
         
         file_path = sys.argv[1]
-        
-        if not os.path.exists(file_path):
-            result = {
-                "error": f"Файл не найден: {file_path}",
-                "text": "",
-                "text_length": 0
-            }
-            print(json.dumps(result, ensure_ascii=False))
-            sys.exit(1)
-        
-        # Определяем тип файла
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension in ['.xlsx', '.xls']:
-            text = extract_text_from_excel(file_path)
-        elif file_extension in ['.docx', '.doc']:
-            text = extract_text_from_word(file_path)
-        else:
-            result = {
-                "error": f"Неподдерживаемый тип файла: {file_extension}. Поддерживаются: .xlsx, .xls, .docx, .doc",
-                "text": "",
-                "text_length": 0
-            }
-            print(json.dumps(result, ensure_ascii=False))
-            sys.exit(1)
-        
-        # Проверяем, нет ли ошибки в тексте
-        if text.startswith("Ошибка"):
-            result = {
-                "error": text,
-                "text": "",
-                "text_length": 0
-            }
-        else:
-            result = {
-                "text": text,
-                "text_length": len(text),
-                "file_path": file_path,
-                "file_type": file_extension
-            }
+        result = convert_office_file(file_path)
         
         # Выводим результат как JSON
         print(json.dumps(result, ensure_ascii=False))
         
+        # Сохраняем прежние коды выхода: файл не найден / неподдерживаемый тип
+        if not os.path.exists(file_path) or os.path.splitext(file_path)[1].lower() not in SUPPORTED_EXTENSIONS:
+            sys.exit(1)
+        
     except Exception as e:
         # В случае любой ошибки возвращаем JSON с ошибкой
         error_result = {
@@ -182,4 +240,4 @@ def main():
         print(json.dumps(error_result, ensure_ascii=False))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,8 +4,10 @@
 Быстрее и надёжнее OCR для PDF с текстовым слоем
 """
 
+import os
 import sys
 import json
+import base64
 import argparse
 
 try:
@@ -14,10 +16,56 @@ try:
 except ImportError:
     PYMUPDF_AVAILABLE = False
 
-def extract_text_from_pdf(pdf_path: str, min_chars: int = 50) -> dict:
+from pdf_layout import page_words, extract_layout_fields, extract_pdf_words
+
+PAGE_SEPARATOR = '\n\n=== СЛЕДУЮЩАЯ СТРАНИЦА ===\n\n'
+
+# Пороги постраничного решения "текстовый слой или OCR"
+MIN_PAGE_CHARS = 50
+MAX_GARBAGE_RATIO = 0.2
+
+def iter_pdf_pages(doc):
+    """Лениво отдаёт (номер страницы, текст) - текст следующей страницы не извлекается заранее"""
+    for page_num, page in enumerate(doc, 1):
+        yield page_num, page.get_text()
+
+
+def iter_pdf_chunks(pdf_path: str):
+    """Текст непустых страниц PDF по одной - части для UltimateInvoiceParser.parse_stream"""
+    doc = fitz.open(pdf_path)
+    try:
+        for _, page_text in iter_pdf_pages(doc):
+            if page_text.strip():
+                yield page_text
+    finally:
+        doc.close()
+
+
+def _page_window(doc, pages_read: int, stop_reason: str) -> dict:
+    """Сколько страниц прочитано и сколько пропущено при досрочной остановке"""
+    return {
+        "pages_total": len(doc),
+        "pages_read": pages_read,
+        "pages_skipped": len(doc) - pages_read,
+        "stop_reason": stop_reason
+    }
+
+
+def extract_text_from_pdf(pdf_path: str, min_chars: int = 50, max_pages: int = None,
+                          stop_when=None, layout: bool = False) -> dict:
     """
     Извлекает текст из PDF.
     Возвращает текст если он есть, или флаг что нужен OCR.
+
+    Ленивый режим: страницы читаются по одной; чтение прекращается, когда
+    stop_when(текст очередной страницы) вернёт True (например, парсер нашёл все
+    обязательные поля); stop_when вызывается по разу на каждую непустую страницу
+    по порядку и сам копит состояние (fields_found_check) или прочитано max_pages страниц. stop_reason в ответе -
+    "fields_found", "page_cap" или None, pages_skipped - число непрочитанных страниц.
+
+    layout=True дополнительно ищет итог, НДС и ИНН поставщика по координатам слов
+    прочитанных страниц (pdf_layout) и кладёт их в layout_fields - для
+    UltimateInvoiceParser.parse_invoice(resolved=...).
     """
     if not PYMUPDF_AVAILABLE:
         return {
@@ -28,28 +76,46 @@ def extract_text_from_pdf(pdf_path: str, min_chars: int = 50) -> dict:
     
     try:
         doc = fitz.open(pdf_path)
-        all_text = []
+        try:
+            all_text = []
+            layout_pages = []
+            pages_read = 0
+            stop_reason = None
         
-        for page_num, page in enumerate(doc):
-            page_text = page.get_text()
-            if page_text.strip():
-                all_text.append(page_text)
+            for page_num, page_text in iter_pdf_pages(doc):
+                pages_read = page_num
+                if page_text.strip():
+                    all_text.append(page_text)
+                    if layout:
+                        layout_pages.append(page_words(doc[page_num - 1]))
+                    if stop_when is not None and stop_when(page_text):
+                        stop_reason = "fields_found"
+                        break
+                if max_pages and pages_read >= max_pages:
+                    stop_reason = "page_cap"
+                    break
         
-        doc.close()
+            window = _page_window(doc, pages_read, stop_reason)
+        finally:
+            doc.close()
         
-        full_text = '\n\n=== СЛЕДУЮЩАЯ СТРАНИЦА ===\n\n'.join(all_text)
+        full_text = PAGE_SEPARATOR.join(all_text)
         char_count = len(full_text.strip())
         
         # Если текста достаточно — возвращаем его
         if char_count >= min_chars:
-            return {
+            result = {
                 "success": True,
                 "needs_ocr": False,
                 "text": full_text,
                 "char_count": char_count,
                 "page_count": len(all_text),
-                "method": "pymupdf_text"
+                "method": "pymupdf_text",
+                **window
             }
+            if layout:
+                result["layout_fields"] = extract_layout_fields(layout_pages)
+            return result
         else:
             # Текста мало или нет — нужен OCR
             return {
@@ -57,7 +123,8 @@ def extract_text_from_pdf(pdf_path: str, min_chars: int = 50) -> dict:
                 "needs_ocr": True,
                 "text": full_text if full_text.strip() else "",
                 "char_count": char_count,
-                "reason": f"Найдено только {char_count} символов (минимум {min_chars})"
+                "reason": f"Найдено только {char_count} символов (минимум {min_chars})",
+                **window
             }
             
     except Exception as e:
@@ -68,15 +135,213 @@ def extract_text_from_pdf(pdf_path: str, min_chars: int = 50) -> dict:
         }
 
 
+def _is_garbage_char(char: str) -> bool:
+    """Глиф без отображения в Unicode: U+FFFD, Private Use Area, управляющие символы"""
+    code = ord(char)
+    return (
+        code == 0xFFFD
+        or 0xE000 <= code <= 0xF8FF
+        or (code < 32 and char not in '\t\n\r')
+    )
+
+
+def analyze_page_text(page_text: str) -> dict:
+    """Число значащих символов и доля "мусорных" глифов на странице"""
+    chars = [c for c in page_text if not c.isspace()]
+    garbage = sum(1 for c in chars if _is_garbage_char(c))
+    return {
+        "char_count": len(chars),
+        "garbage_ratio": round(garbage / len(chars), 3) if chars else 0.0
+    }
+
+
+def extract_pdf_hybrid(pdf_path: str, dpi: int = 200, output_dir: str = None,
+                       min_page_chars: int = MIN_PAGE_CHARS,
+                       max_garbage_ratio: float = MAX_GARBAGE_RATIO,
+                       max_pages: int = None, stop_when=None, layout: bool = False,
+                       ocr_cache: bool = False, encoding: dict = None) -> dict:
+    """
+    Один проход по PDF: для каждой страницы решает, брать текстовый слой или OCR.
+
+    Страница идёт в OCR, если на ней меньше min_page_chars символов (и есть
+    изображения - пустые страницы без картинок не рендерятся) или доля
+    нераспознаваемых глифов больше max_garbage_ratio. Рендерятся только такие
+    страницы: картинка пишется в output_dir (или base64 в ответе, если папка не задана).
+    У страниц для OCR есть отпечаток (page_hash, phash - pdf_to_png.page_fingerprint);
+    если текст страницы уже есть в кэше OCR и вызывающий умеет принимать страницы
+    без картинки (ocr_cache=True), вместо картинки отдаётся ocr_text, попадания и промахи - в ocr_cache результата.
+    encoding - цвет, формат и обрезка полей картинок (pdf_to_png.page_encoding).
+
+    Возвращает список pages с method "text" / "ocr" / "empty" для каждой страницы,
+    text - склеенный текст страниц с текстовым слоем, ocr_pages - номера страниц для OCR.
+
+    max_pages и stop_when - как в extract_text_from_pdf (stop_when получает
+    страницы, текст которых попадает в text); непрочитанные страницы не рендерятся.
+    layout=True - layout_fields по словам страниц с текстовым слоем, как в
+    extract_text_from_pdf (страницы для OCR слов не имеют).
+    """
+    if not PYMUPDF_AVAILABLE:
+        return {
+            "success": False,
+            "needs_ocr": True,
+            "error": "PyMuPDF not installed"
+        }
+
+    try:
+        from pdf_to_png import render_page_for_ocr, page_filename, PageOcrLookup, DEFAULT_ENCODING
+
+        encoding = encoding or DEFAULT_ENCODING
+
+        doc = fitz.open(pdf_path)
+        try:
+            pages = []
+            texts = []
+            ocr_pages = []
+            layout_pages = []
+            ocr_lookup = PageOcrLookup(ocr_cache)
+
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+            pages_read = 0
+            stop_reason = None
+
+            for page_num, page in enumerate(doc, 1):
+                pages_read = page_num
+                page_text = page.get_text()
+                stats = analyze_page_text(page_text)
+                info = {"page": page_num, **stats}
+
+                is_garbled = stats["garbage_ratio"] > max_garbage_ratio
+                if stats["char_count"] >= min_page_chars and not is_garbled:
+                    info["method"] = "text"
+                    texts.append(page_text)
+                    if layout:
+                        layout_pages.append(page_words(page))
+                elif not is_garbled and not page.get_images(full=False):
+                    # Мало текста и нет картинок - сканировать нечего
+                    info["method"] = "empty"
+                    if page_text.strip():
+                        texts.append(page_text)
+                else:
+                    info["method"] = "ocr"
+                    info["reason"] = "garbage_glyphs" if is_garbled else "low_text"
+                    rendered, image_data = render_page_for_ocr(page, dpi, ocr_lookup, encoding)
+                    info.update(rendered, format=encoding["format"])
+                    if image_data is None:
+                        # Страница уже распознавалась - текст из кэша OCR
+                        pass
+                    elif output_dir:
+                        filepath = os.path.join(output_dir, page_filename(page_num, encoding["format"]))
+                        with open(filepath, 'wb') as f:
+                            f.write(image_data)
+                        info["filepath"] = filepath
+                    else:
+                        info["base64"] = base64.b64encode(image_data).decode('utf-8')
+                    ocr_pages.append(page_num)
+
+                # Текст страницы нужен клиенту, чтобы собрать документ в порядке страниц
+                if info["method"] != "ocr":
+                    info["text"] = page_text
+                pages.append(info)
+
+                in_text = info["method"] != "ocr" and page_text.strip()
+                if in_text and stop_when is not None and stop_when(page_text):
+                    stop_reason = "fields_found"
+                    break
+                if max_pages and pages_read >= max_pages:
+                    stop_reason = "page_cap"
+                    break
+
+            window = _page_window(doc, pages_read, stop_reason)
+        finally:
+            doc.close()
+
+        full_text = PAGE_SEPARATOR.join(texts)
+        result = {
+            "success": True,
+            "needs_ocr": bool(ocr_pages),
+            "text": full_text,
+            "char_count": len(full_text.strip()),
+            "page_count": len(pages),
+            "pages": pages,
+            "ocr_pages": ocr_pages,
+            "dpi": dpi,
+            "method": "hybrid",
+            "ocr_cache": ocr_lookup.summary(),
+            **window
+        }
+        if layout:
+            result["layout_fields"] = extract_layout_fields(layout_pages)
+        return result
+
+    except Exception as e:
+        return {
+            "success": False,
+            "needs_ocr": True,
+            "error": str(e)
+        }
+
+
+def fields_found_check(parser=None):
+    """
+    Условие досрочной остановки для ленивого режима: парсер счетов нашёл в
+    прочитанных страницах все поля, которые забирает /api/smart-invoice
+    (STREAM_SETTLE_FIELDS: обязательные плюс НДС и ИНН; для счёта "без НДС" -
+    без суммы НДС), - иначе НДС и ИНН со следующих страниц терялись бы.
+    Страницы разбираются потоково (InvoiceStream, как в parse_stream): каждая -
+    один раз, вместе с хвостом предыдущей, поэтому проверка после страницы не
+    зависит от числа уже прочитанных. Условие одноразовое - на один PDF.
+    """
+    if parser is None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if project_root not in sys.path:
+            sys.path.insert(0, project_root)
+        from ultimate_invoice_parser import UltimateInvoiceParser
+        parser = UltimateInvoiceParser(debug=False)
+    stream = parser.start_stream()
+
+    def stop_when(page_text: str) -> bool:
+        stream.feed(page_text if stream.chunks_read == 0 else PAGE_SEPARATOR + page_text)
+        return stream.settled(parser.STREAM_SETTLE_FIELDS)
+
+    return stop_when
+
+
 def main():
     parser = argparse.ArgumentParser(description='Extract text from PDF using PyMuPDF')
     parser.add_argument('pdf_path', help='Path to PDF file')
     parser.add_argument('--min-chars', type=int, default=50, 
                         help='Minimum characters to consider text extraction successful')
+    parser.add_argument('--hybrid', action='store_true',
+                        help='Decide text layer vs OCR per page and render only pages that need OCR')
+    parser.add_argument('--dpi', type=int, default=200, help='DPI for pages rendered in --hybrid mode')
+    parser.add_argument('--output-dir', help='Directory for PNG pages rendered in --hybrid mode')
+    parser.add_argument('--lazy', action='store_true',
+                        help='Stop reading pages once the invoice parser finds all required fields')
+    parser.add_argument('--max-pages', type=int, default=None, help='Read at most this many pages')
+    parser.add_argument('--layout', action='store_true',
+                        help='Find total, VAT and supplier INN by word coordinates (layout_fields)')
+    parser.add_argument('--words', action='store_true',
+                        help='Print compact word boxes [x0, y0, x1, y1, text] of every page instead of text')
     
     args = parser.parse_args()
     
-    result = extract_text_from_pdf(args.pdf_path, args.min_chars)
+    if args.words:
+        print(json.dumps(extract_pdf_words(args.pdf_path, args.max_pages), ensure_ascii=False))
+        return
+    
+    stop_when = None
+    if args.lazy:
+        stop_when = fields_found_check()
+    
+    if args.hybrid:
+        result = extract_pdf_hybrid(args.pdf_path, args.dpi, args.output_dir, args.min_chars,
+                                    max_pages=args.max_pages, stop_when=stop_when, layout=args.layout)
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    
+    result = extract_text_from_pdf(args.pdf_path, args.min_chars, args.max_pages, stop_when, args.layout)
     
     # Выводим JSON для парсинга в Node.js
     print(json.dumps(result, ensure_ascii=False))
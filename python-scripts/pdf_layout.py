@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск полей счёта по координатам слов PDF (PyMuPDF page.get_text("words"))
+
+Вместо разбора плоского текста регулярными выражениями значение берётся
+геометрически: число справа от метки в той же строке или под меткой.
+  Итого / Всего к оплате      -> total_amount
+  В том числе НДС / НДС       -> vat_amount (+ vat_rate из "20%" в строке метки)
+  ИНН в строке "Поставщик"    -> inn (все ИНН документа - all_inns)
+
+Слово хранится компактно: [x0, y0, x1, y1, текст] (координаты в pt, округлены до 0.1).
+Найденные поля передаются в UltimateInvoiceParser.parse_invoice(resolved=...),
+и соответствующие извлекатели по тексту не запускаются.
+"""
+
+import re
+import sys
+import json
+from typing import Any, Dict, List, Optional
+
+# Метки в порядке приоритета (как каскад паттернов парсера: "к оплате" надёжнее "итого")
+TOTAL_LABELS = [
+    ('всего', 'к', 'оплате'),
+    ('итого', 'к', 'оплате'),
+    ('итого', 'с', 'ндс'),
+    ('итого',),
+]
+VAT_LABELS = [
+    ('в', 'том', 'числе', 'ндс'),
+    ('итого', 'ндс'),
+    ('сумма', 'ндс'),
+    ('ндс',),
+]
+INN_LABEL = ('инн',)
+SUPPLIER_ROLES = ('поставщик', 'продавец', 'исполнитель')
+
+# Сумма с копейками: "2 580.00", "484 075,72" (слова "484" и "075,72" склеиваются)
+_RE_AMOUNT = re.compile(r'^(?:\d{1,3}(?: \d{3})+|\d+)[.,]\d{2}$')
+_RE_DIGIT_GROUP = re.compile(r'^\d+(?:[.,]\d{2})?$')
+_RE_RATE = re.compile(r'(\d{1,2})%')
+_RE_INN = re.compile(r'^(\d{12}|\d{10})(?:/\d{9})?$')
+_RE_LETTER = re.compile(r'[A-Za-zА-Яа-яЁё]')
+
+X0, Y0, X1, Y1, TEXT = range(5)
+
+
+def page_words(page) -> List[list]:
+    """Слова страницы в компактной форме [x0, y0, x1, y1, текст] в порядке чтения"""
+    return [[round(word[0], 1), round(word[1], 1), round(word[2], 1), round(word[3], 1), word[4]]
+            for word in page.get_text("words")]
+
+
+def extract_pdf_words(pdf_path: str, max_pages: int = None) -> dict:
+    """Слова всех страниц PDF: {"success", "pages": [{"page", "width", "height", "words"}]}"""
+    import fitz
+
+    try:
+        doc = fitz.open(pdf_path)
+        pages = []
+        for page_num, page in enumerate(doc, 1):
+            if max_pages and page_num > max_pages:
+                break
+            pages.append({
+                "page": page_num,
+                "width": round(page.rect.width, 1),
+                "height": round(page.rect.height, 1),
+                "words": page_words(page)
+            })
+        pages_total = len(doc)
+        doc.close()
+        return {"success": True, "pages_total": pages_total, "pages": pages}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def _normalize(text: str) -> str:
+    return text.lower().strip(':.,;()"«»')
+
+
+def _same_line(word: list, anchor: list) -> bool:
+    """Центр слова по вертикали в пределах половины высоты строки метки"""
+    height = anchor[Y1] - anchor[Y0]
+    return abs((word[Y0] + word[Y1]) / 2 - (anchor[Y0] + anchor[Y1]) / 2) <= height / 2
+
+
+def find_labels(words: List[list], label: tuple) -> List[list]:
+    """Рамки [x0, y0, x1, y1] всех вхождений метки (последовательность слов одной строки)"""
+    boxes = []
+    size = len(label)
+    for index in range(len(words) - size + 1):
+        first = words[index]
+        if not _normalize(first[TEXT]).startswith(label[0]):
+            continue
+        if size > 1 and _normalize(first[TEXT]) != label[0]:
+            continue
+        chunk = words[index:index + size]
+        if all(_normalize(word[TEXT]) == token for word, token in zip(chunk[1:], label[1:])) \
+                and all(_same_line(word, first) for word in chunk[1:]):
+            last = chunk[-1]
+            boxes.append([first[X0], min(w[Y0] for w in chunk), last[X1], max(w[Y1] for w in chunk)])
+    return boxes
+
+
+def _line_right_of(words: List[list], box: list) -> List[list]:
+    return sorted((word for word in words if word[X0] >= box[X1] - 1 and _same_line(word, box)),
+                  key=lambda word: word[X0])
+
+
+def _line_below(words: List[list], box: list) -> List[list]:
+    """Ближайшая строка под меткой, начиная со слова, перекрывающего метку по горизонтали"""
+    height = box[Y1] - box[Y0]
+    below = [word for word in words
+             if box[Y1] - 1 <= word[Y0] <= box[Y1] + 2.5 * height and word[X1] >= box[X0] and word[X0] <= box[X1]]
+    if not below:
+        return []
+    first = min(below, key=lambda word: (word[Y0], word[X0]))
+    return sorted((word for word in words if word[X0] >= first[X0] and _same_line(word, first)),
+                  key=lambda word: word[X0])
+
+
+def _read_amount(line: List[list]) -> tuple:
+    """
+    (сумма, ставка) из слов строки справа от метки: пропускает "(20%):" и подобное,
+    останавливается на первом слове с буквами, склеивает группы разрядов "484" "075,72"
+    """
+    rate = None
+    for index, word in enumerate(line):
+        text = word[TEXT].strip(':|')
+        if _RE_LETTER.search(text):
+            return None, rate
+        rate_match = _RE_RATE.search(text)
+        if rate_match:
+            rate = float(rate_match.group(1))
+            continue
+        if not _RE_DIGIT_GROUP.match(text):
+            continue
+
+        parts, previous = [text], word
+        for following in line[index + 1:]:
+            gap = following[X0] - previous[X1]
+            if gap > 0.6 * (word[Y1] - word[Y0]) or not _RE_DIGIT_GROUP.match(following[TEXT]):
+                break
+            parts.append(following[TEXT])
+            previous = following
+        amount = ' '.join(parts)
+        if _RE_AMOUNT.match(amount):
+            return float(amount.replace(' ', '').replace(',', '.')), rate
+        return None, rate
+    return None, rate
+
+
+def _find_amount(pages: List[List[list]], labels: List[tuple]) -> Optional[tuple]:
+    """Первая сумма по меткам в порядке приоритета, внутри метки - в порядке документа"""
+    for label in labels:
+        for words in pages:
+            for box in find_labels(words, label):
+                amount, rate = _read_amount(_line_right_of(words, box))
+                if amount is None:
+                    amount, _ = _read_amount(_line_below(words, box))
+                if amount is not None:
+                    return amount, rate
+    return None
+
+
+def _find_vat_rate(pages: List[List[list]]) -> Optional[float]:
+    """Ставка из первого "НДС 20%" документа (например, в сумме прописью)"""
+    for words in pages:
+        for box in find_labels(words, ('ндс',)):
+            line = _line_right_of(words, box)
+            rate_match = _RE_RATE.match(line[0][TEXT].strip('(')) if line else None
+            if rate_match:
+                return float(rate_match.group(1))
+    return None
+
+
+def _read_inn(line: List[list]) -> Optional[str]:
+    for word in line[:2]:
+        match = _RE_INN.match(word[TEXT].strip(':,;'))
+        if match:
+            return match.group(1)
+    return None
+
+
+def extract_layout_fields(pages: List[List[list]]) -> Dict[str, Any]:
+    """
+    Поля счёта по словам страниц (списки компактных слов, по странице на список).
+    В ответе только найденные поля: total_amount, vat_amount, vat_rate, inn, all_inns.
+    """
+    fields: Dict[str, Any] = {}
+
+    total = _find_amount(pages, TOTAL_LABELS)
+    if total:
+        fields["total_amount"] = total[0]
+
+    vat = _find_amount(pages, VAT_LABELS)
+    if vat:
+        fields["vat_amount"], fields["vat_rate"] = vat
+        if fields["vat_rate"] is None:
+            fields["vat_rate"] = _find_vat_rate(pages)
+
+    all_inns, supplier_inn = [], None
+    for words in pages:
+        for box in find_labels(words, INN_LABEL):
+            inn = _read_inn(_line_right_of(words, box)) or _read_inn(_line_below(words, box))
+            if not inn:
+                continue
+            if inn not in all_inns:
+                all_inns.append(inn)
+            # ИНН поставщика - в строке с ролью "Поставщик"/"Продавец"/"Исполнитель" левее метки
+            if supplier_inn is None and any(
+                    _normalize(word[TEXT]).startswith(SUPPLIER_ROLES) and word[X1] <= box[X0] and _same_line(word, box)
+                    for word in words):
+                supplier_inn = inn
+
+    if supplier_inn:
+        fields["inn"] = supplier_inn
+        fields["all_inns"] = all_inns
+    return fields
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(json.dumps({"success": False, "error": "Usage: pdf_layout.py <file.pdf>"}, ensure_ascii=False))
+        sys.exit(1)
+
+    result = extract_pdf_words(sys.argv[1])
+    if result["success"]:
+        result["layout_fields"] = extract_layout_fields([page["words"] for page in result["pages"]])
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
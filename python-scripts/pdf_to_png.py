@@ -2,83 +2,404 @@
 """
 Simple PDF to PNG Converter using PyMuPDF
 PDF to PNG conversion without emojis for Windows compatibility
+
+Output modes:
+  default          JSON with base64 PNG of every page
+  --output-dir     raw PNG files in the directory, JSON carries only paths and metadata
+  --frames         length-prefixed binary frames on stdout (see write_page_frames)
+  --ndjson         one JSON line per page as soon as it is rendered, then a result line
+                   (see iter_page_records) - memory stays at one page, OCR of page 1
+                   can start while the rest is rendering
+
+Every page carries a content fingerprint (page_fingerprint): page_hash - SHA-256
+of the pixmap samples, phash - perceptual hash of a thumbnail. Pages whose
+page_hash is already in the page OCR cache (result_cache, stage page_ocr) can
+come back with ocr_text instead of an image; the result reports the cache
+hits/misses in ocr_cache. The lookup is opt-in (ocr_cache=True, --ocr-cache) -
+only for callers that handle pages without an image; by default every page
+has an image (base64 or filepath).
+
+Page encoding (page_encoding) - what is sent to OCR:
+  --colorspace rgb|gray|bw    bw - 1-bit look (threshold), encoded as 8-bit gray
+  --format png|jpeg|webp      webp needs Pillow
+  --quality 1-100             for jpeg/webp
+  --crop-margins              cut white margins (a small padding is kept)
 """
 
 import sys
 import os
 import json
+import struct
 import base64
+import hashlib
 import argparse
+import importlib.util
 
 try:
     import fitz  # PyMuPDF
     PYMUPDF_AVAILABLE = True
 except ImportError:
     PYMUPDF_AVAILABLE = False
-    print("PyMuPDF not installed. Install with: pip install PyMuPDF")
+    # stdout is reserved for JSON output - the error is reported there by main()
+    print("PyMuPDF not installed. Install with: pip install PyMuPDF", file=sys.stderr)
 
-def convert_pdf_to_images_pymupdf(pdf_path, dpi=200):
-    """Convert PDF to images using PyMuPDF"""
-    if not PYMUPDF_AVAILABLE:
+# Perceptual hash grid: 9x8 cells -> 64 bit difference hash
+PHASH_COLUMNS = 9
+PHASH_ROWS = 8
+
+COLORSPACES = ('rgb', 'gray', 'bw')
+IMAGE_FORMATS = ('png', 'jpeg', 'webp')
+DEFAULT_QUALITY = 80
+
+# bw: светлее порога - белый, остальное - чёрный
+BW_THRESHOLD = 160
+# Поля: строки/столбцы светлее этого уровня считаются пустыми
+CROP_WHITE_LEVEL = 240
+# Отступ вокруг содержимого после обрезки полей, дюймы
+CROP_PADDING_INCH = 0.1
+
+_BW_TABLE = bytes(0 if level < BW_THRESHOLD else 255 for level in range(256))
+_CROP_TABLE = bytes(0 if level < CROP_WHITE_LEVEL else 255 for level in range(256))
+
+def page_encoding(colorspace='rgb', image_format='png', quality=DEFAULT_QUALITY, crop=False):
+    """Validated page encoding options: {"colorspace", "format", "quality", "crop"}"""
+    if colorspace not in COLORSPACES:
+        raise ValueError(f"Unknown colorspace {colorspace!r}, expected one of {', '.join(COLORSPACES)}")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown format {image_format!r}, expected one of {', '.join(IMAGE_FORMATS)}")
+    if image_format == 'webp' and importlib.util.find_spec('PIL') is None:
+        raise ValueError("WebP needs Pillow. Install with: pip install Pillow")
+    quality = int(quality)
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be in 1..100")
+    return {"colorspace": colorspace, "format": image_format, "quality": quality, "crop": bool(crop)}
+
+DEFAULT_ENCODING = page_encoding()
+
+def to_black_and_white(pix):
+    """Threshold a grayscale pixmap to pure black/white (still 8 bits per pixel)"""
+    return fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, pix.samples.translate(_BW_TABLE), False)
+
+def content_bbox(pix):
+    """(x0, y0, x1, y1) of everything darker than CROP_WHITE_LEVEL or None for a blank page"""
+    gray = pix if pix.n == 1 else fitz.Pixmap(fitz.csGRAY, pix)
+    width = gray.width
+    samples = gray.samples.translate(_CROP_TABLE)
+    white = b"\xff"
+    top = bottom = None
+    left, right = width, 0
+    for y in range(gray.height):
+        row = samples[y * width:(y + 1) * width]
+        content = row.lstrip(white)
+        if not content:
+            continue
+        if top is None:
+            top = y
+        bottom = y + 1
+        left = min(left, width - len(content))
+        right = max(right, len(row.rstrip(white)))
+    return None if top is None else (left, top, right, bottom)
+
+def crop_margins(pix, padding):
+    """Cut white margins keeping padding pixels around the content; blank pages stay as is"""
+    bbox = content_bbox(pix)
+    if bbox is None:
+        return pix
+    x0, y0 = max(0, bbox[0] - padding), max(0, bbox[1] - padding)
+    x1, y1 = min(pix.width, bbox[2] + padding), min(pix.height, bbox[3] + padding)
+    if (x0, y0, x1, y1) == (0, 0, pix.width, pix.height):
+        return pix
+
+    n, stride, samples = pix.n, pix.stride, pix.samples_mv
+    data = b"".join(samples[y * stride + x0 * n:y * stride + x1 * n] for y in range(y0, y1))
+    cropped = fitz.Pixmap(pix.colorspace, x1 - x0, y1 - y0, data, pix.alpha)
+    cropped.set_dpi(pix.xres, pix.yres)
+    return cropped
+
+def render_pixmap(page, dpi=200, encoding=DEFAULT_ENCODING):
+    """Render a page in the encoding colorspace, thresholded and cropped if requested"""
+    colorspace = fitz.csRGB if encoding["colorspace"] == 'rgb' else fitz.csGRAY
+    pix = page.get_pixmap(dpi=dpi, colorspace=colorspace)
+    if encoding["colorspace"] == 'bw':
+        pix = to_black_and_white(pix)
+    if encoding["crop"]:
+        pix = crop_margins(pix, round(dpi * CROP_PADDING_INCH))
+    return pix
+
+def encode_pixmap(pix, encoding=DEFAULT_ENCODING):
+    """Image bytes of the pixmap in the encoding format"""
+    if encoding["format"] == 'jpeg':
+        return pix.tobytes("jpeg", jpg_quality=encoding["quality"])
+    if encoding["format"] == 'webp':
+        return pix.pil_tobytes(format="WEBP", quality=encoding["quality"])
+    return pix.tobytes("png")
+
+def perceptual_hash(pix):
+    """
+    Difference hash (dHash) of a grayscale thumbnail, 16 hex chars.
+    Unlike page_hash it survives re-scans and re-compression: close pages
+    differ in a few bits (compare with phash_distance).
+    """
+    # Копия без альфа-канала: shrink уменьшает pixmap на месте
+    thumb = fitz.Pixmap(pix, 0)
+    steps = 0
+    while (thumb.width >> (steps + 1) >= PHASH_COLUMNS * 4
+           and thumb.height >> (steps + 1) >= PHASH_ROWS * 4):
+        steps += 1
+    if steps:
+        thumb.shrink(steps)
+    if thumb.n != 1:
+        thumb = fitz.Pixmap(fitz.csGRAY, thumb)
+
+    width, height, stride, samples = thumb.width, thumb.height, thumb.stride, thumb.samples
+    cells = []
+    for row in range(PHASH_ROWS):
+        y0 = row * height // PHASH_ROWS
+        y1 = max(y0 + 1, (row + 1) * height // PHASH_ROWS)
+        for column in range(PHASH_COLUMNS):
+            x0 = column * width // PHASH_COLUMNS
+            x1 = max(x0 + 1, (column + 1) * width // PHASH_COLUMNS)
+            total = sum(sum(samples[y * stride + x0:y * stride + x1]) for y in range(y0, y1))
+            cells.append(total / ((y1 - y0) * (x1 - x0)))
+
+    bits = 0
+    for row in range(PHASH_ROWS):
+        for column in range(PHASH_COLUMNS - 1):
+            cell = row * PHASH_COLUMNS + column
+            bits = (bits << 1) | (cells[cell] < cells[cell + 1])
+    return f"{bits:016x}"
+
+def phash_distance(first, second):
+    """Number of differing bits between two perceptual hashes (0 - same picture)"""
+    return bin(int(first, 16) ^ int(second, 16)).count("1")
+
+def page_fingerprint(pix):
+    """
+    Content fingerprint of a rendered page: {"page_hash", "phash"}.
+    page_hash is exact (same pixels at the same DPI) and keys the page OCR cache.
+    """
+    digest = hashlib.sha256(f"{pix.width}x{pix.height}x{pix.n}:".encode("ascii"))
+    digest.update(pix.samples_mv)
+    return {"page_hash": digest.hexdigest(), "phash": perceptual_hash(pix)}
+
+class PageOcrLookup:
+    """Page OCR cache lookups (result_cache.get_page_ocr) with per-document hit counters"""
+
+    def __init__(self, enabled=True):
+        self.hits = 0
+        self.misses = 0
+        self._get = None
+        if enabled:
+            try:
+                from result_cache import get_cache, get_page_ocr
+                if get_cache() is not None:
+                    self._get = get_page_ocr
+            except ImportError:
+                pass
+
+    def __call__(self, page_hash):
+        """Cached OCR text of the page or None"""
+        if self._get is None:
+            return None
+        text = self._get(page_hash)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def summary(self):
+        lookups = self.hits + self.misses
         return {
-            "success": False,
-            "error": "PyMuPDF not installed. Install with: pip install PyMuPDF"
+            "enabled": self._get is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
         }
+
+def render_page_for_ocr(page, dpi=200, ocr_lookup=None, encoding=DEFAULT_ENCODING):
+    """
+    Render one page for OCR: returns (info, image_bytes) in the encoding format.
+    info: width, height, size_kb, page_hash, phash. If ocr_lookup finds the page
+    in the OCR cache, info carries ocr_text and image_bytes is None - nothing to send to OCR.
+    """
+    pix = render_pixmap(page, dpi, encoding)
+    info = {"width": pix.width, "height": pix.height, **page_fingerprint(pix)}
+
+    ocr_text = ocr_lookup(info["page_hash"]) if ocr_lookup else None
+    if ocr_text is not None:
+        info["size_kb"] = 0
+        info["ocr_text"] = ocr_text
+        return info, None
+
+    image_data = encode_pixmap(pix, encoding)
+    info["size_kb"] = len(image_data) // 1024
+    return info, image_data
+
+def render_pages(doc, dpi=200, ocr_lookup=None, encoding=DEFAULT_ENCODING):
+    """
+    Render pages one by one: yields (page_number, info, image_bytes) - see render_page_for_ocr.
+    Only one page pixmap is alive at a time.
+    """
+    for i, page in enumerate(doc):
+        info, image_data = render_page_for_ocr(page, dpi, ocr_lookup, encoding)
+        yield i + 1, info, image_data
+        # Байты страницы отпускаем до рендера следующей
+        del info, image_data
+
+def page_filename(page_number, image_format='png'):
+    extension = 'jpg' if image_format == 'jpeg' else image_format
+    return f"page_{page_number:03d}.{extension}"
+
+def iter_page_records(pdf_path, dpi=200, output_dir=None, ocr_cache=False, encoding=DEFAULT_ENCODING):
+    """
+    Render pages lazily: yields one record per page as soon as it is rendered,
+    then a final result record.
+
+    Page record: {"type": "page", "page", "width", "height", "size_kb", "page_hash",
+    "phash", "format"} plus "filename"/"filepath" (output_dir), "base64" or, for pages
+    from the OCR cache (ocr_cache=True only), "ocr_text". Result record: {"type": "result", "success",
+    "page_count", "total_size_kb", "dpi", "encoding", "ocr_cache"} or "error".
+
+    Nothing is kept between pages, so memory stays at one page however long the PDF is.
+    """
+    if not PYMUPDF_AVAILABLE:
+        yield {"type": "result", "success": False,
+               "error": "PyMuPDF not installed. Install with: pip install PyMuPDF"}
+        return
     
+    page_count = 0
+    total_size = 0
+    ocr_lookup = PageOcrLookup(ocr_cache)
     try:
         doc = fitz.open(pdf_path)
-        images = []
-        
-        # print(f"Processing PDF: {len(doc)} pages")  # DEBUG: отключено для чистого JSON
+    except Exception as e:
+        yield {"type": "result", "success": False, "error": f"Ошибка конвертации: {str(e)}"}
+        return
+    
+    try:
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
         
-        for i, page in enumerate(doc):
-            # print(f"Converting page {i+1}...")  # DEBUG: отключено для чистого JSON
-            
-            # Создаем изображение с нужным DPI
-            pix = page.get_pixmap(dpi=dpi)
+        for page_number, info, image_data in render_pages(doc, dpi, ocr_lookup, encoding):
+            record = {"type": "page", "page": page_number, **info, "format": encoding["format"]}
             
-            # Получаем PNG данные
-            png_data = pix.tobytes("png")
+            if image_data is None:
+                # Текст страницы уже есть в кэше OCR - картинка не нужна
+                pass
+            elif output_dir:
+                # Пишем картинку как есть - без base64 и без копии в памяти
+                filename = page_filename(page_number, encoding["format"])
+                filepath = os.path.join(output_dir, filename)
+                with open(filepath, 'wb') as f:
+                    f.write(image_data)
+                record["filename"] = filename
+                record["filepath"] = filepath
+            else:
+                # Конвертируем в base64
+                record["base64"] = base64.b64encode(image_data).decode('utf-8')
             
-            # Конвертируем в base64
-            img_base64 = base64.b64encode(png_data).decode('utf-8')
-            
-            images.append({
-                "page": i + 1,
-                "base64": img_base64,
-                "width": pix.width,
-                "height": pix.height,
-                "size_kb": len(png_data) // 1024
-            })
-            
-            # print(f"Page {i+1}: {pix.width}x{pix.height}, {len(png_data)//1024} KB")  # DEBUG: отключено для чистого JSON
-        
+            del image_data
+            page_count += 1
+            total_size += record["size_kb"]
+            yield record
+            del record
+    except Exception as e:
+        yield {"type": "result", "success": False, "error": f"Ошибка конвертации: {str(e)}"}
+        return
+    finally:
+        # Закрываем и тогда, когда потребитель бросил генератор на середине
         doc.close()
+    
+    yield {"type": "result", "success": True, "page_count": page_count, "total_size_kb": total_size,
+           "dpi": dpi, "encoding": encoding, "ocr_cache": ocr_lookup.summary()}
+
+def convert_pdf_to_images_pymupdf(pdf_path, dpi=200, output_dir=None, ocr_cache=False,
+                                  encoding=DEFAULT_ENCODING):
+    """
+    Convert PDF to images using PyMuPDF.
+    With output_dir the image bytes are written straight to files and the result
+    carries only file paths and metadata instead of base64 data.
+    With ocr_cache pages already in the page OCR cache carry ocr_text and no image.
+    encoding - page_encoding(...) options (PNG RGB by default).
+    All pages are collected in one result - for long PDFs prefer iter_page_records.
+    """
+    images = []
+    for record in iter_page_records(pdf_path, dpi, output_dir, ocr_cache, encoding):
+        record_type = record.pop("type")
+        if record_type == "page":
+            images.append(record)
+            continue
         
-        total_size = sum(img["size_kb"] for img in images)
-        
-        return {
-            "success": True,
-            "page_count": len(images),
-            "images": images,
-            "total_size_kb": total_size,
-            "dpi": dpi
-        }
-        
+        if not record["success"]:
+            return record
+        result = {"success": True, "page_count": record["page_count"], "images": images,
+                  **{key: record[key] for key in ("total_size_kb", "dpi", "encoding", "ocr_cache")}}
+        if output_dir:
+            result["output_dir"] = output_dir
+        return result
+
+def write_page_ndjson(pdf_path, stream, dpi=200, output_dir=None, ocr_cache=False, encoding=DEFAULT_ENCODING):
+    """Write iter_page_records as NDJSON: one line per record, flushed right away"""
+    for record in iter_page_records(pdf_path, dpi, output_dir, ocr_cache, encoding):
+        stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        stream.flush()
+
+def write_frame(stream, header, payload=b""):
+    """Frame: uint32 BE header length, UTF-8 JSON header, uint32 BE payload length, payload"""
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    stream.write(struct.pack('>I', len(header_bytes)))
+    stream.write(header_bytes)
+    stream.write(struct.pack('>I', len(payload)))
+    stream.write(payload)
+
+def write_page_frames(pdf_path, stream, dpi=200, ocr_cache=False, encoding=DEFAULT_ENCODING):
+    """
+    Stream pages as length-prefixed binary frames.
+    One frame per page: header {"type": "page", "page", "width", "height", "size_kb",
+    "page_hash", "phash", "format"} with the raw image as payload (or, with ocr_cache=True, "ocr_text" in
+    the header and an empty payload for pages from the OCR cache), then a final frame {"type": "result", ...}
+    (success, page_count, total_size_kb, dpi, ocr_cache or error) with an empty payload.
+    """
+    if not PYMUPDF_AVAILABLE:
+        write_frame(stream, {"type": "result", "success": False,
+                             "error": "PyMuPDF not installed. Install with: pip install PyMuPDF"})
+        return
+    
+    page_count = 0
+    total_size = 0
+    ocr_lookup = PageOcrLookup(ocr_cache)
+    try:
+        doc = fitz.open(pdf_path)
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Ошибка конвертации: {str(e)}"
-        }
+        write_frame(stream, {"type": "result", "success": False, "error": f"Ошибка конвертации: {str(e)}"})
+        return
+    
+    try:
+        for page_number, info, image_data in render_pages(doc, dpi, ocr_lookup, encoding):
+            write_frame(stream, {"type": "page", "page": page_number, **info, "format": encoding["format"]},
+                        image_data or b"")
+            stream.flush()
+            page_count += 1
+            total_size += info["size_kb"]
+    except Exception as e:
+        write_frame(stream, {"type": "result", "success": False, "error": f"Ошибка конвертации: {str(e)}"})
+        return
+    finally:
+        # Закрываем и при ошибке рендера или записи в поток
+        doc.close()
+    
+    write_frame(stream, {"type": "result", "success": True, "page_count": page_count,
+                         "total_size_kb": total_size, "dpi": dpi, "ocr_cache": ocr_lookup.summary()})
 
 def save_images_to_files(images, output_dir="output"):
-    """Save images to files"""
+    """Save base64 images to files (prefer convert_pdf_to_images_pymupdf(..., output_dir=...))"""
     try:
         os.makedirs(output_dir, exist_ok=True)
         saved_files = []
         
         for img in images:
-            filename = f"page_{img['page']:03d}.png"
+            filename = page_filename(img['page'], img.get('format', 'png'))
             filepath = os.path.join(output_dir, filename)
             
             # Декодируем base64 и сохраняем
@@ -113,6 +434,17 @@ def main():
     parser.add_argument('--dpi', type=int, default=200, help='DPI for conversion (default 200)')
     parser.add_argument('--output-dir', help='Output directory for images')
     parser.add_argument('--save-files', action='store_true', help='Save images to files')
+    parser.add_argument('--frames', action='store_true',
+                        help='Write pages as length-prefixed binary frames to stdout instead of JSON')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='Write one JSON line per page as soon as it is rendered, then a result line')
+    parser.add_argument('--ocr-cache', action='store_true',
+                        help='Look pages up in the page OCR cache: cached pages carry ocr_text and no image')
+    parser.add_argument('--colorspace', choices=COLORSPACES, default='rgb', help='Page colorspace (default rgb)')
+    parser.add_argument('--format', choices=IMAGE_FORMATS, default='png', help='Image format (default png)')
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY,
+                        help=f'JPEG/WebP quality 1-100 (default {DEFAULT_QUALITY})')
+    parser.add_argument('--crop-margins', action='store_true', help='Cut white page margins')
     
     args = parser.parse_args()
     
@@ -131,19 +463,42 @@ def main():
         }))
         return
     
+    try:
+        encoding = page_encoding(args.colorspace, args.format, args.quality, args.crop_margins)
+    except ValueError as e:
+        print(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))
+        return
+    
     # print(f"Starting PDF conversion: {args.pdf_path}")  # DEBUG: отключено для чистого JSON
     # print(f"Parameters: DPI={args.dpi}")  # DEBUG: отключено для чистого JSON
     
-    # Конвертируем PDF
-    result = convert_pdf_to_images_pymupdf(args.pdf_path, args.dpi)
+    if args.frames:
+        write_page_frames(args.pdf_path, sys.stdout.buffer, args.dpi, args.ocr_cache, encoding)
+        sys.stdout.buffer.flush()
+        return
     
-    if result["success"] and args.save_files:
-        # Сохраняем файлы
+    # Конвертируем PDF (с --save-files/--output-dir картинки пишутся сразу в файлы, без base64)
+    output_dir = None
+    if args.save_files or args.output_dir:
         output_dir = args.output_dir or f"{os.path.splitext(os.path.basename(args.pdf_path))[0]}_images"
-        save_result = save_images_to_files(result["images"], output_dir)
-        result["file_save"] = save_result
     
-    print(json.dumps(result, indent=2))
+    if args.ndjson:
+        write_page_ndjson(args.pdf_path, sys.stdout, args.dpi, output_dir, args.ocr_cache, encoding)
+        return
+    
+    result = convert_pdf_to_images_pymupdf(args.pdf_path, args.dpi, output_dir, args.ocr_cache, encoding)
+    
+    if result["success"] and output_dir:
+        result["file_save"] = {
+            "success": True,
+            "saved_files": [
+                {key: img[key] for key in ("page", "filename", "filepath", "size_kb")}
+                for img in result["images"] if "filepath" in img
+            ],
+            "output_dir": output_dir
+        }
+    
+    print(json.dumps(result, ensure_ascii=False))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный кэш результатов извлечения текста и парсинга счетов.
+
+Один и тот же счёт часто приходит несколько раз (пересылка письма, повторная
+загрузка в Telegram, повторный batch-прогон). Кэш позволяет не извлекать и не
+парсить его заново.
+
+Ключ записи - SHA-256 содержимого (байты файла или текст для парсера) плюс
+отпечаток версии кода этапа (хэш исходников модуля), поэтому после правки
+парсера или экстрактора старые записи просто перестают совпадать.
+
+Хранилище - SQLite (по умолчанию .cache/invoice_results.sqlite в корне проекта).
+При превышении лимита размера вытесняются записи, к которым дольше всего
+не обращались (LRU). Счётчики попаданий/промахов ведутся по этапам.
+
+Переменные окружения:
+  INVOICE_CACHE=0            отключить кэш
+  INVOICE_CACHE_PATH         путь к файлу SQLite
+  INVOICE_CACHE_MAX_MB       лимит размера кэша в МБ (по умолчанию 256)
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Any, Callable, Dict, Optional
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+
+DEFAULT_CACHE_PATH = os.path.join(PROJECT_ROOT, '.cache', 'invoice_results.sqlite')
+DEFAULT_MAX_MB = 256
+
+# Меняется при несовместимом изменении формата записей
+CACHE_FORMAT_VERSION = 1
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_digest(text: str) -> str:
+    """SHA-256 текста (UTF-8)"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+_fingerprints: Dict[str, str] = {}
+
+
+def source_fingerprint(*source_files: str) -> str:
+    """Отпечаток версии кода: хэш исходников модулей, от которых зависит результат"""
+    cache_key = '|'.join(source_files)
+    if cache_key not in _fingerprints:
+        digest = hashlib.sha256(str(CACHE_FORMAT_VERSION).encode())
+        for source_file in source_files:
+            if source_file.endswith('.pyc'):
+                source_file = source_file[:-1]
+            with open(source_file, 'rb') as f:
+                digest.update(f.read())
+        _fingerprints[cache_key] = digest.hexdigest()[:16]
+    return _fingerprints[cache_key]
+
+
+class ResultCache:
+    """Кэш результатов в SQLite с LRU-вытеснением по размеру"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Файл кэша может использоваться несколькими процессами (пул batch-обработки)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+        # Суммарный размер записей ведут триггеры: проверка лимита после put - O(1),
+        # а не SUM по всей таблице, и счётчик общий для всех процессов
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    size INTEGER NOT NULL
+                )
+            ''')
+            self._conn.execute('INSERT OR IGNORE INTO totals (id, size) '
+                               'SELECT 0, COALESCE(SUM(size), 0) FROM entries')
+            self._conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_size_insert AFTER INSERT ON entries
+                BEGIN UPDATE totals SET size = size + NEW.size WHERE id = 0; END
+            ''')
+            self._conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_size_delete AFTER DELETE ON entries
+                BEGIN UPDATE totals SET size = size - OLD.size WHERE id = 0; END
+            ''')
+            self._conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_size_update AFTER UPDATE OF size ON entries
+                BEGIN UPDATE totals SET size = size - OLD.size + NEW.size WHERE id = 0; END
+            ''')
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS counters (
+                stage TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+    @staticmethod
+    def make_key(stage: str, content_digest: str, fingerprint: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Ключ записи: этап + хэш содержимого + версия кода + параметры вызова"""
+        key = f"{stage}:{fingerprint}:{content_digest}"
+        if params:
+            key += ':' + json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return key
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, stage: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        # UPSERT, а не INSERT OR REPLACE: при REPLACE триггер удаления не срабатывает
+        self._conn.execute(
+            'INSERT INTO entries (key, stage, value, size, created_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET stage = excluded.stage, value = excluded.value, '
+            'size = excluded.size, created_at = excluded.created_at, accessed_at = excluded.accessed_at',
+            (key, stage, data, size, now, now)
+        )
+        self._evict()
+
+    def _evict(self) -> None:
+        """Удаляет самые давно использованные записи, пока кэш не уложится в лимит"""
+        total = self._conn.execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        freed = 0
+        stale_keys = []
+        for key, size in self._conn.execute('SELECT key, size FROM entries ORDER BY accessed_at'):
+            stale_keys.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self._conn.executemany('DELETE FROM entries WHERE key = ?', stale_keys)
+
+    def _count(self, stage: str, hit: bool) -> None:
+        counters = self.hits if hit else self.misses
+        counters[stage] = counters.get(stage, 0) + 1
+        column = 'hits' if hit else 'misses'
+        self._conn.execute(
+            f'INSERT INTO counters (stage, {column}) VALUES (?, 1) '
+            f'ON CONFLICT(stage) DO UPDATE SET {column} = {column} + 1',
+            (stage,)
+        )
+
+    def cached(self, stage: str, content_digest: str, fingerprint: str, compute: Callable[[], Any],
+               params: Optional[Dict[str, Any]] = None,
+               store_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Возвращает результат из кэша или вычисляет и сохраняет его.
+        store_if - условие сохранения (например, не кэшировать ошибки).
+        """
+        key = self.make_key(stage, content_digest, fingerprint, params)
+        value = self.get(key)
+        if value is not None:
+            self._count(stage, hit=True)
+            return value
+
+        self._count(stage, hit=False)
+        value = compute()
+        if store_if is None or store_if(value):
+            self.put(key, stage, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий/промахов (процесса и общие по файлу кэша) и размер кэша"""
+        entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        totals = {
+            stage: {"hits": hits, "misses": misses}
+            for stage, hits, misses in self._conn.execute('SELECT stage, hits, misses FROM counters')
+        }
+        stages = sorted(set(self.hits) | set(self.misses))
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "session": {stage: {"hits": self.hits.get(stage, 0), "misses": self.misses.get(stage, 0)}
+                        for stage in stages},
+            "total": totals
+        }
+
+    def clear(self) -> None:
+        self._conn.execute('DELETE FROM entries')
+        self._conn.execute('DELETE FROM counters')
+        self.hits.clear()
+        self.misses.clear()
+
+
+_cache: Optional[ResultCache] = None
+_cache_pid: Optional[int] = None
+
+
+def get_cache() -> Optional[ResultCache]:
+    """Кэш процесса (создаётся при первом обращении) или None, если кэш отключён"""
+    global _cache, _cache_pid
+    if os.environ.get('INVOICE_CACHE', '1') == '0':
+        return None
+    # Соединение SQLite нельзя использовать в дочернем процессе после fork
+    if _cache is None or _cache_pid != os.getpid():
+        _cache_pid = os.getpid()
+        try:
+            max_mb = float(os.environ.get('INVOICE_CACHE_MAX_MB', DEFAULT_MAX_MB))
+            _cache = ResultCache(os.environ.get('INVOICE_CACHE_PATH', DEFAULT_CACHE_PATH),
+                                 int(max_mb * 1024 * 1024))
+        except (OSError, sqlite3.Error, ValueError):
+            # Кэш - только ускорение: без него пайплайн работает как раньше
+            return None
+    return _cache
+
+
+# ============================================
+# OCR страниц по отпечатку (pdf_to_png.page_fingerprint)
+# ============================================
+
+# OCR делает route.ts (Google Vision); здесь только хранилище текста страниц.
+# Версия движка входит в ключ вместо отпечатка кода
+PAGE_OCR_ENGINE = 'google-vision-text'
+
+
+def get_page_ocr(page_hash: str) -> Optional[str]:
+    """Распознанный ранее текст страницы с этим отпечатком или None (нет в кэше / кэш отключён)"""
+    cache = get_cache()
+    if cache is None:
+        return None
+    text = cache.get(cache.make_key('page_ocr', page_hash, PAGE_OCR_ENGINE))
+    cache._count('page_ocr', hit=text is not None)
+    return text
+
+
+def put_page_ocr(page_hash: str, text: str) -> bool:
+    """Сохраняет текст OCR страницы; пустой текст не кэшируется (мог быть сбой распознавания)"""
+    cache = get_cache()
+    if cache is None or not text:
+        return False
+    cache.put(cache.make_key('page_ocr', page_hash, PAGE_OCR_ENGINE), 'page_ocr', text)
+    return True
+
+
+# ============================================
+# Кэшированные версии этапов пайплайна
+# ============================================
+
+def _module_file(func: Callable) -> str:
+    return sys.modules[func.__module__].__file__
+
+
+def _lazy_stop(parser):
+    """
+    Условие остановки ленивого чтения PDF. Промежуточные разборы страниц не
+    кэшируются - в кэш попадает только разбор итогового текста
+    """
+    from pdf_extract_text import fields_found_check
+
+    if parser is None:
+        return None
+    return fields_found_check(parser)
+
+
+def _pdf_fingerprint(extract: Callable, parser) -> str:
+    from pdf_layout import extract_layout_fields
+
+    # layout_fields считает pdf_layout; в ленивом режиме результат зависит и от версии парсера
+    sources = [_module_file(extract), _module_file(extract_layout_fields)]
+    if parser is not None:
+        sources.append(_module_file(type(parser).parse_invoice))
+    return source_fingerprint(*sources)
+
+
+def cached_extract_text_from_pdf(pdf_path: str, min_chars: int = 50, max_pages: int = None,
+                                 parser=None, layout: bool = False) -> dict:
+    """extract_text_from_pdf; с parser - ленивый режим до нахождения полей счёта (fields_found_check)"""
+    from pdf_extract_text import extract_text_from_pdf
+
+    compute = lambda: extract_text_from_pdf(pdf_path, min_chars, max_pages, _lazy_stop(parser), layout)
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    return cache.cached(
+        'pdf_text', file_digest(pdf_path), _pdf_fingerprint(extract_text_from_pdf, parser),
+        compute,
+        params={"min_chars": min_chars, "max_pages": max_pages, "lazy": parser is not None, "layout": layout},
+        store_if=lambda result: result.get('success', False)
+    )
+
+
+def cached_extract_pdf_hybrid(pdf_path: str, dpi: int = 200, output_dir: str = None,
+                              max_pages: int = None, parser=None, layout: bool = False,
+                              encoding: Dict[str, Any] = None, ocr_cache: bool = False) -> dict:
+    """
+    Постраничный разбор PDF. В кэш попадают только документы без страниц для OCR:
+    отрендеренные страницы лежат во временной папке запроса и в кэше не живут
+    (поэтому ни encoding картинок, ни ocr_cache в ключ не входят).
+    """
+    from pdf_extract_text import extract_pdf_hybrid
+
+    compute = lambda: extract_pdf_hybrid(pdf_path, dpi, output_dir, max_pages=max_pages,
+                                         stop_when=_lazy_stop(parser), layout=layout, encoding=encoding,
+                                         ocr_cache=ocr_cache)
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    return cache.cached(
+        'pdf_hybrid', file_digest(pdf_path), _pdf_fingerprint(extract_pdf_hybrid, parser),
+        compute,
+        params={"max_pages": max_pages, "lazy": parser is not None, "layout": layout},
+        store_if=lambda result: result.get('success', False) and not result.get('ocr_pages')
+    )
+
+
+def cached_office_text(file_path: str) -> str:
+    """Текст Excel/Word файла (extract_text_from_excel / extract_text_from_word)"""
+    from office_to_text import extract_text_from_excel, extract_text_from_word
+
+    extension = os.path.splitext(file_path)[1].lower()
+    extract = extract_text_from_word if extension in ('.docx', '.doc') else extract_text_from_excel
+
+    cache = get_cache()
+    if cache is None:
+        return extract(file_path)
+    # Тип файла входит в параметры: .xls и .xlsx с одинаковыми байтами читаются по-разному
+    return cache.cached(
+        'office_text', file_digest(file_path), source_fingerprint(_module_file(extract)),
+        lambda: extract(file_path),
+        params={"ext": extension},
+        store_if=lambda text: not text.startswith("Ошибка")
+    )
+
+
+def cached_excel_fields(file_path: str) -> Dict[str, Any]:
+    """Поля счёта из ячеек Excel (excel_grid.extract_excel_fields) для parse_invoice(resolved=...)"""
+    from excel_grid import extract_excel_fields
+    from office_to_text import iter_xls_sheets
+
+    cache = get_cache()
+    if cache is None:
+        return extract_excel_fields(file_path)
+    extension = os.path.splitext(file_path)[1].lower()
+    return cache.cached(
+        'excel_fields', file_digest(file_path),
+        source_fingerprint(_module_file(extract_excel_fields), _module_file(iter_xls_sheets)),
+        lambda: extract_excel_fields(file_path),
+        params={"ext": extension}
+    )
+
+
+def cached_convert_office_file(file_path: str) -> dict:
+    """Ответ office_to_text.convert_office_file (формат CLI office_to_text.py)"""
+    from office_to_text import convert_office_file
+
+    cache = get_cache()
+    if cache is None or not os.path.exists(file_path):
+        return convert_office_file(file_path)
+    extension = os.path.splitext(file_path)[1].lower()
+    result = cache.cached(
+        'office_file', file_digest(file_path), source_fingerprint(_module_file(convert_office_file)),
+        lambda: convert_office_file(file_path),
+        params={"ext": extension},
+        store_if=lambda result: 'error' not in result
+    )
+    # Путь в ответе - текущего файла, а не того, с которого сделана запись
+    if 'file_path' in result:
+        result['file_path'] = file_path
+    return result
+
+
+def cached_parse_invoice(parser, text: str, resolved: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """parse_invoice; resolved (поля по координатам/ячейкам) входит в ключ кэша"""
+    cache = get_cache()
+    if cache is None:
+        return parser.parse_invoice(text, resolved=resolved)
+    return cache.cached(
+        'parse', text_digest(text), source_fingerprint(_module_file(type(parser).parse_invoice)),
+        lambda: parser.parse_invoice(text, resolved=resolved),
+        params={"resolved": resolved} if resolved else None
+    )
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Асинхронный клиент /api/smart-invoice для пакетной обработки счетов
+
+Файлы отправляются параллельно, но не больше concurrency запросов одновременно:
+каждый из concurrency обработчиков держит своё keep-alive соединение (HTTP/1.1)
+и берёт следующий файл из общей очереди. Пропускная способность растёт вместе
+с возможностями сервера, а не упирается в один запрос за раз.
+
+Повторы - только при временных ошибках (обрыв соединения, таймаут, HTTP 429/5xx),
+с экспоненциальной задержкой и случайным разбросом (full jitter):
+    задержка = random(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** попытка))
+Retry-After сервера (429/503) учитывается как минимальная задержка.
+
+Результат по каждому файлу отдаётся в on_result сразу по готовности (например,
+в CsvResultWriter - строка пишется в CSV без ожидания остальных файлов).
+
+Только стандартная библиотека (asyncio), без requests/aiohttp.
+
+  from api_batch_client import process_batch, CsvResultWriter
+
+  with CsvResultWriter('out.csv', ['filename', 'status']) as writer:
+      process_batch(paths, concurrency=4,
+                    on_result=lambda result: writer.write({'filename': result['filename'], ...}))
+"""
+
+import os
+import csv
+import json
+import time
+import random
+import asyncio
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+API_URL = "http://localhost:3000/api/smart-invoice"
+
+DEFAULT_CONCURRENCY = 4
+RETRY_COUNT = 3  # Попыток на файл (первая + повторы)
+REQUEST_TIMEOUT = 180.0  # секунды на один запрос
+BACKOFF_BASE = 1.0  # секунды
+BACKOFF_CAP = 30.0
+
+# HTTP статусы, при которых запрос повторяется
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Ответ длиннее - не JSON счёта, а что-то не то; читать целиком не нужно
+MAX_RESPONSE_BYTES = 64 * 1024 * 1024
+
+
+class ApiConnection:
+    """Одно keep-alive соединение с сервером API: запросы идут по нему последовательно"""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.ssl = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.host_header = parts.netloc
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.opened = 0  # Сколько раз открывалось TCP соединение
+
+    async def _connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        self.opened += 1
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def post(self, body: bytes, content_type: str) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        POST по текущему соединению: (статус, заголовки, тело).
+        Если сервер успел закрыть простаивавшее соединение (keep-alive timeout),
+        запрос один раз повторяется по новому соединению.
+        """
+        reused = self.writer is not None
+        if not reused:
+            await self._connect()
+        try:
+            return await self._exchange(body, content_type)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+        await self._connect()
+        return await self._exchange(body, content_type)
+
+    async def _exchange(self, body: bytes, content_type: str) -> Tuple[int, Dict[str, str], bytes]:
+        head = (f"POST {self.path} HTTP/1.1\r\n"
+                f"Host: {self.host_header}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Accept: application/json\r\n"
+                f"Connection: keep-alive\r\n\r\n")
+        self.writer.write(head.encode('latin-1'))
+        self.writer.write(body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Сервер закрыл соединение")
+        status = int(status_line.split()[1])
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise asyncio.IncompleteReadError(b'', None)
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = await self._read_chunked()
+        elif 'content-length' in headers:
+            content = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            # Ни длины, ни chunked - тело до закрытия соединения
+            content = await self.reader.read(MAX_RESPONSE_BYTES)
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, headers, content
+
+    async def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0].strip(), 16)
+            if size == 0:
+                # Завершающие заголовки (trailers) до пустой строки
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)  # \r\n после блока
+
+
+def build_multipart(path: str, field: str = 'file') -> Tuple[bytes, str]:
+    """Тело multipart/form-data с одним файлом: (тело, Content-Type)"""
+    boundary = f'----invoice-batch-{random.getrandbits(64):016x}'
+    # Имя файла в UTF-8, как у браузера: экранируются только кавычки и переводы строк
+    filename = os.path.basename(path).replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+    with open(path, 'rb') as f:
+        content = f.read()
+    head = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+    return head + content + f'\r\n--{boundary}--\r\n'.encode('ascii'), f'multipart/form-data; boundary={boundary}'
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Задержка перед повтором номер attempt (с единицы): full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after(headers: Dict[str, str]) -> float:
+    try:
+        return float(headers.get('retry-after', 0))
+    except ValueError:
+        return 0.0  # Дата HTTP вместо секунд - не разбираем
+
+
+class BatchClient:
+    """
+    Пакетная отправка файлов в /api/smart-invoice: не больше concurrency запросов
+    одновременно, по keep-alive соединению на обработчик, повторы с backoff.
+    """
+
+    def __init__(self, url: str = API_URL, concurrency: int = DEFAULT_CONCURRENCY,
+                 retries: int = RETRY_COUNT, timeout: float = REQUEST_TIMEOUT,
+                 backoff_base: float = BACKOFF_BASE, backoff_cap: float = BACKOFF_CAP):
+        self.url = url
+        self.concurrency = max(1, concurrency)
+        self.retries = max(1, retries)
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    async def run(self, paths: List[str], on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+                  ) -> List[Dict[str, Any]]:
+        """Обрабатывает все файлы; результаты - в порядке готовности (и в on_result по мере готовности)"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for path in paths:
+            queue.put_nowait(str(path))
+        results: List[Dict[str, Any]] = []
+
+        async def worker():
+            connection = ApiConnection(self.url)
+            try:
+                while True:
+                    try:
+                        path = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    result = await self.send_file(connection, path)
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+            finally:
+                self.connections_opened += connection.opened
+                await connection.close()
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(paths)))))
+        return results
+
+    async def send_file(self, connection: ApiConnection, path: str) -> Dict[str, Any]:
+        """
+        Отправляет один файл с повторами. Результат: filename, path, status (HTTP код
+        или None), data (JSON ответа), error, attempts, elapsed_ms.
+        """
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"filename": os.path.basename(path), "path": path,
+                                  "status": None, "data": None, "error": None, "attempts": 0}
+        try:
+            body, content_type = build_multipart(path)
+        except OSError as e:
+            result["error"] = f"Файл не прочитан: {e}"
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+        for attempt in range(1, self.retries + 1):
+            result["attempts"] = attempt
+            retry_after = 0.0
+            try:
+                self.requests_sent += 1
+                status, headers, content = await asyncio.wait_for(
+                    connection.post(body, content_type), self.timeout)
+                result["status"], result["error"] = status, None
+                try:
+                    result["data"] = json.loads(content)
+                except ValueError:
+                    result["data"] = None
+                    result["error"] = content[:200].decode('utf-8', 'replace')
+                if status not in RETRY_STATUSES:
+                    break
+                retry_after = _retry_after(headers)
+                result["error"] = result["error"] or f"HTTP {status}"
+            except asyncio.TimeoutError:
+                # Ответ на этот запрос ещё может прийти - соединение больше не годится
+                await connection.close()
+                result["status"], result["error"] = None, "Timeout"
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+                await connection.close()
+                result["status"], result["error"] = None, f"{type(e).__name__}: {e}"
+
+            if attempt < self.retries:
+                await asyncio.sleep(max(retry_after, backoff_delay(attempt, self.backoff_base, self.backoff_cap)))
+
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+
+def process_batch(paths: List[str], on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  **options) -> List[Dict[str, Any]]:
+    """Синхронная обёртка над BatchClient(**options).run(paths, on_result) для скриптов"""
+    return asyncio.run(BatchClient(**options).run(paths, on_result))
+
+
+def check_server(url: str = API_URL, timeout: float = 5.0) -> bool:
+    """Отвечает ли сервер по адресу url (любым HTTP статусом)"""
+    parts = urlsplit(url)
+    try:
+        urllib.request.urlopen(f'{parts.scheme}://{parts.netloc}/', timeout=timeout)
+        return True
+    except urllib.error.HTTPError:
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+class CsvResultWriter:
+    """CSV, в который строки дописываются по одной сразу по готовности (с flush)"""
+
+    def __init__(self, path: str, fieldnames: List[str], append: bool = False, encoding: str = 'utf-8'):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.append = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.encoding = encoding
+        self.rows = 0
+
+    def __enter__(self) -> 'CsvResultWriter':
+        self.file = open(self.path, 'a' if self.append else 'w', newline='', encoding=self.encoding)
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+        if not self.append:
+            self.writer.writeheader()
+        return self
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.writer.writerow(row)
+        self.file.flush()
+        self.rows += 1
+
+    def __exit__(self, *exc_info) -> None:
+        self.file.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Манифест пакетной обработки счетов: что уже обработано и с каким результатом
+
+По каждому файлу хранится путь, размер, mtime, SHA-256 содержимого, статус
+и строка результата (как в CSV). Повторный прогон пропускает файлы, которые
+уже обработаны успешно и с тех пор не менялись, и отправляет заново только
+новые, изменённые и упавшие - ночной прогон занимает время пропорционально
+изменениям, а не размеру папки.
+
+Какие статусы итоговые, решает вызывающий (plan(..., done_statuses)): например,
+при локальной обработке без OCR скан со статусом NEEDS_OCR повторять бесполезно.
+
+Файл считается неизменным, если совпали размер и mtime; если mtime сдвинулся
+(копирование, touch), сравнивается хэш содержимого - перечитывать файл
+приходится только в этом случае.
+
+Каждая запись сохраняется сразу (SQLite в autocommit), поэтому обрыв прогона
+(Ctrl-C, падение) теряет только файлы, которые были в работе.
+
+Хранилище - SQLite (по умолчанию .cache/batch_manifest.sqlite в корне проекта).
+
+  manifest = BatchManifest()
+  pending, done = manifest.plan(paths)
+  for path in pending:
+      manifest.record(path, row)          # row['status'] == 'SUCCESS' - готово
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'python-scripts'))
+
+from result_cache import file_digest
+
+DEFAULT_MANIFEST_PATH = os.path.join(PROJECT_ROOT, '.cache', 'batch_manifest.sqlite')
+
+# Статус, после которого файл повторно не обрабатывается
+SUCCESS_STATUS = 'SUCCESS'
+
+
+class BatchManifest:
+    """Манифест в SQLite: одна запись на файл (по абсолютному пути)"""
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                row TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.abspath(file_path)
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        record = self._conn.execute(
+            'SELECT size, mtime, sha256, status, error, row, attempts FROM files WHERE path = ?',
+            (self._key(file_path),)
+        ).fetchone()
+        if record is None:
+            return None
+        size, mtime, sha256, status, error, row, attempts = record
+        return {"size": size, "mtime": mtime, "sha256": sha256, "status": status,
+                "error": error, "row": json.loads(row), "attempts": attempts}
+
+    def is_done(self, file_path: str, done_statuses: Tuple[str, ...] = (SUCCESS_STATUS,)) -> bool:
+        """Файл уже обработан с итоговым статусом (done_statuses) и с тех пор не менялся"""
+        entry = self.get(file_path)
+        if entry is None or entry["status"] not in done_statuses:
+            return False
+
+        stat = os.stat(file_path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime == entry["mtime"]:
+            return True
+
+        # mtime сдвинулся - решает содержимое
+        if file_digest(file_path) != entry["sha256"]:
+            return False
+        self._conn.execute('UPDATE files SET mtime = ? WHERE path = ?', (stat.st_mtime, self._key(file_path)))
+        return True
+
+    def plan(self, file_paths: List[str],
+             done_statuses: Tuple[str, ...] = (SUCCESS_STATUS,)) -> Tuple[List[str], List[str]]:
+        """Делит файлы на (к обработке, уже готовые) с сохранением порядка"""
+        pending, done = [], []
+        for file_path in file_paths:
+            (done if self.is_done(file_path, done_statuses) else pending).append(file_path)
+        return pending, done
+
+    def record(self, file_path: str, row: Dict[str, Any]) -> None:
+        """Сохраняет результат обработки файла (строку CSV со статусом)"""
+        stat = os.stat(file_path)
+        self._conn.execute(
+            'INSERT INTO files (path, size, mtime, sha256, status, error, row, attempts, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?) '
+            'ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, '
+            'sha256 = excluded.sha256, status = excluded.status, error = excluded.error, '
+            'row = excluded.row, attempts = attempts + 1, updated_at = excluded.updated_at',
+            (self._key(file_path), stat.st_size, stat.st_mtime, file_digest(file_path), row['status'],
+             row.get('error'), json.dumps(row, ensure_ascii=False, default=str), time.time())
+        )
+
+    def rows(self, file_paths: List[str]) -> List[Dict[str, Any]]:
+        """Сохранённые строки результатов для файлов (которых нет в манифесте - пропускаются)"""
+        entries = (self.get(file_path) for file_path in file_paths)
+        return [entry["row"] for entry in entries if entry is not None]
+
+    def stats(self) -> Dict[str, int]:
+        """Число файлов в манифесте по статусам"""
+        return dict(self._conn.execute('SELECT status, COUNT(*) FROM files GROUP BY status').fetchall())
+
+    def clear(self) -> None:
+        self._conn.execute('DELETE FROM files')
@@ -2,23 +2,58 @@
 # -*- coding: utf-8 -*-
 """
 Скрипт для batch обработки всех счетов через API
+
+  python scripts/batch_process_all_invoices.py            # через /api/smart-invoice
+  python scripts/batch_process_all_invoices.py --concurrency 8   # 8 запросов к API одновременно
+  python scripts/batch_process_all_invoices.py --local    # локально, пулом процессов
+  python scripts/batch_process_all_invoices.py --full     # все файлы заново, CSV с нуля
+
+Прогон инкрементальный: манифест (scripts/batch_manifest.py) помнит размер, mtime,
+хэш и статус каждого файла. Повторный запуск пропускает неизменённые успешно
+обработанные файлы, а новые, изменённые и упавшие обрабатывает заново.
+Строки дописываются в CSV по мере готовности, поэтому прерванный прогон
+продолжается с того же места. В конце прогона CSV переписывается из манифеста -
+по одной строке на файл; повторные строки остаются только после прерванного
+прогона, до следующего завершённого.
+В режиме --local сканы со статусом NEEDS_OCR (нужен OCR, которого локально нет)
+тоже считаются обработанными; прогон через API распознаёт их заново.
 """
 
 import os
 import sys
-import requests
-import json
-import csv
+import argparse
 import time
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any
+
+# Модули пайплайна (python-scripts/local_pipeline.py) для режима --local
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'python-scripts'))
+
+from api_batch_client import CsvResultWriter, DEFAULT_CONCURRENCY, process_batch
+from batch_manifest import BatchManifest, DEFAULT_MANIFEST_PATH, SUCCESS_STATUS
 
 # Конфигурация
 API_URL = "http://localhost:3000/api/smart-invoice"
 INVOICES_DIR = "docs/invoices"
 OUTPUT_FILE = "docs/invoices/результаты_переобработка.csv"
-RETRY_COUNT = 3
-RETRY_DELAY = 2  # секунды
+RETRY_COUNT = 3  # Попыток на файл; задержка между ними - экспоненциальная со случайным разбросом
+
+# Итоговые статусы локальной обработки: без изменений файла повторять бесполезно
+LOCAL_DONE_STATUSES = (SUCCESS_STATUS, 'NEEDS_OCR')
+
+# Колонки CSV
+CSV_FIELDS = [
+    'filename',
+    'status',
+    'invoice_number',
+    'invoice_date',
+    'total_amount',
+    'vat_amount',
+    'supplier_name',
+    'supplier_inn',
+    'error',
+    'response'
+]
 
 def get_invoice_files() -> List[str]:
     """Получить список всех файлов счетов"""
@@ -37,127 +72,137 @@ def get_invoice_files() -> List[str]:
     
     return files
 
-def process_invoice(filename: str) -> Dict[str, Any]:
-    """Обработать один счет через API"""
-    filepath = Path(INVOICES_DIR) / filename
-    
-    if not filepath.exists():
+def api_result_to_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Преобразовать результат BatchClient (api_batch_client.py) в строку CSV"""
+    filename = result['filename']
+    data = result['data'] or {}
+
+    if result['status'] is None:
         return {
             'filename': filename,
-            'status': 'NOT_FOUND',
-            'error': 'Файл не найден'
+            'status': 'TIMEOUT' if result['error'] == 'Timeout' else 'ERROR',
+            'error': result['error']
         }
-    
-    # Попытки с retry логикой
-    for attempt in range(1, RETRY_COUNT + 1):
-        try:
-            print(f"  📤 Попытка {attempt}/{RETRY_COUNT}...", end='', flush=True)
-            
-            with open(filepath, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(API_URL, files=files, timeout=120)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    parsed = data.get('parsed', {})
-                    print(f" ✅")
-                    return {
-                        'filename': filename,
-                        'status': 'SUCCESS',
-                        'invoice_number': parsed.get('invoice_number'),
-                        'invoice_date': parsed.get('invoice_date'),
-                        'total_amount': parsed.get('total_amount'),
-                        'vat_amount': parsed.get('vat_amount'),
-                        'supplier_name': parsed.get('supplier_name'),
-                        'supplier_inn': parsed.get('supplier_inn'),
-                    }
-                else:
-                    error = data.get('error', 'Unknown error')
-                    print(f" ❌ {error}")
-                    if attempt < RETRY_COUNT:
-                        time.sleep(RETRY_DELAY)
-                        continue
-                    return {
-                        'filename': filename,
-                        'status': 'FAILED',
-                        'error': error
-                    }
-            else:
-                error = f"HTTP {response.status_code}"
-                print(f" ❌ {error}")
-                if attempt < RETRY_COUNT:
-                    time.sleep(RETRY_DELAY)
-                    continue
-                return {
-                    'filename': filename,
-                    'status': 'HTTP_ERROR',
-                    'error': error,
-                    'response': response.text[:200]
-                }
-                
-        except requests.Timeout:
-            print(f" ⏱️ Timeout")
-            if attempt < RETRY_COUNT:
-                time.sleep(RETRY_DELAY * 2)
-                continue
-            return {
-                'filename': filename,
-                'status': 'TIMEOUT',
-                'error': 'Request timeout'
-            }
-        except Exception as e:
-            error = str(e)
-            print(f" ❌ {error}")
-            if attempt < RETRY_COUNT:
-                time.sleep(RETRY_DELAY)
-                continue
-            return {
-                'filename': filename,
-                'status': 'ERROR',
-                'error': error
-            }
-    
+    if result['status'] != 200:
+        return {
+            'filename': filename,
+            'status': 'HTTP_ERROR',
+            'error': f"HTTP {result['status']}",
+            'response': str(data.get('error') or result['error'] or '')[:200]
+        }
+    if not data.get('success'):
+        return {
+            'filename': filename,
+            'status': 'FAILED',
+            'error': data.get('error', 'Unknown error')
+        }
+
+    parsed = data.get('parsed', {})
     return {
         'filename': filename,
-        'status': 'FAILED',
-        'error': 'Max retries exceeded'
+        'status': 'SUCCESS',
+        'invoice_number': parsed.get('invoice_number'),
+        'invoice_date': parsed.get('invoice_date'),
+        'total_amount': parsed.get('total_amount'),
+        'vat_amount': parsed.get('vat_amount'),
+        'supplier_name': parsed.get('supplier_name'),
+        'supplier_inn': parsed.get('supplier_inn'),
     }
 
-def save_results(results: List[Dict[str, Any]]) -> None:
-    """Сохранить результаты в CSV"""
-    if not results:
-        print("❌ Нет результатов для сохранения")
-        return
-    
-    # Определяем все возможные колонки
-    fieldnames = [
-        'filename',
-        'status',
-        'invoice_number',
-        'invoice_date',
-        'total_amount',
-        'vat_amount',
-        'supplier_name',
-        'supplier_inn',
-        'error',
-        'response'
-    ]
-    
-    try:
-        with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for result in results:
-                writer.writerow(result)
-        
-        print(f"\n✅ Результаты сохранены в {OUTPUT_FILE}")
-    except Exception as e:
-        print(f"❌ Ошибка сохранения результатов: {e}")
+def print_row(index: int, total: int, row: Dict[str, Any]) -> None:
+    if row['status'] == 'SUCCESS':
+        print(f"[{index}/{total}] ✅ {row['filename']}: № {row.get('invoice_number')}, "
+              f"{row.get('invoice_date')}, Сумма: {row.get('total_amount')}")
+    else:
+        print(f"[{index}/{total}] ❌ {row['filename']}: {row.get('error')}")
+
+def process_invoices_api(files: List[str], concurrency: int,
+                         save_row: Callable[[str, Dict[str, Any]], None]) -> List[Dict[str, Any]]:
+    """
+    Обработать счета через API асинхронно: до concurrency запросов одновременно,
+    keep-alive соединения, повторы с backoff. Каждая строка сразу уходит в save_row(путь, строка).
+    """
+    paths = [str(Path(INVOICES_DIR) / filename) for filename in files]
+    rows: List[Dict[str, Any]] = []
+
+    def on_result(result: Dict[str, Any]) -> None:
+        row = api_result_to_row(result)
+        save_row(result['path'], row)
+        rows.append(row)
+        print_row(len(rows), len(files), row)
+
+    process_batch(paths, on_result=on_result, url=API_URL, concurrency=concurrency, retries=RETRY_COUNT)
+    return rows
+
+def local_result_to_row(filename: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Преобразовать результат локального пайплайна в строку CSV (те же колонки, что у API)"""
+    if not result.get('success'):
+        return {
+            'filename': filename,
+            'status': 'NEEDS_OCR' if result.get('needs_ocr') else 'FAILED',
+            'error': result.get('error', 'Unknown error')
+        }
+
+    parsed = result['parsed']
+    return {
+        'filename': filename,
+        'status': 'SUCCESS',
+        'invoice_number': parsed.get('invoice_number'),
+        'invoice_date': parsed.get('invoice_date'),
+        'total_amount': parsed.get('total_amount'),
+        'vat_amount': parsed.get('vat_amount'),
+        'supplier_name': parsed.get('supplier_name'),
+        'supplier_inn': parsed.get('supplier_inn'),
+    }
+
+def process_invoices_local(files: List[str], save_row: Callable[[str, Dict[str, Any]], None],
+                           workers: int = None) -> List[Dict[str, Any]]:
+    """
+    Обработать счета локально в пуле процессов (без Next.js сервера).
+    Каждая строка сразу уходит в save_row(путь, строка).
+    """
+    from local_pipeline import process_files
+
+    paths = [str(Path(INVOICES_DIR) / filename) for filename in files]
+    rows: Dict[str, Dict[str, Any]] = {}
+
+    for i, (path, result) in enumerate(process_files(paths, max_workers=workers), 1):
+        filename = Path(path).name
+        row = local_result_to_row(filename, result)
+        save_row(path, row)
+        rows[filename] = row
+        print_row(i, len(files), row)
+
+    # Пул отдаёт результаты по мере готовности - возвращаем в исходном порядке файлов
+    return [rows[filename] for filename in files]
+
+def rewrite_csv(path: str, rows: List[Dict[str, Any]]) -> None:
+    """Перезаписывает CSV строками rows через временный файл (CSV не бывает недописанным)"""
+    temp_path = path + '.tmp'
+    with CsvResultWriter(temp_path, CSV_FIELDS) as writer:
+        for row in rows:
+            writer.write(row)
+    os.replace(temp_path, path)
 
 def main():
+    parser = argparse.ArgumentParser(description='Batch обработка всех счетов')
+    parser.add_argument('--local', action='store_true',
+                        help='Обрабатывать локально через Python пайплайн (без API), пулом процессов')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Число процессов для --local (по умолчанию - число ядер)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Запросов к API одновременно (по умолчанию {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_PATH,
+                        help='Файл манифеста обработанных счетов (SQLite)')
+    parser.add_argument('--full', action='store_true',
+                        help='Обработать все файлы заново и перезаписать CSV (манифест обновляется)')
+    args = parser.parse_args()
+
     print("=" * 60)
-    print("🔄 Batch обработка всех счетов через API")
+    if args.local:
+        print(f"🔄 Batch обработка всех счетов локально ({args.workers or os.cpu_count()} процессов)")
+    else:
+        print(f"🔄 Batch обработка всех счетов через API ({args.concurrency} запросов одновременно)")
     print("=" * 60)
     
     # Получаем список файлов
@@ -166,35 +211,55 @@ def main():
         print("❌ Файлы счетов не найдены")
         return
     
-    print(f"\n📂 Найдено {len(files)} файлов для обработки\n")
-    
+    print(f"\n📂 Найдено {len(files)} файлов")
+
+    # Неизменённые и уже успешно обработанные файлы пропускаем
+    manifest = BatchManifest(args.manifest)
+    paths = [str(Path(INVOICES_DIR) / filename) for filename in files]
+    if args.full:
+        pending, done = paths, []
+    else:
+        pending, done = manifest.plan(paths, LOCAL_DONE_STATUSES if args.local else (SUCCESS_STATUS,))
+    pending_files = [Path(path).name for path in pending]
+    print(f"⏭️ Без изменений (уже обработаны): {len(done)}")
+    print(f"📝 К обработке: {len(pending_files)}\n")
+
     # Обрабатываем файлы
-    results: List[Dict[str, Any]] = []
-    success_count = 0
-    error_count = 0
-    
-    for i, filename in enumerate(files, 1):
-        print(f"[{i}/{len(files)}] 📄 {filename}")
-        result = process_invoice(filename)
-        results.append(result)
-        
-        if result['status'] == 'SUCCESS':
-            success_count += 1
-            print(f"      ✅ № {result.get('invoice_number')}, {result.get('invoice_date')}, "
-                  f"Сумма: {result.get('total_amount')}")
+    started = time.time()
+    with CsvResultWriter(OUTPUT_FILE, CSV_FIELDS, append=not args.full) as writer:
+        # CSV нет (или удалён) - строки пропущенных файлов берём из манифеста
+        if not writer.append:
+            for row in manifest.rows(done):
+                writer.write(row)
+
+        def save_row(path: str, row: Dict[str, Any]) -> None:
+            writer.write(row)
+            manifest.record(path, row)
+
+        if not pending_files:
+            results = []
+        elif args.local:
+            results = process_invoices_local(pending_files, save_row, args.workers)
         else:
-            error_count += 1
-            print(f"      ❌ {result.get('error', 'Unknown error')}")
-    
-    # Сохраняем результаты
-    save_results(results)
+            results = process_invoices_api(pending_files, args.concurrency, save_row)
+    print(f"\n⏱️ Обработано за {time.time() - started:.1f} с")
+
+    # Повторно обработанные файлы дописаны в конец CSV - оставляем по строке на файл
+    rewrite_csv(OUTPUT_FILE, manifest.rows(paths))
+
+    success_count = sum(1 for result in results if result['status'] == 'SUCCESS')
+    error_count = len(results) - success_count
+    processed = len(results) or 1
     
     # Статистика
     print("\n" + "=" * 60)
     print("📊 СТАТИСТИКА")
     print("=" * 60)
-    print(f"✅ Успешно обработано: {success_count}/{len(files)} ({success_count*100//len(files)}%)")
-    print(f"❌ Ошибок: {error_count}/{len(files)} ({error_count*100//len(files)}%)")
+    print(f"✅ Успешно обработано: {success_count}/{len(results)} ({success_count*100//processed}%)")
+    print(f"❌ Ошибок: {error_count}/{len(results)} ({error_count*100//processed}%)")
+    print(f"⏭️ Пропущено без изменений: {len(done)}")
+    totals = ', '.join(f"{status}: {count}" for status, count in sorted(manifest.stats().items()))
+    print(f"🗂️ В манифесте: {totals}")
     print(f"📁 Результаты сохранены в: {OUTPUT_FILE}")
 
 if __name__ == '__main__':
@@ -2,81 +2,132 @@
 # -*- coding: utf-8 -*-
 """
 Пакетная обработка счетов с обработкой ошибок и повторными попытками
+
+  --concurrency N  запросов к API одновременно (keep-alive, повторы с backoff)
+  --local          обработка без сервера: Python пайплайн в пуле процессов
 """
 
-import requests
+import sys
+import os
+import argparse
 import json
-import time
+import queue
+import threading
 from pathlib import Path
 import pandas as pd
 from datetime import datetime
 
+# Модули пайплайна (python-scripts/local_pipeline.py) для режима --local
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'python-scripts'))
+
+from api_batch_client import DEFAULT_CONCURRENCY, check_server, process_batch
+
 API_URL = "http://localhost:3000/api/smart-invoice"
 MAX_RETRIES = 2
-RETRY_DELAY = 5
+REQUEST_TIMEOUT = 180
+
+def api_result_to_row(result, max_retries=MAX_RETRIES):
+    """Преобразует результат BatchClient (api_batch_client.py) в строку с колонками API"""
+    filename = result['filename']
+    data = result['data'] or {}
+
+    if result['status'] == 200:
+        invoice = data.get('invoice', {})
+        contractor = data.get('contractor', {})
+        return {
+            'Файл': filename,
+            'Номер счета (API)': invoice.get('number'),
+            'Дата (API)': invoice.get('date'),
+            'Контрагент (API)': contractor.get('name'),
+            'Сумма (API)': invoice.get('total_amount'),
+            'НДС (API)': invoice.get('vat_amount'),
+            'ИНН (API)': contractor.get('inn'),
+            'Статус': 'Успешно'
+        }
+
+    error = str(data.get('error') or result['error'] or '')[:200]
+    if result['status'] is None:
+        return {'Файл': filename, 'Статус': 'Ошибка', 'Ошибка': error}
+    if result['attempts'] > 1:
+        return {'Файл': filename, 'Статус': f'Ошибка после {max_retries} попыток', 'Ошибка': error}
+    return {'Файл': filename, 'Статус': f'HTTP {result["status"]}', 'Ошибка': error}
+
+def iter_api_results(files_to_process, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Отправляет файлы в API асинхронно (до concurrency запросов одновременно),
+    отдаёт (путь, строка) по мере готовности
+    """
+    skipped = [f for f in files_to_process if f.suffix.lower() in ['.jpeg', '.jpg']]
+    to_send = [f for f in files_to_process if f not in skipped]
 
-def process_with_retry(file_path, max_retries=MAX_RETRIES):
-    """Обрабатывает файл с повторными попытками при ошибках"""
-    filename = file_path.name
-    
     # Пропускаем JPEG
-    if file_path.suffix.lower() in ['.jpeg', '.jpg']:
-        return {'Файл': filename, 'Статус': 'Пропущен (JPEG)'}
-    
-    for attempt in range(max_retries):
+    for file_path in skipped:
+        yield file_path, {'Файл': file_path.name, 'Статус': 'Пропущен (JPEG)'}
+
+    # BatchClient отдаёт результаты в on_result; очередь превращает их в итератор
+    done = queue.Queue()
+    finished = object()
+
+    def run():
         try:
-            with open(file_path, 'rb') as f:
-                files = {'file': (filename, f, 'application/octet-stream')}
-                
-                response = requests.post(API_URL, files=files, timeout=180)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    invoice = result.get('invoice', {})
-                    contractor = result.get('contractor', {})
-                    
-                    return {
-                        'Файл': filename,
-                        'Номер счета (API)': invoice.get('number'),
-                        'Дата (API)': invoice.get('date'),
-                        'Контрагент (API)': contractor.get('name'),
-                        'Сумма (API)': invoice.get('total_amount'),
-                        'НДС (API)': invoice.get('vat_amount'),
-                        'ИНН (API)': contractor.get('inn'),
-                        'Статус': 'Успешно'
-                    }
-                elif response.status_code == 500:
-                    error_msg = response.text[:200]
-                    if attempt < max_retries - 1:
-                        print(f"  ⚠️ Ошибка 500, повтор через {RETRY_DELAY}с...")
-                        time.sleep(RETRY_DELAY)
-                        continue
-                    return {
-                        'Файл': filename,
-                        'Статус': f'Ошибка после {max_retries} попыток',
-                        'Ошибка': error_msg
-                    }
-                else:
-                    return {
-                        'Файл': filename,
-                        'Статус': f'HTTP {response.status_code}',
-                        'Ошибка': response.text[:200]
-                    }
-        except Exception as e:
-            if attempt < max_retries - 1:
-                print(f"  ⚠️ Ошибка: {str(e)[:50]}, повтор...")
-                time.sleep(RETRY_DELAY)
-                continue
-            return {
-                'Файл': filename,
-                'Статус': 'Ошибка',
-                'Ошибка': str(e)[:200]
-            }
-    
-    return {'Файл': filename, 'Статус': 'Неизвестная ошибка'}
+            process_batch(to_send, on_result=done.put, url=API_URL, concurrency=concurrency,
+                          retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT)
+        finally:
+            done.put(finished)
+
+    threading.Thread(target=run, daemon=True).start()
+    while (result := done.get()) is not finished:
+        yield Path(result['path']), api_result_to_row(result)
+
+def local_result_to_row(filename, result):
+    """Преобразует результат локального пайплайна в строку с колонками API"""
+    if not result.get('success'):
+        return {
+            'Файл': filename,
+            'Статус': 'Нужен OCR' if result.get('needs_ocr') else 'Ошибка',
+            'Ошибка': str(result.get('error', ''))[:200]
+        }
+
+    invoice = result.get('invoice', {})
+    contractor = result.get('contractor', {})
+    return {
+        'Файл': filename,
+        'Номер счета (API)': invoice.get('number'),
+        'Дата (API)': invoice.get('date'),
+        'Контрагент (API)': contractor.get('name'),
+        'Сумма (API)': invoice.get('total_amount'),
+        'НДС (API)': invoice.get('vat_amount'),
+        'ИНН (API)': contractor.get('inn'),
+        'Статус': 'Успешно'
+    }
+
+def iter_local_results(files_to_process, workers=None):
+    """Обрабатывает файлы локально в пуле процессов, отдаёт (путь, строка) по мере готовности"""
+    from local_pipeline import process_files
+
+    # JPEG пропускаем так же, как в режиме API
+    skipped = [f for f in files_to_process if f.suffix.lower() in ['.jpeg', '.jpg']]
+    to_pool = [f for f in files_to_process if f not in skipped]
+
+    for path, result in process_files(to_pool, max_workers=workers):
+        yield Path(path), local_result_to_row(Path(path).name, result)
+
+    for file_path in skipped:
+        yield file_path, {'Файл': file_path.name, 'Статус': 'Пропущен (JPEG)'}
 
 def main():
-    invoices_dir = Path('/Users/stanislavtkachev/Dropbox/Glazing CRM/ProjectCRM/docs/invoices')
+    parser = argparse.ArgumentParser(description='Пакетная обработка счетов')
+    parser.add_argument('--local', action='store_true',
+                        help='Обрабатывать локально через Python пайплайн (без сервера), пулом процессов')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Число процессов для --local (по умолчанию - число ядер)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Запросов к API одновременно (по умолчанию {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--dir', default='/Users/stanislavtkachev/Dropbox/Glazing CRM/ProjectCRM/docs/invoices',
+                        help='Папка со счетами')
+    args = parser.parse_args()
+
+    invoices_dir = Path(args.dir)
     output_file = 'docs/invoices/результаты_API.csv'
     
     # Загружаем уже обработанные файлы, если есть
@@ -95,13 +146,15 @@ def main():
     print("\n🚀 Пакетная обработка счетов")
     print("=" * 80)
     
-    # Проверяем сервер
-    try:
-        requests.get("http://localhost:3000", timeout=5)
-        print("✅ Сервер доступен\n")
-    except:
-        print("❌ Сервер недоступен! Запустите: npm run dev\n")
-        return
+    # Проверяем сервер (в локальном режиме он не нужен)
+    if args.local:
+        print(f"🖥️  Локальный режим: {args.workers or os.cpu_count()} процессов\n")
+    else:
+        if check_server(API_URL):
+            print(f"✅ Сервер доступен, запросов одновременно: {args.concurrency}\n")
+        else:
+            print("❌ Сервер недоступен! Запустите: npm run dev\n")
+            return
     
     files = sorted([f for f in invoices_dir.iterdir() if f.is_file()])
     files_to_process = [f for f in files if f.name not in processed_files]
@@ -115,11 +168,14 @@ def main():
         print("\n✨ Все файлы уже обработаны!")
         return
     
-    for idx, file_path in enumerate(files_to_process, 1):
+    if args.local:
+        processed = iter_local_results(files_to_process, args.workers)
+    else:
+        processed = iter_api_results(files_to_process, args.concurrency)
+    
+    for idx, (file_path, result) in enumerate(processed, 1):
         print(f"\n[{idx}/{len(files_to_process)}] 📄 {file_path.name}")
         
-        result = process_with_retry(file_path)
-        
         # Выводим результат
         if result.get('Статус') == 'Успешно':
             print(f"  ✅ Номер: {result.get('Номер счета (API)')}, "
@@ -135,10 +191,6 @@ def main():
         # Сохраняем после каждого файла
         df = pd.DataFrame(results)
         df.to_csv(output_file, index=False, encoding='utf-8-sig')
-        
-        # Пауза между запросами
-        if idx < len(files_to_process):
-            time.sleep(2)
     
     print("\n" + "=" * 80)
     print("💾 Результаты сохранены в:", output_file)
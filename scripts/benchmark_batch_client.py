@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк асинхронного пакетного клиента API (scripts/api_batch_client.py)
+
+Поднимается локальный сервер-заглушка /api/smart-invoice (HTTP/1.1, keep-alive):
+ответ через LATENCY_MS, одновременно обрабатывается не больше CAPACITY запросов,
+на первую попытку каждого FAIL_EVERY-го файла - 503 (проверка повторов с backoff).
+Файлы test-invoices отправляются с concurrency 1, 2, 4, 8. Проверяется:
+  - все файлы обработаны успешно, повторов ровно столько, сколько было 503
+  - соединений открыто не больше concurrency (keep-alive, без соединения на файл)
+  - пропускная способность растёт с concurrency, пока не упрётся в CAPACITY
+
+  python scripts/benchmark_batch_client.py
+  python scripts/benchmark_batch_client.py --files 80 --latency-ms 100 --json batch_client.json
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TEST_INVOICES_DIR = PROJECT_ROOT / 'test-invoices'
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from api_batch_client import BatchClient
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8]
+DEFAULT_FILES = 40
+LATENCY_MS = 50
+CAPACITY = 8
+FAIL_EVERY = 10
+
+# Ускорение на concurrency 4 относительно 1 (сервер держит CAPACITY >= 4 запросов)
+MIN_SPEEDUP_AT_4 = 2.5
+
+# Регрессия: пропускная способность упала больше чем на 30%
+REGRESSION_RATIO = 0.7
+
+
+class StubState:
+    def __init__(self, latency_ms: int, capacity: int, fail_every: int):
+        self.latency = latency_ms / 1000
+        self.slots = threading.BoundedSemaphore(capacity)
+        self.fail_every = fail_every
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.failed_once: set = set()
+        self.failures = 0
+
+
+def make_handler(state: StubState):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with state.lock:
+                state.connections += 1
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            marker = b'filename="'
+            start = body.find(marker) + len(marker)
+            filename = body[start:body.find(b'"', start)].decode('utf-8', 'replace')
+
+            with state.lock:
+                state.requests += 1
+                fail = (state.fail_every and zlib.crc32(filename.encode('utf-8')) % state.fail_every == 0
+                        and filename not in state.failed_once)
+                if fail:
+                    state.failed_once.add(filename)
+                    state.failures += 1
+
+            if fail:
+                self._reply(503, {"error": "Сервер перегружен"}, {"Retry-After": "0"})
+                return
+
+            with state.slots:
+                time.sleep(state.latency)
+            self._reply(200, {"success": True, "parsed": {"invoice_number": filename[:10], "total_amount": len(body)},
+                              "invoice": {"number": filename[:10]}, "contractor": {}})
+
+        def _reply(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+            content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+    return StubHandler
+
+
+def run_level(paths: List[str], concurrency: int, latency_ms: int, capacity: int, fail_every: int) -> Dict[str, Any]:
+    state = StubState(latency_ms, capacity, fail_every)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = BatchClient(f'http://127.0.0.1:{server.server_port}/api/smart-invoice',
+                             concurrency=concurrency, backoff_base=0.01, backoff_cap=0.05)
+        started = time.perf_counter()
+        results = asyncio.run(client.run(paths))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    succeeded = sum(1 for result in results if result["status"] == 200 and (result["data"] or {}).get("success"))
+    retries = sum(result["attempts"] - 1 for result in results)
+    return {
+        "concurrency": concurrency,
+        "files": len(paths),
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(paths) / elapsed, 2),
+        "succeeded": succeeded,
+        "retries": retries,
+        "server_failures": state.failures,
+        "connections": state.connections,
+        "ok": succeeded == len(paths) and retries == state.failures and state.connections <= concurrency
+    }
+
+
+def run_benchmark(files: int, latency_ms: int, capacity: int, fail_every: int) -> Dict[str, Any]:
+    sources = sorted(str(path) for path in TEST_INVOICES_DIR.iterdir() if path.suffix.lower() != '.json')
+    paths = [sources[index % len(sources)] for index in range(files)]
+    results = [run_level(paths, concurrency, latency_ms, capacity, fail_every) for concurrency in CONCURRENCY_LEVELS]
+
+    by_level = {result["concurrency"]: result for result in results}
+    speedup = None
+    if 1 in by_level and 4 in by_level:
+        speedup = round(by_level[4]["files_per_second"] / by_level[1]["files_per_second"], 2)
+
+    return {
+        "benchmark": "batch_client",
+        "python": sys.version.split()[0],
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "latency_ms": latency_ms,
+        "capacity": capacity,
+        "speedup_at_4": speedup,
+        "results": results
+    }
+
+
+def find_regressions(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    previous = {result["concurrency"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(result["concurrency"])
+        if old and result["files_per_second"] < old["files_per_second"] * REGRESSION_RATIO:
+            regressions.append(f"concurrency {result['concurrency']}: "
+                               f"{old['files_per_second']} -> {result['files_per_second']} файлов/с")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Заглушка: {report['latency_ms']} мс на запрос, до {report['capacity']} запросов одновременно")
+    print(f"{'concurrency':>13} {'файлов':>7} {'с':>7} {'файлов/с':>9} {'повторов':>9} {'соединений':>11}")
+    for result in report["results"]:
+        mark = '✅' if result["ok"] else '❌'
+        print(f"{mark} {result['concurrency']:>10} {result['files']:>7} {result['seconds']:>7.2f} "
+              f"{result['files_per_second']:>9.2f} {result['retries']:>9} {result['connections']:>11}")
+    if report["speedup_at_4"] is not None:
+        print(f"\nУскорение concurrency 4 / 1: x{report['speedup_at_4']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк асинхронного пакетного клиента API на заглушке')
+    parser.add_argument('--files', type=int, default=DEFAULT_FILES, help='Файлов на прогон')
+    parser.add_argument('--latency-ms', type=int, default=LATENCY_MS, help='Задержка ответа заглушки')
+    parser.add_argument('--capacity', type=int, default=CAPACITY, help='Запросов одновременно на заглушке')
+    parser.add_argument('--fail-every', type=int, default=FAIL_EVERY, help='503 на первую попытку каждого N-го файла (0 - без ошибок)')
+    parser.add_argument('--json', help='Сохранить результаты в JSON файл')
+    parser.add_argument('--compare', help='JSON предыдущего прогона: код выхода 1 при регрессии')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.files, args.latency_ms, args.capacity, args.fail_every)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+    failed = [str(result["concurrency"]) for result in report["results"] if not result["ok"]]
+    if failed:
+        print(f"\n❌ Ошибки, лишние повторы или соединения на concurrency: {', '.join(failed)}")
+
+    slow = (args.capacity >= 4 and report["speedup_at_4"] is not None
+            and report["speedup_at_4"] < MIN_SPEEDUP_AT_4)
+    if slow:
+        print(f"\n❌ Ускорение на concurrency 4 меньше x{MIN_SPEEDUP_AT_4}")
+
+    regressions = []
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f))
+        for regression in regressions:
+            print(f"⚠️ Регрессия: {regression}")
+
+    sys.exit(1 if failed or slow or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
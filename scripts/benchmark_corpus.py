@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк точности и скорости распознавания на корпусе счетов
+
+Прогоняет полный пайплайн (извлечение текста + парсер, как в local_pipeline)
+по файлам папки (по умолчанию test-invoices). Рядом с файлом счёта может лежать
+ожидаемый результат с тем же именем и расширением .json:
+  invoice_number, invoice_date, total_amount, vat_amount, supplier_name, supplier_inn
+
+Отчёт:
+  - точность по каждому полю и по всем полям сразу (только файлы с .json)
+  - задержки p50/p95/max по этапам (extract, parse, total) и по форматам файлов
+  - пиковый RSS процесса
+Результаты сохраняются в JSON (--json), чтобы сравнивать версии между собой.
+
+Две версии парсера в одном прогоне (текст извлекается один раз и отдаётся обоим):
+  python scripts/benchmark_corpus.py --against main                 # git ref
+  python scripts/benchmark_corpus.py --against /tmp/old_parser.py   # файл
+
+Сравнение с сохранённым прогоном (код 1 при падении точности или замедлении):
+  python scripts/benchmark_corpus.py --json new.json --compare old.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import importlib.util
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Кэш результатов исказил бы замеры - отключаем до импорта пайплайна
+os.environ.setdefault('INVOICE_CACHE', '0')
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / 'python-scripts'))
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import local_pipeline
+from ultimate_invoice_parser import UltimateInvoiceParser
+
+DEFAULT_CORPUS_DIR = PROJECT_ROOT / 'test-invoices'
+
+FIELDS = ['invoice_number', 'invoice_date', 'total_amount', 'vat_amount', 'supplier_name', 'supplier_inn']
+AMOUNT_FIELDS = {'total_amount', 'vat_amount'}
+
+SOURCE_EXTENSIONS = (local_pipeline.PDF_EXTENSIONS | local_pipeline.EXCEL_EXTENSIONS |
+                     local_pipeline.WORD_EXTENSIONS | local_pipeline.IMAGE_EXTENSIONS)
+
+CURRENT_LABEL = 'current'
+
+# Регрессия при --compare: точность поля упала, или p50 total вырос больше чем в 1.5 раза и на 20 мс
+LATENCY_REGRESSION_RATIO = 1.5
+LATENCY_REGRESSION_MIN_MS = 20.0
+
+
+# ============================================
+# Загрузка парсеров
+# ============================================
+
+def load_parser_module(source: str, label: str):
+    """Парсер из файла или из git ref (ultimate_invoice_parser.py на этой ревизии)"""
+    if os.path.exists(source):
+        path = source
+    else:
+        content = subprocess.run(['git', 'show', f'{source}:ultimate_invoice_parser.py'],
+                                 cwd=PROJECT_ROOT, capture_output=True, check=True).stdout
+        handle, path = tempfile.mkstemp(suffix='_ultimate_invoice_parser.py')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(content)
+
+    spec = importlib.util.spec_from_file_location(f'ultimate_invoice_parser_{label}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ============================================
+# Сравнение с ожидаемым результатом
+# ============================================
+
+def normalize_text(value: Any) -> str:
+    text = str(value).lower()
+    for quote in '"\'«»“”„':
+        text = text.replace(quote, '')
+    return ' '.join(text.split())
+
+
+def field_matches(field: str, expected: Any, actual: Any) -> bool:
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    if field in AMOUNT_FIELDS:
+        try:
+            return abs(float(expected) - float(actual)) <= 0.01
+        except (TypeError, ValueError):
+            return False
+    return normalize_text(expected) == normalize_text(actual)
+
+
+def load_expected(source: Path) -> Optional[Dict[str, Any]]:
+    expected_path = source.with_suffix('.json')
+    if not expected_path.exists():
+        return None
+    with open(expected_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ============================================
+# Статистика
+# ============================================
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.499999)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(samples: List[Dict[str, Any]], key: str) -> Dict[str, Dict[str, float]]:
+    """p50/p95/max по всем файлам и по каждому формату"""
+    groups: Dict[str, List[float]] = {}
+    for sample in samples:
+        if sample.get(key) is None:
+            continue
+        groups.setdefault('all', []).append(sample[key])
+        groups.setdefault(sample['format'], []).append(sample[key])
+    return {
+        group: {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "max": round(max(values), 3)
+        }
+        for group, values in sorted(groups.items())
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КБ, macOS - байты
+    return round(rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024, 1)
+
+
+def elapsed_ms(started_ns: int) -> float:
+    return (time.perf_counter_ns() - started_ns) / 1e6
+
+
+# ============================================
+# Прогон
+# ============================================
+
+def run_corpus(corpus_dir: Path, parsers: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    sources = sorted(path for path in corpus_dir.iterdir()
+                     if path.is_file() and path.suffix.lower() in SOURCE_EXTENSIONS)
+
+    files = []
+    samples: Dict[str, List[Dict[str, Any]]] = {label: [] for label in parsers}
+
+    for source in sources:
+        file_format = source.suffix.lower().lstrip('.')
+        expected = load_expected(source)
+        entry: Dict[str, Any] = {"file": source.name, "format": file_format,
+                                 "has_expected": expected is not None, "parsers": {}}
+
+        for run in range(repeat):
+            started = time.perf_counter_ns()
+            extracted = local_pipeline.extract_text(str(source))
+            extract_ms = elapsed_ms(started)
+
+            if 'error' in extracted:
+                entry["status"] = "needs_ocr" if extracted["needs_ocr"] else "error"
+                entry["error"] = extracted["error"]
+                break
+            entry["status"] = "ok"
+
+            for label, parser in parsers.items():
+                started = time.perf_counter_ns()
+                parsed = parser.parse_invoice(extracted['text'])
+                parse_ms = elapsed_ms(started)
+
+                samples[label].append({"format": file_format, "extract": extract_ms,
+                                       "parse": parse_ms, "total": extract_ms + parse_ms})
+
+                # Поля сравниваем по последнему повтору - результат детерминирован
+                if run == repeat - 1:
+                    actual = local_pipeline.to_parsed_fields(parsed) if 'error' not in parsed else {}
+                    fields = {}
+                    if expected is not None:
+                        for field in FIELDS:
+                            fields[field] = {
+                                "expected": expected.get(field),
+                                "actual": actual.get(field),
+                                "ok": field_matches(field, expected.get(field), actual.get(field))
+                            }
+                    entry["parsers"][label] = {"parse_ms": round(parse_ms, 3), "fields": fields,
+                                               "parser_error": parsed.get('error')}
+
+        files.append(entry)
+
+    return {"files": files, "samples": samples}
+
+
+def accuracy(files: List[Dict[str, Any]], label: str) -> Dict[str, Any]:
+    """Доля совпавших полей; файлы без .json и без текста (нужен OCR) не учитываются"""
+    scored = [entry["parsers"][label]["fields"] for entry in files
+              if entry.get("status") == "ok" and entry["has_expected"]]
+    result = {}
+    for field in FIELDS:
+        correct = sum(1 for fields in scored if fields[field]["ok"])
+        result[field] = {"correct": correct, "total": len(scored),
+                         "ratio": round(correct / len(scored), 4) if scored else None}
+    all_ok = sum(1 for fields in scored if all(item["ok"] for item in fields.values()))
+    result["all_fields"] = {"correct": all_ok, "total": len(scored),
+                            "ratio": round(all_ok / len(scored), 4) if scored else None}
+    return result
+
+
+def build_report(corpus_dir: Path, parsers: Dict[str, Any], sources: Dict[str, str], repeat: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    run = run_corpus(corpus_dir, parsers, repeat)
+    files = run["files"]
+
+    return {
+        "benchmark": "corpus",
+        "corpus_dir": str(corpus_dir),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": sys.version.split()[0],
+        "repeat": repeat,
+        "file_count": len(files),
+        "status_counts": {status: sum(1 for entry in files if entry.get("status") == status)
+                          for status in ("ok", "needs_ocr", "error")},
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "parsers": {
+            label: {
+                "source": sources[label],
+                "accuracy": accuracy(files, label),
+                "latency_ms": {stage: latency_summary(run["samples"][label], stage)
+                               for stage in ("extract", "parse", "total")}
+            }
+            for label in parsers
+        },
+        "files": files
+    }
+
+
+# ============================================
+# Вывод и сравнение
+# ============================================
+
+def print_report(report: Dict[str, Any]) -> None:
+    counts = report["status_counts"]
+    print(f"📂 {report['corpus_dir']}: {report['file_count']} файлов "
+          f"(текст: {counts['ok']}, нужен OCR: {counts['needs_ocr']}, ошибки: {counts['error']})")
+
+    for label, data in report["parsers"].items():
+        print(f"\n🔎 Парсер: {label} ({data['source']})")
+        for field, score in data["accuracy"].items():
+            ratio = f"{score['ratio'] * 100:.0f}%" if score["ratio"] is not None else '-'
+            print(f"  {field:16} {score['correct']}/{score['total']}  {ratio}")
+
+        print(f"  {'этап':8} {'формат':6} {'n':>4} {'p50, мс':>9} {'p95, мс':>9} {'max, мс':>9}")
+        for stage, groups in data["latency_ms"].items():
+            for group, stats in groups.items():
+                print(f"  {stage:8} {group:6} {stats['count']:>4} {stats['p50']:>9.2f} "
+                      f"{stats['p95']:>9.2f} {stats['max']:>9.2f}")
+
+    # Расхождения с ожидаемым результатом
+    for entry in report["files"]:
+        for label, result in entry["parsers"].items():
+            wrong = [f"{field}: {item['actual']!r} (ожидалось {item['expected']!r})"
+                     for field, item in result["fields"].items() if not item["ok"]]
+            if wrong:
+                print(f"\n❌ [{label}] {entry['file']}")
+                for line in wrong:
+                    print(f"     {line}")
+
+    print(f"\n🧠 Пиковый RSS: {report['peak_rss_mb']} МБ, время прогона: {report['wall_seconds']} с")
+
+
+def find_regressions(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Сравнивает парсер current с парсером current сохранённого прогона"""
+    new = current["parsers"].get(CURRENT_LABEL)
+    old = baseline.get("parsers", {}).get(CURRENT_LABEL)
+    if not new or not old:
+        return []
+
+    regressions = []
+    for field, score in new["accuracy"].items():
+        old_ratio = old["accuracy"].get(field, {}).get("ratio")
+        if score["ratio"] is not None and old_ratio is not None and score["ratio"] < old_ratio:
+            regressions.append(f"точность {field}: {old_ratio:.2%} -> {score['ratio']:.2%}")
+
+    new_p50 = new["latency_ms"]["total"].get("all", {}).get("p50")
+    old_p50 = old["latency_ms"]["total"].get("all", {}).get("p50")
+    if new_p50 and old_p50 and new_p50 > old_p50 * LATENCY_REGRESSION_RATIO \
+            and new_p50 - old_p50 > LATENCY_REGRESSION_MIN_MS:
+        regressions.append(f"p50 total: {old_p50:.1f} -> {new_p50:.1f} мс")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк точности и скорости на корпусе счетов')
+    parser.add_argument('corpus_dir', nargs='?', default=str(DEFAULT_CORPUS_DIR),
+                        help='Папка с файлами счетов и ожидаемыми .json (по умолчанию test-invoices)')
+    parser.add_argument('--against', help='Вторая версия парсера: путь к файлу или git ref')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов на файл для замера задержек')
+    parser.add_argument('--json', help='Сохранить результаты в JSON файл')
+    parser.add_argument('--compare', help='JSON предыдущего прогона: код выхода 1 при регрессии')
+    args = parser.parse_args()
+
+    parsers = {CURRENT_LABEL: UltimateInvoiceParser(debug=False)}
+    sources = {CURRENT_LABEL: 'рабочая копия'}
+    if args.against:
+        module = load_parser_module(args.against, 'against')
+        parsers['against'] = module.UltimateInvoiceParser(debug=False)
+        sources['against'] = args.against
+
+    report = build_report(Path(args.corpus_dir), parsers, sources, max(1, args.repeat))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты сохранены в {args.json}")
+
+    regressions = []
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f))
+        for regression in regressions:
+            print(f"⚠️ Регрессия: {regression}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
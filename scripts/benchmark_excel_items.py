@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк чтения товарных позиций из ячеек Excel (python-scripts/excel_grid.py)
+
+Большой счёт-прайс собирается из .xlsx в test-invoices: строка первой позиции
+копируется ROWS раз, строки итогов и подвала сдвигаются вниз. Замеряется
+extract_excel_items на этом файле и на всех Excel файлах test-invoices;
+проверяется число позиций и сумма по колонке "Сумма".
+
+  python scripts/benchmark_excel_items.py
+  python scripts/benchmark_excel_items.py --rows 20000 --json excel_items.json
+  python scripts/benchmark_excel_items.py --compare old_excel_items.json   # код 1 при регрессии
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from typing import Any, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TEST_INVOICES_DIR = PROJECT_ROOT / 'test-invoices'
+sys.path.insert(0, str(PROJECT_ROOT / 'python-scripts'))
+
+from excel_grid import extract_excel_items, find_header
+
+DEFAULT_ROWS = 5000
+
+# Бюджет на большой счёт: позиции должны читаться быстрее секунды
+BUDGET_MS = 1000.0
+
+_RE_ROW = re.compile(r'<row r="(\d+)"[^>]*?(?:/>|>.*?</row>)', re.S)
+_RE_CELL_REF = re.compile(r'r="([A-Z]+)\d+"')
+
+# Регрессия: медиана выросла больше чем в 1.5 раза и больше чем на 50 мс
+REGRESSION_RATIO = 1.5
+REGRESSION_MIN_MS = 50.0
+
+
+def build_price_list(template: Path, rows: int, output_path: str) -> float:
+    """
+    Счёт на rows позиций по образцу template. XML первой позиции копируется как есть
+    (со всеми оформленными пустыми ячейками, как в выгрузках 1С), строки итогов и
+    подвала перенумеровываются ниже. Возвращает ожидаемую сумму позиций.
+    """
+    import openpyxl
+
+    sheet = openpyxl.load_workbook(template, read_only=True, data_only=True).worksheets[0]
+    values = [tuple(row) for row in sheet.iter_rows(values_only=True)]
+    header_index = next(index for index, row in enumerate(values) if find_header(row))
+    columns = find_header(values[header_index])
+    item_index = next(index for index in range(header_index + 1, len(values))
+                      if values[index][columns['name']])
+    tail_index = next(index for index in range(item_index, len(values))
+                      if not values[index][columns['name']] and any(values[index]))
+    item_total = float(values[item_index][columns['total']])
+
+    with zipfile.ZipFile(template) as source:
+        sheet_name = next(name for name in source.namelist() if name.startswith('xl/worksheets/sheet'))
+        xml = source.read(sheet_name).decode('utf-8')
+        row_xml = {int(match.group(1)): match.group(0) for match in _RE_ROW.finditer(xml)}
+
+        def renumber(row: str, number: int) -> str:
+            row = re.sub(r'<row r="\d+"', f'<row r="{number}"', row, count=1)
+            return _RE_CELL_REF.sub(lambda match: f'r="{match.group(1)}{number}"', row)
+
+        # Номера строк в XML - с единицы
+        body = [row for number, row in sorted(row_xml.items()) if number <= item_index]
+        body += [renumber(row_xml[item_index + 1], item_index + 1 + offset) for offset in range(rows)]
+        shift = item_index + rows - tail_index
+        body += [renumber(row, number + shift) for number, row in sorted(row_xml.items())
+                 if number > tail_index]
+
+        sheet_data = xml[xml.index('<sheetData>') + len('<sheetData>'):xml.index('</sheetData>')]
+        xml = xml.replace(sheet_data, '\n'.join(body))
+        # Объединения шаблона к новым строкам не относятся, размер листа - новый
+        last_row = max(row_xml) + shift
+        xml = re.sub(r'<mergeCells.*?</mergeCells>', '', xml, flags=re.S)
+        xml = re.sub(r'(<dimension ref="(?:[A-Z]+\d+:)?[A-Z]+)\d+', lambda match: f'{match.group(1)}{last_row}', xml)
+
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as target:
+            for name in source.namelist():
+                target.writestr(name, xml if name == sheet_name else source.read(name))
+    return round(item_total * rows, 2)
+
+
+def time_items(path: str, repeat: int) -> Dict[str, Any]:
+    samples = []
+    items: List[Dict[str, Any]] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = extract_excel_items(path)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 2),
+        "max_ms": round(max(samples), 2),
+        "items": len(items),
+        "sum": round(sum(item["total"] or 0 for item in items), 2)
+    }
+
+
+def run_benchmark(rows: int, repeat: int) -> Dict[str, Any]:
+    results = []
+    templates = sorted(TEST_INVOICES_DIR.glob('*.xlsx'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if templates:
+            path = os.path.join(temp_dir, f'price_list_{rows}.xlsx')
+            expected_sum = build_price_list(templates[0], rows, path)
+            result = time_items(path, repeat)
+            result.update({
+                "name": f"price_list_{rows}.xlsx",
+                "size_kb": os.path.getsize(path) // 1024,
+                "expected_items": rows,
+                "expected_sum": expected_sum,
+                "ok": result["items"] == rows and abs(result["sum"] - expected_sum) < 0.01
+            })
+            results.append(result)
+
+    for path in sorted(TEST_INVOICES_DIR.glob('*.xls*')):
+        result = time_items(str(path), repeat)
+        result.update({"name": path.name, "size_kb": path.stat().st_size // 1024, "ok": result["items"] > 0})
+        results.append(result)
+
+    return {
+        "benchmark": "excel_items",
+        "python": sys.version.split()[0],
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "rows": rows,
+        "budget_ms": BUDGET_MS,
+        "results": results
+    }
+
+
+def find_regressions(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(result["name"])
+        if not old:
+            continue
+        new_ms, old_ms = result["median_ms"], old["median_ms"]
+        if new_ms > old_ms * REGRESSION_RATIO and new_ms - old_ms > REGRESSION_MIN_MS:
+            regressions.append(f"{result['name']}: {old_ms:.0f} -> {new_ms:.0f} мс")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'Файл':45} {'КБ':>6} {'позиций':>8} {'сумма':>14} {'медиана, мс':>12} {'макс, мс':>9}")
+    for result in report["results"]:
+        mark = '✅' if result["ok"] else '❌'
+        print(f"{mark} {result['name'][:42]:42} {result['size_kb']:>6} {result['items']:>8} "
+              f"{result['sum']:>14.2f} {result['median_ms']:>12.2f} {result['max_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк чтения товарных позиций из Excel')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='Позиций в сгенерированном счёте')
+    parser.add_argument('--repeat', type=int, default=5, help='Замеров на файл (по умолчанию 5)')
+    parser.add_argument('--json', help='Сохранить результаты в JSON файл')
+    parser.add_argument('--compare', help='JSON предыдущего прогона: код выхода 1 при регрессии')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.rows, args.repeat)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+    failed = [result["name"] for result in report["results"] if not result["ok"]]
+    if failed:
+        print(f"\n❌ Позиции прочитаны неверно: {', '.join(failed)}")
+
+    over_budget = [result["name"] for result in report["results"] if result["median_ms"] > BUDGET_MS]
+    if over_budget:
+        print(f"\n❌ Дольше {BUDGET_MS:.0f} мс: {', '.join(over_budget)}")
+
+    regressions = []
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f))
+        for regression in regressions:
+            print(f"⚠️ Регрессия: {regression}")
+
+    sys.exit(1 if failed or over_budget or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
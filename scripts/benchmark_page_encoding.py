@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк кодирования страниц для OCR (python-scripts/pdf_to_png.py, page_encoding)
+
+Каждая страница PDF из test-invoices рендерится в каждой настройке из SETTINGS
+(цвет, формат, качество, обрезка полей). Для настройки считаются байты на
+страницу (то, что уходит в Google Vision) и время рендера с кодированием
+на страницу; размер сравнивается с текущим вариантом - PNG RGB.
+
+WebP замеряется, только если установлен Pillow.
+
+  python scripts/benchmark_page_encoding.py
+  python scripts/benchmark_page_encoding.py --dpi 300 --json page_encoding.json
+  python scripts/benchmark_page_encoding.py --compare old_page_encoding.json   # код 1 при регрессии
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+from typing import Any, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TEST_INVOICES_DIR = PROJECT_ROOT / 'test-invoices'
+sys.path.insert(0, str(PROJECT_ROOT / 'python-scripts'))
+
+import fitz
+from pdf_to_png import page_encoding, render_page_for_ocr
+
+# Имя -> (colorspace, format, quality, crop); первая настройка - база для сравнения размера
+SETTINGS = {
+    'rgb_png': ('rgb', 'png', 80, False),
+    'gray_png': ('gray', 'png', 80, False),
+    'bw_png': ('bw', 'png', 80, False),
+    'gray_jpeg_80': ('gray', 'jpeg', 80, False),
+    'gray_jpeg_60': ('gray', 'jpeg', 60, False),
+    'gray_webp_80': ('gray', 'webp', 80, False),
+    'gray_png_crop': ('gray', 'png', 80, True),
+    'bw_png_crop': ('bw', 'png', 80, True),
+}
+
+# Регрессия: время на страницу выросло больше чем в 1.5 раза и больше чем на 20 мс,
+# или размер страницы вырос больше чем на 10%
+REGRESSION_RATIO = 1.5
+REGRESSION_MIN_MS = 20.0
+SIZE_REGRESSION_RATIO = 1.1
+
+
+def measure_setting(pdf_paths: List[Path], encoding: Dict[str, Any], dpi: int, repeat: int) -> Dict[str, Any]:
+    sizes = []
+    times = []
+    for pdf_path in pdf_paths:
+        doc = fitz.open(pdf_path)
+        for page in doc:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                _, image_data = render_page_for_ocr(page, dpi, encoding=encoding)
+                samples.append((time.perf_counter() - started) * 1000)
+            sizes.append(len(image_data))
+            times.append(statistics.median(samples))
+        doc.close()
+
+    return {
+        "pages": len(sizes),
+        "bytes_per_page": round(statistics.mean(sizes)) if sizes else 0,
+        "ms_per_page": round(statistics.mean(times), 2) if times else 0.0,
+        "ok": bool(sizes) and min(sizes) > 0
+    }
+
+
+def run_benchmark(dpi: int, repeat: int) -> Dict[str, Any]:
+    pdf_paths = sorted(TEST_INVOICES_DIR.glob('*.pdf'))
+    results = []
+    skipped = []
+    for name, (colorspace, image_format, quality, crop) in SETTINGS.items():
+        try:
+            encoding = page_encoding(colorspace, image_format, quality, crop)
+        except ValueError as e:
+            skipped.append(f"{name}: {e}")
+            continue
+        result = measure_setting(pdf_paths, encoding, dpi, repeat)
+        result.update({"name": name, **encoding})
+        results.append(result)
+
+    base_bytes = results[0]["bytes_per_page"] if results else 0
+    for result in results:
+        result["size_ratio"] = round(result["bytes_per_page"] / base_bytes, 3) if base_bytes else None
+
+    return {
+        "benchmark": "page_encoding",
+        "python": sys.version.split()[0],
+        "pymupdf": fitz.VersionBind,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "dpi": dpi,
+        "files": len(pdf_paths),
+        "results": results,
+        "skipped": skipped
+    }
+
+
+def find_regressions(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(result["name"])
+        if not old:
+            continue
+        new_ms, old_ms = result["ms_per_page"], old["ms_per_page"]
+        if new_ms > old_ms * REGRESSION_RATIO and new_ms - old_ms > REGRESSION_MIN_MS:
+            regressions.append(f"{result['name']}: {old_ms:.0f} -> {new_ms:.0f} мс/стр")
+        if result["bytes_per_page"] > old["bytes_per_page"] * SIZE_REGRESSION_RATIO:
+            regressions.append(f"{result['name']}: {old['bytes_per_page']} -> {result['bytes_per_page']} байт/стр")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"PDF: {report['files']}, DPI {report['dpi']}")
+    print(f"{'Настройка':16} {'страниц':>8} {'КБ/стр':>8} {'от PNG RGB':>11} {'мс/стр':>8}")
+    for result in report["results"]:
+        mark = '✅' if result["ok"] else '❌'
+        ratio = f"{result['size_ratio'] * 100:.0f}%" if result["size_ratio"] is not None else '-'
+        print(f"{mark} {result['name']:13} {result['pages']:>8} {result['bytes_per_page'] / 1024:>8.1f} "
+              f"{ratio:>11} {result['ms_per_page']:>8.1f}")
+    for reason in report["skipped"]:
+        print(f"⏭️ Пропущено: {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк кодирования страниц PDF для OCR')
+    parser.add_argument('--dpi', type=int, default=200, help='DPI рендера (по умолчанию 200, как в route.ts)')
+    parser.add_argument('--repeat', type=int, default=3, help='Замеров на страницу (по умолчанию 3)')
+    parser.add_argument('--json', help='Сохранить результаты в JSON файл')
+    parser.add_argument('--compare', help='JSON предыдущего прогона: код выхода 1 при регрессии')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.dpi, args.repeat)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+    failed = [result["name"] for result in report["results"] if not result["ok"]]
+    if failed:
+        print(f"\n❌ Пустые страницы в настройках: {', '.join(failed)}")
+
+    regressions = []
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f))
+        for regression in regressions:
+            print(f"⚠️ Регрессия: {regression}")
+
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк паттернов парсера на враждебных (adversarial) текстах
+
+Для каждого паттерна реестра PATTERNS (и вспомогательных _RE_* выражений)
+генерируются худшие для регулярных выражений тексты нескольких размеров:
+  - words_line   ключевые слова паттерна, повторённые в одной длинной строке
+                 без завершающих токенов (№, цифр, кавычек) - как OCR-дамп без переносов
+  - words_lines  то же, но каждое повторение с новой строки (проверка DOTALL и [\\s\\w]*)
+  - digits_line  ключевые слова + длинные группы цифр "1 000 000 ..." без "руб"
+  - quotes_line  ключевые слова + открывающие кавычки без закрывающих
+  - ocr_dump     вперемешку все ключевые слова реестра, №, цифры и кавычки
+
+Паттерн прогоняется findall по всему тексту (худший случай - якоря покрывают весь
+документ). По времени на размерах n, 2n, 4n, 8n оценивается показатель роста
+(наклон log(время) от log(размера)): больше SUPERLINEAR_EXPONENT - рост
+сверхлинейный, паттерн помечается и бенчмарк завершается с кодом 1. Так же
+помечается паттерн, которому на самом большом тексте не хватило MAX_PATTERN_MS
+(медленный, даже если рост линейный; наклон по четырём точкам бывает шумным).
+Словарь ocr_dump всегда собирается по всем паттернам, поэтому прогон с --only
+меряет те же тексты, что и полный.
+
+  python scripts/benchmark_regex.py
+  python scripts/benchmark_regex.py --only invoice_number --json regex.json
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import argparse
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import ultimate_invoice_parser
+
+# Размеры текстов (символов): n, 2n, 4n, 8n
+SIZES = [2000, 4000, 8000, 16000]
+
+# Показатель роста, выше которого паттерн считается сверхлинейным
+SUPERLINEAR_EXPONENT = 1.5
+
+# Быстрее этого на самом большом тексте - не помечаем: шум таймера важнее наклона
+MIN_FLAG_MS = 2.0
+
+# Бюджет паттерна на самом большом тексте (SIZES[-1] символов), мс
+MAX_PATTERN_MS = 200.0
+
+# Если один прогон дольше - большие размеры не запускаем (паттерн уже помечен)
+MAX_RUN_SECONDS = 2.0
+
+_RE_WORD = re.compile(r'[А-ЯЁа-яёA-Za-z]{2,}')
+
+
+def pattern_words(source: str) -> List[str]:
+    """Литеральные слова из исходника паттерна (классы вроде \\s и \\d отбрасываются)"""
+    words = []
+    for word in _RE_WORD.findall(re.sub(r'\\[a-zA-Z]', ' ', source)):
+        if word not in words:
+            words.append(word)
+    return words or ['СЧ', 'СТ']
+
+
+def repeat_to(chunk: str, size: int) -> str:
+    return (chunk * (size // max(len(chunk), 1) + 1))[:size]
+
+
+def build_generators(vocabulary: List[str]) -> Dict[str, Callable[[List[str], int], str]]:
+    dump_chunk = ' '.join(f'{word} № {index % 10} "{word}' for index, word in enumerate(vocabulary)) + ' '
+    return {
+        'words_line': lambda words, size: repeat_to(' '.join(words) + ' ', size),
+        'words_lines': lambda words, size: repeat_to(' '.join(words) + '\n', size),
+        'digits_line': lambda words, size: repeat_to(' '.join(words) + ' 1 000 000 000 ', size),
+        'quotes_line': lambda words, size: repeat_to(' '.join(f'{word} "' for word in words) + ' ', size),
+        'ocr_dump': lambda words, size: repeat_to(dump_chunk, size),
+    }
+
+
+def time_findall(regex: 're.Pattern', text: str, repeat: int = 3) -> float:
+    """Лучшее из repeat время findall по тексту, секунды"""
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        regex.findall(text)
+        best = min(best, time.perf_counter() - started)
+        if best > MAX_RUN_SECONDS:
+            break
+    return best
+
+
+def growth_exponent(sizes: List[int], seconds: List[float]) -> float:
+    """Наклон log(время) от log(размера) методом наименьших квадратов"""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in seconds]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return numerator / denominator if denominator else 0.0
+
+
+def collect_regexes(only: List[str]) -> Dict[str, 're.Pattern']:
+    regexes = {}
+    for group, patterns in ultimate_invoice_parser.PATTERNS.items():
+        if only and group not in only:
+            continue
+        for pattern in patterns:
+            regexes[pattern.id] = pattern.regex
+    if not only:
+        for name, value in vars(ultimate_invoice_parser).items():
+            if name.startswith('_RE_') and isinstance(value, re.Pattern):
+                regexes[name] = value
+    return regexes
+
+
+def benchmark_regex(regex: 're.Pattern', generators: Dict[str, Callable]) -> Dict[str, Any]:
+    words = pattern_words(regex.pattern)
+    families = {}
+    for family, generate in generators.items():
+        sizes, seconds = [], []
+        for size in SIZES:
+            elapsed = time_findall(regex, generate(words, size))
+            sizes.append(size)
+            seconds.append(elapsed)
+            if elapsed > MAX_RUN_SECONDS:
+                break
+
+        # Один размер (сразу упёрлись в лимит) - наклон не посчитать, считаем сверхлинейным
+        exponent = growth_exponent(sizes, seconds) if len(sizes) > 1 else math.inf
+        max_ms = seconds[-1] * 1000
+        families[family] = {
+            "sizes": sizes,
+            "ms": [round(value * 1000, 3) for value in seconds],
+            "exponent": round(exponent, 2) if exponent != math.inf else None,
+            "superlinear": exponent > SUPERLINEAR_EXPONENT and max_ms > MIN_FLAG_MS,
+            # Не дошли до самого большого размера - тоже вне бюджета
+            "over_budget": sizes[-1] < SIZES[-1] or max_ms > MAX_PATTERN_MS
+        }
+
+    worst = max(families.items(), key=lambda item: item[1]["ms"][-1])
+    return {
+        "superlinear": any(family["superlinear"] for family in families.values()),
+        "over_budget": any(family["over_budget"] for family in families.values()),
+        "worst_family": worst[0],
+        "worst_ms": worst[1]["ms"][-1],
+        "families": families
+    }
+
+
+def run_benchmark(only: List[str]) -> Dict[str, Any]:
+    regexes = collect_regexes(only)
+    vocabulary = []
+    for regex in collect_regexes([]).values():
+        for word in pattern_words(regex.pattern):
+            if word not in vocabulary:
+                vocabulary.append(word)
+    generators = build_generators(vocabulary)
+
+    results = {}
+    for name, regex in regexes.items():
+        results[name] = benchmark_regex(regex, generators)
+
+    return {
+        "benchmark": "regex",
+        "python": sys.version.split()[0],
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "sizes": SIZES,
+        "superlinear_exponent": SUPERLINEAR_EXPONENT,
+        "max_pattern_ms": MAX_PATTERN_MS,
+        "results": results
+    }
+
+
+def print_report(report: Dict[str, Any], verbose: bool) -> None:
+    flagged = {name: result for name, result in report["results"].items()
+               if result["superlinear"] or result["over_budget"]}
+    size = report["sizes"][-1]
+    superlinear = sum(1 for result in flagged.values() if result["superlinear"])
+    over_budget = sum(1 for result in flagged.values() if result["over_budget"])
+    print(f"Паттернов: {len(report['results'])}, сверхлинейных: {superlinear}, "
+          f"дольше {report['max_pattern_ms']:.0f} мс: {over_budget} (тексты до {size} символов)")
+
+    rows = report["results"].items() if verbose else flagged.items()
+    for name, result in sorted(rows, key=lambda item: item[1]["worst_ms"], reverse=True):
+        mark = '❌' if result["superlinear"] or result["over_budget"] else '  '
+        print(f"{mark} {name:45} худший: {result['worst_family']:12} {result['worst_ms']:>10.2f} мс")
+        for family, data in result["families"].items():
+            if data["superlinear"] or data["over_budget"]:
+                ms = ' -> '.join(f"{value:.2f}" for value in data["ms"])
+                print(f"     {family:12} показатель {data['exponent']}, мс: {ms}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк паттернов парсера на враждебных текстах')
+    parser.add_argument('--only', nargs='+', help='Только эти группы PATTERNS (например invoice_number)')
+    parser.add_argument('--verbose', action='store_true', help='Показать все паттерны, а не только сверхлинейные')
+    parser.add_argument('--json', help='Сохранить результаты в JSON файл')
+    parser.add_argument('--compare', help='JSON предыдущего прогона (не используется: регрессия - любой сверхлинейный или медленный паттерн)')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.only or [])
+    print_report(report, args.verbose)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+    failed = any(result["superlinear"] or result["over_budget"] for result in report["results"].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
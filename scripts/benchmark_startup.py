@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк холодного старта Python-скриптов пайплайна распознавания
+
+Каждый скрипт запускается отдельным процессом `python -X importtime ...` на
+файле из test-invoices, как его запускает API. Замеряется:
+  - время до первого байта JSON на stdout (запуск интерпретатора + импорты + работа)
+  - полное время работы процесса
+  - суммарное время импортов и самые тяжёлые импорты верхнего уровня (по -X importtime)
+
+Запуск:
+  python scripts/benchmark_startup.py
+  python scripts/benchmark_startup.py --runs 10 --json startup.json
+  python scripts/benchmark_startup.py --compare old_startup.json   # код 1 при регрессии
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = PROJECT_ROOT / 'python-scripts'
+TEST_INVOICES_DIR = PROJECT_ROOT / 'test-invoices'
+
+# Регрессия: медиана времени до первого байта выросла больше чем на 25% и на 50 мс
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_MS = 50.0
+
+
+def make_docx_sample(temp_dir: str) -> Optional[str]:
+    """В test-invoices нет .docx - собираем небольшой счёт через python-docx"""
+    try:
+        from docx import Document
+    except ImportError:
+        return None
+
+    document = Document()
+    document.add_paragraph('Счет на оплату № 15 от 01.02.2025')
+    document.add_paragraph('Поставщик: ООО "Ромашка", ИНН 7812345678')
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = 'Итого к оплате:'
+    table.cell(0, 1).text = '1 200,00'
+    path = os.path.join(temp_dir, 'sample.docx')
+    document.save(path)
+    return path
+
+
+def first_file(pattern: str) -> Optional[str]:
+    files = sorted(TEST_INVOICES_DIR.glob(pattern))
+    return str(files[0]) if files else None
+
+
+def build_cases(temp_dir: str) -> List[Dict[str, Any]]:
+    """Сценарии запуска: имя (скрипт.формат входа) и аргументы командной строки"""
+    pdf = first_file('*.pdf')
+    xls = first_file('*.xls')
+    xlsx = first_file('*.xlsx')
+    docx = make_docx_sample(temp_dir)
+
+    text_file = os.path.join(temp_dir, 'invoice.txt')
+    with open(text_file, 'w', encoding='utf-8') as f:
+        f.write('Счет на оплату № 15 от 01.02.2025\nПоставщик: ООО "Ромашка" ИНН 7812345678\nИтого: 1 200,00\n')
+
+    office = str(SCRIPTS_DIR / 'office_to_text.py')
+    cases = [
+        {"name": "office_to_text.docx", "args": [office, docx]},
+        {"name": "office_to_text.xls", "args": [office, xls]},
+        {"name": "office_to_text.xlsx", "args": [office, xlsx]},
+        {"name": "pdf_extract_text.pdf", "args": [str(SCRIPTS_DIR / 'pdf_extract_text.py'), pdf]},
+        {"name": "pdf_to_png.pdf", "args": [str(SCRIPTS_DIR / 'pdf_to_png.py'), pdf,
+                                            '--output-dir', os.path.join(temp_dir, 'pages')]},
+        {"name": "ultimate_invoice_parser.txt", "args": [str(PROJECT_ROOT / 'ultimate_invoice_parser.py'),
+                                                         '--file', text_file, '--output-format', 'json']},
+    ]
+    # Сценарии без входного файла (нет образца или библиотеки) пропускаем
+    return [case for case in cases if all(case["args"])]
+
+
+def parse_importtime(stderr_text: str) -> Dict[str, Any]:
+    """Разбирает вывод -X importtime: суммарное время и тяжёлые импорты верхнего уровня"""
+    top_level = []
+    for line in stderr_text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        cumulative_us, name = int(parts[1]), parts[2]
+        # Импорты верхнего уровня идут с одним пробелом после "|", вложенные - с отступом
+        if not name.startswith('  '):
+            top_level.append((name.strip(), cumulative_us))
+
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "import_ms": round(sum(us for _, us in top_level) / 1000, 2),
+        "top_imports": [{"module": module, "ms": round(us / 1000, 2)} for module, us in top_level[:5]]
+    }
+
+
+def run_once(args: List[str]) -> Dict[str, Any]:
+    """Один холодный запуск: время до первого байта stdout, полное время, импорты"""
+    with tempfile.TemporaryFile() as stderr_file:
+        # stderr в файл: вывод importtime может переполнить pipe, пока мы ждём stdout
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-X', 'importtime', *args],
+                                   stdout=subprocess.PIPE, stderr=stderr_file, cwd=PROJECT_ROOT)
+        first_byte = process.stdout.read(1)
+        first_byte_ms = (time.perf_counter() - started) * 1000
+        output = first_byte + process.stdout.read()
+        process.wait()
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        stderr_file.seek(0)
+        stderr_text = stderr_file.read().decode('utf-8', errors='replace')
+
+    try:
+        json.loads(output.decode('utf-8'))
+        json_ok = True
+    except ValueError:
+        json_ok = False
+
+    return {
+        "first_byte_ms": first_byte_ms,
+        "wall_ms": wall_ms,
+        "exit_code": process.returncode,
+        "json_ok": json_ok,
+        **parse_importtime(stderr_text)
+    }
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "median": round(statistics.median(values), 2),
+        "min": round(min(values), 2),
+        "max": round(max(values), 2)
+    }
+
+
+def run_benchmark(runs: int) -> Dict[str, Any]:
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for case in build_cases(temp_dir):
+            # Первый запуск прогревает файловый кэш ОС и __pycache__, в статистику не идёт
+            run_once(case["args"])
+            samples = [run_once(case["args"]) for _ in range(runs)]
+            last = samples[-1]
+            results.append({
+                "name": case["name"],
+                "runs": runs,
+                "first_byte_ms": summarize([s["first_byte_ms"] for s in samples]),
+                "wall_ms": summarize([s["wall_ms"] for s in samples]),
+                "import_ms": summarize([s["import_ms"] for s in samples]),
+                "top_imports": last["top_imports"],
+                "exit_code": last["exit_code"],
+                "json_ok": all(s["json_ok"] for s in samples)
+            })
+
+    return {
+        "benchmark": "startup",
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": results
+    }
+
+
+def find_regressions(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(result["name"])
+        if not old:
+            continue
+        new_ms = result["first_byte_ms"]["median"]
+        old_ms = old["first_byte_ms"]["median"]
+        if new_ms > old_ms * REGRESSION_RATIO and new_ms - old_ms > REGRESSION_MIN_MS:
+            regressions.append(f"{result['name']}: {old_ms:.0f} -> {new_ms:.0f} мс до первого байта")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'Сценарий':32} {'1-й байт, мс':>13} {'всего, мс':>10} {'импорты, мс':>12}  JSON  Самый тяжёлый импорт")
+    for result in report["results"]:
+        heaviest = result["top_imports"][0] if result["top_imports"] else None
+        heaviest_text = f"{heaviest['module']} ({heaviest['ms']:.0f} мс)" if heaviest else '-'
+        print(f"{result['name']:32} {result['first_byte_ms']['median']:>13.0f} "
+              f"{result['wall_ms']['median']:>10.0f} {result['import_ms']['median']:>12.0f}  "
+              f"{'ok' if result['json_ok'] else 'НЕТ':4}  {heaviest_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк холодного старта Python-скриптов')
+    parser.add_argument('--runs', type=int, default=5, help='Число замеров на сценарий (по умолчанию 5)')
+    parser.add_argument('--json', help='Сохранить результаты в JSON файл')
+    parser.add_argument('--compare', help='JSON предыдущего прогона: код выхода 1 при регрессии')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.runs)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+    failed = [result["name"] for result in report["results"] if not result["json_ok"]]
+    if failed:
+        print(f"\n❌ Нет корректного JSON на stdout: {', '.join(failed)}")
+
+    regressions = []
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f))
+        for regression in regressions:
+            print(f"⚠️ Регрессия старта: {regression}")
+
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Набор бенчмарков пайплайна распознавания счетов
+
+Запускает все бенчмарки из BENCHMARKS, сохраняет их JSON в папку результатов
+и, если задана папка с результатами предыдущего прогона, сравнивает с ней
+(каждый бенчмарк сам решает, что считать регрессией, и возвращает код 1).
+
+  python scripts/run_benchmarks.py
+  python scripts/run_benchmarks.py --baseline-dir .cache/benchmarks/main
+  python scripts/run_benchmarks.py --only startup
+  python scripts/run_benchmarks.py --only corpus
+  python scripts/run_benchmarks.py --only excel_items
+  python scripts/run_benchmarks.py --only batch_client
+  python scripts/run_benchmarks.py --only page_encoding
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPTS_DIR.parent
+
+DEFAULT_OUTPUT_DIR = PROJECT_ROOT / '.cache' / 'benchmarks' / 'latest'
+
+# Имя бенчмарка -> скрипт (поддерживает --json <файл> и --compare <файл>)
+BENCHMARKS = {
+    'startup': 'benchmark_startup.py',
+    'corpus': 'benchmark_corpus.py',
+    'regex': 'benchmark_regex.py',
+    'excel_items': 'benchmark_excel_items.py',
+    'batch_client': 'benchmark_batch_client.py',
+    'page_encoding': 'benchmark_page_encoding.py',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Набор бенчмарков пайплайна распознавания')
+    parser.add_argument('--output-dir', default=str(DEFAULT_OUTPUT_DIR), help='Папка для JSON результатов')
+    parser.add_argument('--baseline-dir', help='Папка с JSON предыдущего прогона для сравнения')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Запустить только эти бенчмарки')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = []
+
+    for name in args.only or BENCHMARKS:
+        print("=" * 60)
+        print(f"⏱️  Бенчмарк: {name}")
+        print("=" * 60)
+
+        command = [sys.executable, str(SCRIPTS_DIR / BENCHMARKS[name]),
+                   '--json', os.path.join(args.output_dir, f'{name}.json')]
+        if args.baseline_dir:
+            baseline = os.path.join(args.baseline_dir, f'{name}.json')
+            if os.path.exists(baseline):
+                command += ['--compare', baseline]
+
+        if subprocess.run(command, cwd=PROJECT_ROOT).returncode != 0:
+            failed.append(name)
+        print()
+
+    if failed:
+        print(f"❌ Бенчмарки с ошибками или регрессиями: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"✅ Все бенчмарки пройдены, результаты: {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,81 +4,63 @@
 Автоматическая обработка всех счетов через /api/smart-invoice
 """
 
-import requests
+import sys
 import json
-import time
 from pathlib import Path
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from api_batch_client import DEFAULT_CONCURRENCY, check_server, process_batch
+
 API_URL = "http://localhost:3000/api/smart-invoice"
+REQUEST_TIMEOUT = 120
 
-def process_invoice_via_api(file_path):
-    """Отправляет файл в API для распознавания"""
-    filename = file_path.name
+def result_to_row(result):
+    """Печатает результат распознавания одного файла и возвращает строку таблицы"""
+    filename = result['filename']
     print(f"\n📄 {filename}")
-    
-    # Пропускаем изображения JPEG (для них нужен отдельный OCR)
-    if file_path.suffix.lower() in ['.jpeg', '.jpg']:
-        print("  ⏭️  Пропускаем изображение")
-        return None
-    
-    try:
-        with open(file_path, 'rb') as f:
-            files = {
-                'file': (filename, f, 'application/octet-stream')
-            }
-            
-            print(f"  📤 Отправка в API...")
-            response = requests.post(API_URL, files=files, timeout=120)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                invoice = result.get('invoice', {})
-                contractor = result.get('contractor', {})
-                
-                print(f"  ✅ Распознано:")
-                print(f"     Номер: {invoice.get('number')}")
-                print(f"     Дата: {invoice.get('date')}")
-                print(f"     Контрагент: {contractor.get('name')}")
-                print(f"     Сумма: {invoice.get('total_amount')}")
-                print(f"     НДС: {invoice.get('vat_amount')}")
-                
-                return {
-                    'Файл': filename,
-                    'Номер счета (API)': invoice.get('number'),
-                    'Дата (API)': invoice.get('date'),
-                    'Контрагент (API)': contractor.get('name'),
-                    'Сумма (API)': invoice.get('total_amount'),
-                    'НДС (API)': invoice.get('vat_amount'),
-                    'ИНН (API)': contractor.get('inn'),
-                    'Статус': 'Успешно'
-                }
-            else:
-                error_text = response.text[:200]
-                print(f"  ❌ Ошибка API: {response.status_code}")
-                print(f"     {error_text}")
-                return {
-                    'Файл': filename,
-                    'Статус': f'Ошибка {response.status_code}',
-                    'Ошибка': error_text
-                }
-                
-    except requests.exceptions.ConnectionError:
-        print(f"  ❌ Не удается подключиться к API")
-        print(f"     Убедитесь, что сервер запущен на http://localhost:3000")
+
+    if result['status'] == 200:
+        data = result['data'] or {}
+        invoice = data.get('invoice', {})
+        contractor = data.get('contractor', {})
+
+        print(f"  ✅ Распознано:")
+        print(f"     Номер: {invoice.get('number')}")
+        print(f"     Дата: {invoice.get('date')}")
+        print(f"     Контрагент: {contractor.get('name')}")
+        print(f"     Сумма: {invoice.get('total_amount')}")
+        print(f"     НДС: {invoice.get('vat_amount')}")
+
         return {
             'Файл': filename,
-            'Статус': 'Нет подключения к серверу'
+            'Номер счета (API)': invoice.get('number'),
+            'Дата (API)': invoice.get('date'),
+            'Контрагент (API)': contractor.get('name'),
+            'Сумма (API)': invoice.get('total_amount'),
+            'НДС (API)': invoice.get('vat_amount'),
+            'ИНН (API)': contractor.get('inn'),
+            'Статус': 'Успешно'
         }
-    except Exception as e:
-        print(f"  ❌ Ошибка: {str(e)}")
+
+    if result['status'] is None:
+        print(f"  ❌ Ошибка: {result['error']}")
         return {
             'Файл': filename,
             'Статус': 'Ошибка',
-            'Ошибка': str(e)
+            'Ошибка': result['error']
         }
 
+    error_text = str((result['data'] or {}).get('error') or result['error'] or '')[:200]
+    print(f"  ❌ Ошибка API: {result['status']}")
+    print(f"     {error_text}")
+    return {
+        'Файл': filename,
+        'Статус': f'Ошибка {result["status"]}',
+        'Ошибка': error_text
+    }
+
 def main():
     invoices_dir = Path('/Users/stanislavtkachev/Dropbox/Glazing CRM/ProjectCRM/docs/invoices')
     
@@ -88,16 +70,17 @@ def main():
     print("=" * 80)
     
     # Проверяем доступность API
-    try:
-        test_response = requests.get("http://localhost:3000", timeout=5)
+    if check_server(API_URL):
         print("\n✅ Сервер доступен")
-    except:
+    else:
         print("\n❌ Сервер недоступен!")
         print("   Запустите сервер: npm run dev")
         return
     
     results = []
     files = sorted([f for f in invoices_dir.iterdir() if f.is_file()])
+    # Пропускаем изображения JPEG (для них нужен отдельный OCR)
+    to_send = [f for f in files if f.suffix.lower() not in ['.jpeg', '.jpg']]
     
     print(f"\n📁 Найдено файлов: {len(files)}")
     print("=" * 80)
@@ -108,23 +91,20 @@ def main():
     # Создаем промежуточные сохранения каждые 5 файлов
     batch_size = 5
     
-    for idx, file_path in enumerate(files, 1):
-        print(f"\n[{idx}/{len(files)}] ⏳ Обрабатываю...")
-        result = process_invoice_via_api(file_path)
-        
-        if result:
-            results.append(result)
+    # Файлы отправляются параллельно (keep-alive, повторы с backoff), результаты - по мере готовности
+    def on_result(result):
+        results.append(result_to_row(result))
+        done = len(results)
         
         # Промежуточное сохранение
-        if idx % batch_size == 0 or idx == len(files):
+        if done % batch_size == 0 or done == len(to_send):
             temp_df = pd.DataFrame(results)
-            temp_output = f'docs/invoices/результаты_API_temp_{idx}.csv'
+            temp_output = f'docs/invoices/результаты_API_temp_{done}.csv'
             temp_df.to_csv(temp_output, index=False, encoding='utf-8-sig')
-            print(f"\n💾 Промежуточное сохранение: {idx}/{len(files)} файлов")
-        
-        # Короткая пауза между запросами
-        if idx < len(files):
-            time.sleep(1)
+            print(f"\n💾 Промежуточное сохранение: {done}/{len(to_send)} файлов")
+    
+    process_batch(to_send, on_result=on_result, url=API_URL, concurrency=DEFAULT_CONCURRENCY,
+                  timeout=REQUEST_TIMEOUT)
     
     # Сохраняем результаты
     print("\n" + "=" * 80)
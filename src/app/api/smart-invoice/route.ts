@@ -5,8 +5,6 @@
 
 import { NextRequest, NextResponse } from 'next/server';
 import { ImageAnnotatorClient } from '@google-cloud/vision';
-import { exec, spawn } from 'child_process';
-import { promisify } from 'util';
 import path from 'path';
 import fs from 'fs/promises';
 import { createClient } from '@supabase/supabase-js';
@@ -14,8 +12,7 @@ import type { Invoice, CreateInvoice, ParsedInvoiceData } from '@/types/invoice'
 import type { Supplier, CreateSupplier } from '@/types/supplier';
 import { v4 as uuidv4 } from 'uuid';
 import { logger } from '@/lib/logger';
-
-const execAsync = promisify(exec);
+import { pythonWorker } from '@/lib/python-worker';
 
 // ============================================
 // Конфигурация
@@ -30,6 +27,9 @@ const vision = new ImageAnnotatorClient({
   keyFilename: credentialsPath,
 });
 
+// Доля запросов, для которых парсер возвращает _meta.timings (0 - выключено, 1 - все)
+const PARSE_TIMINGS_SAMPLE_RATE = parseFloat(process.env.PARSE_TIMINGS_SAMPLE_RATE || '0');
+
 // Supabase с service_role ключом для записи
 const supabase = createClient(
   process.env.NEXT_PUBLIC_SUPABASE_URL!,
@@ -228,7 +228,8 @@ async function uploadFileToStorage(
 // ============================================
 // Функция: Конвертация PDF в изображения (все страницы)
 // ============================================
-async function convertPdfToImages(pdfBuffer: Buffer): Promise<any[]> {
+// Страницы пишутся PNG-файлами в pagesDir (без base64 в JSON), вызывающий удаляет папку
+async function convertPdfToImages(pdfBuffer: Buffer, pagesDir: string): Promise<any[]> {
   const tempDir = path.join(process.cwd(), 'temp');
   await fs.mkdir(tempDir, { recursive: true });
   
@@ -240,15 +241,11 @@ async function convertPdfToImages(pdfBuffer: Buffer): Promise<any[]> {
     await fs.writeFile(tempPdfPath, pdfBuffer);
     console.log(`💾 Временный PDF: ${tempPdfPath}`);
     
-    // Путь к Python скрипту
-    const scriptPath = path.join(process.cwd(), 'python-scripts', 'pdf_to_png.py');
-    // Используем python3 для Linux/Mac, python для Windows
-    const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
-    
     logger.info(`Конвертация PDF в PNG (все страницы)`, { tempId, dpi: 200 });
     
-    // Запускаем Python скрипт
-    const result = await runPdfToPngScript(pythonExecutable, scriptPath, tempPdfPath, 200);
+    // Конвертируем в Python воркере
+    // Страницы из кэша OCR приходят с ocr_text без картинки - extractTextFromImage их принимает
+    const result = await renderPdfInWorker(tempPdfPath, 200, pagesDir, true);
     
     // Удаляем временный файл
     try {
@@ -262,6 +259,7 @@ async function convertPdfToImages(pdfBuffer: Buffer): Promise<any[]> {
     }
 
     console.log(`📄 PDF содержит ${result.images.length} страниц(ы)`);
+    logOcrCache(result.ocr_cache);
     return result.images;
     
   } catch (error) {
@@ -280,21 +278,17 @@ async function convertPdfToImage(pdfBuffer: Buffer): Promise<Buffer> {
   
   const tempId = uuidv4();
   const tempPdfPath = path.join(tempDir, `${tempId}.pdf`);
+  const pagesDir = path.join(tempDir, `${tempId}_pages`);
   
   try {
     // Сохраняем PDF во временный файл
     await fs.writeFile(tempPdfPath, pdfBuffer);
     console.log(`💾 Временный PDF: ${tempPdfPath}`);
     
-    // Путь к Python скрипту
-    const scriptPath = path.join(process.cwd(), 'python-scripts', 'pdf_to_png.py');
-    // Используем python3 для Linux/Mac, python для Windows
-    const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
-    
     logger.info(`Конвертация PDF в PNG (первая страница)`, { dpi: 200 });
     
-    // Запускаем Python скрипт
-    const result = await runPdfToPngScript(pythonExecutable, scriptPath, tempPdfPath, 200);
+    // Конвертируем в Python воркере
+    const result = await renderPdfInWorker(tempPdfPath, 200, pagesDir);
     
     // Удаляем временный файл
     try {
@@ -312,7 +306,7 @@ async function convertPdfToImage(pdfBuffer: Buffer): Promise<Buffer> {
     // Если несколько страниц - объединяем их вертикально или берем все для OCR
     // Для простоты - возвращаем первую страницу, а OCR запустим на всех
     const firstPage = result.images[0];
-    const imageBuffer = Buffer.from(firstPage.base64, 'base64');
+    const imageBuffer = await fs.readFile(firstPage.filepath);
     
     // Сохраняем все страницы для использования в OCR (если нужно)
     // TODO: В будущем можно обрабатывать все страницы через OCR отдельно
@@ -323,87 +317,39 @@ async function convertPdfToImage(pdfBuffer: Buffer): Promise<Buffer> {
   } catch (error) {
     console.error('❌ Ошибка конвертации PDF:', error);
     throw error;
+  } finally {
+    await fs.rm(pagesDir, { recursive: true, force: true }).catch(() => {});
   }
 }
 
-function runPdfToPngScript(pythonPath: string, scriptPath: string, pdfPath: string, dpi: number): Promise<any> {
-  return new Promise((resolve, reject) => {
-    console.log(`🚀 Запуск Python конвертера PDF → PNG`);
-    
-    const args = [
-      scriptPath,
-      pdfPath,
-      '--dpi', dpi.toString()
-    ];
-    
-    const python = spawn(pythonPath, args);
-    
-    let stdout = '';
-    let stderr = '';
-    
-    python.stdout.on('data', (data) => {
-      stdout += data.toString();
-    });
-    
-    python.stderr.on('data', (data) => {
-      stderr += data.toString();
-    });
-    
-    python.on('close', (code) => {
-      console.log(`🔍 Python завершен с кодом: ${code}`);
-      console.log(`📤 STDOUT (${stdout.length} символов):`, stdout.substring(0, 500));
-      console.log(`📤 STDERR (${stderr.length} символов):`, stderr.substring(0, 500));
-      
-      logger.info(`Python скрипт завершен`, { 
-        code, 
-        stdoutLength: stdout.length, 
-        stderrLength: stderr.length,
-        stdoutPreview: stdout.substring(0, 200),
-        stderrPreview: stderr.substring(0, 200)
-      });
-      
-      if (code !== 0) {
-        console.error(`❌ Python скрипт завершился с ошибкой (код ${code}):`, stderr);
-        logger.error(`Python скрипт завершился с ошибкой`, { code, stderr });
-        resolve({ success: false, error: stderr || 'Ошибка выполнения Python скрипта' });
-        return;
-      }
-      
-      try {
-        // Парсим весь stdout как JSON
-        // Python может выводить многострочный JSON
-        const result = JSON.parse(stdout.trim());
-        logger.info(`Python результат распарсен успешно`, { success: result.success });
-        resolve(result);
-      } catch (error) {
-        console.error('❌ Ошибка парсинга JSON от Python:', error);
-        console.error('Вывод:', stdout);
-        logger.error(`Ошибка парсинга JSON от Python`, { 
-          error: String(error), 
-          stdout: stdout.substring(0, 1000),
-          stderr: stderr.substring(0, 1000)
-        });
-        resolve({ success: false, error: 'Ошибка парсинга результата Python скрипта' });
-      }
-    });
-    
-    python.on('error', (error) => {
-      console.error('❌ Ошибка запуска Python процесса:', error);
-      logger.error(`Ошибка запуска Python процесса`, { 
-        error: String(error),
-        pythonPath,
-        scriptPath,
-        pdfPath
-      });
-      reject(error);
+// Страницы для OCR - PNG в оттенках серого: вдвое меньше и быстрее RGB, распознаётся так же
+// (замеры по настройкам - scripts/benchmark_page_encoding.py)
+const OCR_PAGE_ENCODING = { colorspace: 'gray', format: 'png' };
+
+// ocrCache: страницы из кэша OCR приходят с ocr_text и без filepath - только для вызывающих,
+// которые это обрабатывают
+async function renderPdfInWorker(pdfPath: string, dpi: number, outputDir: string, ocrCache = false): Promise<any> {
+  console.log(`🚀 Конвертация PDF → PNG в Python воркере`);
+  
+  try {
+    const result = await pythonWorker.request('render_pdf', {
+      path: pdfPath, dpi, output_dir: outputDir, ocr_cache: ocrCache, ...OCR_PAGE_ENCODING,
     });
-  });
+    logger.info(`Python воркер: PDF конвертирован`, { success: result.success, pageCount: result.page_count });
+    return result;
+  } catch (error) {
+    console.error('❌ Ошибка Python воркера при конвертации PDF:', error);
+    logger.error(`Ошибка Python воркера при конвертации PDF`, { error: String(error), pdfPath });
+    return { success: false, error: String(error) };
+  }
 }
 
 // ============================================
-// Функция: Извлечение текста из PDF через PyMuPDF (без OCR)
+// Функция: Постраничный разбор PDF через PyMuPDF (текстовый слой или OCR)
 // ============================================
-async function extractTextFromPdfDirect(buffer: Buffer): Promise<{ success: boolean; text?: string; needsOcr: boolean }> {
+// Один проход по PDF: страницы с текстовым слоем возвращаются текстом, в pagesDir
+// рендерятся только страницы без текста (сканы) - их отправляем в OCR
+async function extractTextFromPdfHybrid(buffer: Buffer, pagesDir: string): Promise<any | null> {
   const tempDir = path.join(process.cwd(), 'temp');
   await fs.mkdir(tempDir, { recursive: true });
   
@@ -413,95 +359,130 @@ async function extractTextFromPdfDirect(buffer: Buffer): Promise<{ success: bool
   try {
     await fs.writeFile(tempPdfPath, buffer);
     
-    const scriptPath = path.join(process.cwd(), 'python-scripts', 'pdf_extract_text.py');
-    const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
-    
-    return new Promise((resolve) => {
-      const python = spawn(pythonExecutable, [scriptPath, tempPdfPath, '--min-chars', '50']);
-      
-      let stdout = '';
-      let stderr = '';
-      
-      python.stdout.on('data', (data) => { stdout += data.toString(); });
-      python.stderr.on('data', (data) => { stderr += data.toString(); });
-      
-      python.on('close', async (code) => {
-        // Удаляем временный файл
-        try { await fs.unlink(tempPdfPath); } catch {}
-        
-        if (code !== 0) {
-          console.log('⚠️ PyMuPDF extraction failed, will use OCR');
-          resolve({ success: false, needsOcr: true });
-          return;
-        }
-        
-        try {
-          const result = JSON.parse(stdout.trim());
-          if (result.success && !result.needs_ocr && result.text) {
-            console.log(`✅ PyMuPDF извлёк ${result.char_count} символов напрямую (без OCR)`);
-            resolve({ success: true, text: result.text, needsOcr: false });
-          } else {
-            console.log(`📄 PDF требует OCR: ${result.reason || 'нет текстового слоя'}`);
-            resolve({ success: true, needsOcr: true });
-          }
-        } catch {
-          resolve({ success: false, needsOcr: true });
-        }
-      });
-      
-      python.on('error', () => {
-        resolve({ success: false, needsOcr: true });
+    try {
+      // lazy: страницы читаются, пока парсер не найдёт номер, дату, поставщика, сумму, НДС и ИНН
+      // layout: итог, НДС и ИНН поставщика по координатам слов (layout_fields)
+      const result = await pythonWorker.request('extract_pdf_hybrid', {
+        path: tempPdfPath,
+        dpi: 200,
+        output_dir: pagesDir,
+        lazy: true,
+        layout: true,
+        ocr_cache: true,
+        ...OCR_PAGE_ENCODING,
       });
-    });
+      if (!result.success || !result.pages) {
+        console.log(`⚠️ PyMuPDF не смог разобрать PDF: ${result.error}`);
+        return null;
+      }
+      if (result.pages_skipped > 0) {
+        console.log(`⏭️ Поля счёта найдены на ${result.pages_read} из ${result.pages_total} страниц, ` +
+          `пропущено ${result.pages_skipped}`);
+      }
+      return result;
+    } catch {
+      console.log('⚠️ PyMuPDF extraction failed, will use OCR');
+      return null;
+    } finally {
+      // Удаляем временный файл
+      try { await fs.unlink(tempPdfPath); } catch {}
+    }
   } catch (error) {
     console.error('❌ Ошибка извлечения текста из PDF:', error);
-    return { success: false, needsOcr: true };
+    return null;
+  }
+}
+
+// Страницы, уже распознанные раньше (тот же page_hash), приходят из рендера с ocr_text
+function logOcrCache(stats: any) {
+  if (stats?.enabled && stats.hits + stats.misses > 0) {
+    console.log(`🗂️ Кэш OCR страниц: ${stats.hits} из ${stats.hits + stats.misses} ` +
+      `(${Math.round(stats.hit_rate * 100)}%)`);
   }
 }
 
+// Текст OCR страницы сохраняется по её отпечатку, чтобы повторная страница не шла в Google Vision
+async function storePageOcr(pageHash: string | undefined, text: string): Promise<void> {
+  if (!pageHash || !text) return;
+  try {
+    await pythonWorker.request('page_ocr_store', { page_hash: pageHash, text });
+  } catch (error) {
+    console.warn('⚠️ Не удалось сохранить OCR страницы в кэш:', error);
+  }
+}
+
+async function ocrImageFile(filepath: string): Promise<string> {
+  const pageBuffer = await fs.readFile(filepath);
+  const [result] = await vision.textDetection({
+    image: { content: pageBuffer },
+  });
+  
+  const detections = result.textAnnotations;
+  return detections && detections.length > 0 ? detections[0].description || '' : '';
+}
+
 // ============================================
 // Функция: OCR через Google Vision
 // ============================================
-async function extractTextFromImage(buffer: Buffer, isPdf: boolean = false): Promise<string> {
+// resolved заполняется полями, найденными по координатам слов PDF (только если
+// весь документ прочитан из текстового слоя) - их парсер не ищет регулярками
+async function extractTextFromImage(
+  buffer: Buffer,
+  isPdf: boolean = false,
+  resolved: Record<string, any> = {},
+): Promise<string> {
   try {
-    // Если это PDF, сначала пробуем извлечь текст напрямую (без OCR)
+    // Для PDF берём текстовый слой, а в OCR отправляем только страницы без него
     if (isPdf) {
-      console.log('📄 Пробуем извлечь текст из PDF напрямую (PyMuPDF)...');
-      const directResult = await extractTextFromPdfDirect(buffer);
-      
-      // Если текст успешно извлечён — возвращаем его (OCR не нужен!)
-      if (directResult.success && !directResult.needsOcr && directResult.text) {
-        console.log('✅ Текст извлечён из PDF напрямую — OCR не потребовался!');
-        return directResult.text;
-      }
-      
-      // Если текста нет или его мало — используем OCR
-      console.log('📄 Текстового слоя нет, конвертируем PDF в изображение для OCR...');
-      const pdfResult = await convertPdfToImages(buffer);
-      
-      // Обрабатываем все страницы через OCR
-      console.log(`📄 Обработка ${pdfResult.length} страниц через OCR...`);
+      console.log('📄 Разбираем PDF постранично (PyMuPDF): текстовый слой или OCR...');
+      const pagesDir = path.join(process.cwd(), 'temp', `${uuidv4()}_pages`);
       const allTexts: string[] = [];
+      let pages: any[];
       
-      for (let i = 0; i < pdfResult.length; i++) {
-        console.log(`📄 OCR страница ${i + 1}/${pdfResult.length}...`);
-        const pageBuffer = Buffer.from(pdfResult[i].base64, 'base64');
+      try {
+        const hybrid = await extractTextFromPdfHybrid(buffer, pagesDir);
+        if (hybrid) {
+          pages = hybrid.pages;
+          logOcrCache(hybrid.ocr_cache);
+        } else {
+          // Разбор не удался - как раньше, все страницы через OCR
+          console.log('📄 Конвертируем все страницы PDF в изображения для OCR...');
+          pages = (await convertPdfToImages(buffer, pagesDir)).map((image) => ({ ...image, method: 'ocr' }));
+        }
         
-        const [result] = await vision.textDetection({
-          image: { content: pageBuffer },
-        });
+        const ocrCount = pages.filter((page) => page.method === 'ocr').length;
+        if (ocrCount === 0) {
+          console.log('✅ Текст извлечён из PDF напрямую — OCR не потребовался!');
+          Object.assign(resolved, hybrid?.layout_fields || {});
+        } else {
+          console.log(`📄 OCR нужен для ${ocrCount} из ${pages.length} страниц`);
+        }
         
-        const detections = result.textAnnotations;
-        if (detections && detections.length > 0) {
-          const pageText = detections[0].description || '';
-          allTexts.push(pageText);
-          console.log(`✅ Страница ${i + 1}: извлечено ${pageText.length} символов`);
+        // Собираем текст в порядке страниц (в памяти только текущая страница)
+        for (const page of pages) {
+          if (page.method === 'ocr' && page.ocr_text !== undefined) {
+            allTexts.push(page.ocr_text);
+            console.log(`🗂️ Страница ${page.page}: текст из кэша OCR (${page.ocr_text.length} символов)`);
+          } else if (page.method === 'ocr') {
+            console.log(`📄 OCR страница ${page.page}/${pages.length}...`);
+            const pageText = await ocrImageFile(page.filepath);
+            await storePageOcr(page.page_hash, pageText);
+            if (pageText) {
+              allTexts.push(pageText);
+              console.log(`✅ Страница ${page.page}: извлечено ${pageText.length} символов`);
+            }
+          } else if (page.text && page.text.trim()) {
+            allTexts.push(page.text);
+          }
         }
+        
+        const fullText = allTexts.join('\n\n=== СЛЕДУЮЩАЯ СТРАНИЦА ===\n\n');
+        console.log(`✅ Всего извлечено ${fullText.length} символов из ${pages.length} страниц ` +
+          `(текстовый слой: ${pages.length - ocrCount}, OCR: ${ocrCount})`);
+        return fullText;
+      } finally {
+        await fs.rm(pagesDir, { recursive: true, force: true }).catch(() => {});
       }
-      
-      const fullText = allTexts.join('\n\n=== СЛЕДУЮЩАЯ СТРАНИЦА ===\n\n');
-      console.log(`✅ Всего извлечено ${fullText.length} символов из ${pdfResult.length} страниц`);
-      return fullText;
     }
     
     // Обычное изображение — всегда OCR
@@ -528,7 +509,12 @@ async function extractTextFromImage(buffer: Buffer, isPdf: boolean = false): Pro
 // ============================================
 // Функция: Извлечение текста из Excel
 // ============================================
-async function extractTextFromExcel(buffer: Buffer, filename: string): Promise<string> {
+// resolved заполняется полями из ячеек (позиции, итог, НДС) - для .xlsx/.xls
+async function extractTextFromExcel(
+  buffer: Buffer,
+  filename: string,
+  resolved: Record<string, any> = {},
+): Promise<string> {
   const tempDir = path.join(process.cwd(), 'temp');
   await fs.mkdir(tempDir, { recursive: true });
   
@@ -541,69 +527,29 @@ async function extractTextFromExcel(buffer: Buffer, filename: string): Promise<s
     await fs.writeFile(tempFilePath, buffer);
     console.log(`💾 Временный Excel: ${tempFilePath}`);
     
-    // Путь к Python скрипту
-    const scriptPath = path.join(process.cwd(), 'python-scripts', 'office_to_text.py');
-    const pythonExecutable = process.platform === 'win32' 
-      ? 'python' 
-      : 'python3';
+    logger.info('Извлечение текста из Excel', { filename });
     
-    console.log(`🐍 Запуск Python: ${pythonExecutable} ${scriptPath}`);
-    logger.info('Извлечение текста из Excel', { scriptPath, filename });
+    // Извлекаем текст в Python воркере
+    let result: any;
+    try {
+      result = await pythonWorker.request('office_to_text', { path: tempFilePath });
+    } catch (error) {
+      logger.error('Ошибка Python воркера при извлечении текста из Excel', { error: String(error) });
+      await fs.unlink(tempFilePath).catch(() => {});
+      throw error;
+    }
     
-    // Запускаем Python скрипт
-    const result = await new Promise<any>((resolve, reject) => {
-      const python = spawn(pythonExecutable, [scriptPath, tempFilePath]);
-      
-      let stdout = '';
-      let stderr = '';
-      
-      python.stdout.on('data', (data) => {
-        stdout += data.toString();
-      });
-      
-      python.stderr.on('data', (data) => {
-        stderr += data.toString();
-      });
-      
-      python.on('close', (code) => {
-        console.log(`🔍 office_to_text.py завершен с кодом: ${code}`);
-        console.log(`📤 STDOUT (${stdout.length} символов):`, stdout.substring(0, 500));
-        console.log(`📤 STDERR (${stderr.length} символов):`, stderr.substring(0, 500));
-        
-        logger.info('Python office_to_text завершен', { 
-          code, 
-          stdoutLength: stdout.length, 
-          stderrLength: stderr.length 
-        });
-        
-        if (code !== 0) {
-          logger.error('office_to_text.py завершился с ошибкой', { code, stderr });
-          reject(new Error(stderr || 'Ошибка выполнения office_to_text.py'));
-          return;
-        }
-        
-        try {
-          const result = JSON.parse(stdout.trim());
-          resolve(result);
-        } catch (error) {
-          logger.error('Ошибка парсинга JSON от office_to_text.py', { 
-            error: String(error), 
-            stdout: stdout.substring(0, 1000) 
-          });
-          reject(new Error('Ошибка парсинга JSON от office_to_text.py'));
-        }
-      });
-      
-      python.on('error', (error) => {
-        console.error('❌ Ошибка запуска office_to_text.py:', error);
-        logger.error('Ошибка запуска office_to_text.py', { 
-          error: String(error),
-          pythonPath: pythonExecutable,
-          scriptPath 
-        });
-        reject(error);
-      });
-    });
+    // Поля из ячеек - дополнение к тексту: ошибка их чтения не прерывает разбор
+    if (['xlsx', 'xlsm', 'xls'].includes(fileExt) && !result.error) {
+      try {
+        const fields = await pythonWorker.request('excel_fields', { path: tempFilePath });
+        Object.assign(resolved, fields);
+        console.log(`📋 Из ячеек Excel: позиций ${fields.items?.length ?? 0}, ` +
+          `итог ${fields.total_amount ?? '-'}, НДС ${fields.vat_amount ?? '-'}`);
+      } catch (error) {
+        console.warn('⚠️ Не удалось прочитать позиции из ячеек Excel:', error);
+      }
+    }
     
     // Удаляем временный файл
     try {
@@ -628,45 +574,23 @@ async function extractTextFromExcel(buffer: Buffer, filename: string): Promise<s
 // ============================================
 // Функция: Парсинг через Python скрипт
 // ============================================
-async function parseInvoiceWithPython(text: string): Promise<ParsedInvoiceData> {
+async function parseInvoiceWithPython(
+  text: string,
+  resolved?: Record<string, any>,
+): Promise<ParsedInvoiceData> {
   try {
-    const pythonScript = path.join(process.cwd(), 'ultimate_invoice_parser.py');
-    
-    // Создаем временный файл с текстом
-    const tempTextFile = path.join(process.cwd(), 'temp', `ocr_${Date.now()}.txt`);
-    await fs.writeFile(tempTextFile, text, 'utf-8');
-    
-    const command = `python3 "${pythonScript}" --file "${tempTextFile}" --output-format json`;
-    
-    const { stdout, stderr } = await execAsync(command, {
-      encoding: 'utf-8',
-      maxBuffer: 10 * 1024 * 1024,
+    // Парсим в Python воркере - текст передаётся напрямую, без временного файла
+    const timings = Math.random() < PARSE_TIMINGS_SAMPLE_RATE;
+    const hasResolved = resolved && Object.keys(resolved).length > 0;
+    const parsed = await pythonWorker.request('parse', {
+      text,
+      timings,
+      ...(hasResolved ? { resolved } : {}),
     });
-    
-    // Удаляем временный файл
-    await fs.unlink(tempTextFile).catch(() => {});
-    
-    if (stderr) {
-      console.warn('⚠️ Python stderr:', stderr);
-    }
-    
-    console.log('📄 Python stdout (первые 500 символов):', stdout.substring(0, 500));
-    console.log('📏 Python stdout длина:', stdout.length);
-    
-    // Python скрипт может выводить отладочные сообщения, поэтому извлекаем только JSON
-    // JSON начинается с { и заканчивается }
-    const jsonStart = stdout.indexOf('{');
-    const jsonEnd = stdout.lastIndexOf('}');
-    
-    if (jsonStart === -1 || jsonEnd === -1) {
-      throw new Error('JSON не найден в выводе Python скрипта');
-    }
-    
-    const jsonString = stdout.substring(jsonStart, jsonEnd + 1);
-    console.log('🔍 Извлеченный JSON:', jsonString.substring(0, 200));
-    
-    const parsed = JSON.parse(jsonString);
     console.log('✅ Python парсинг завершен:', parsed);
+    if (parsed._meta?.timings) {
+      console.log('⏱️ Время извлекателей парсера:', JSON.stringify(parsed._meta.timings));
+    }
     
     // Вычисляем НДС если есть ставка но нет суммы
     let vatAmount = parsed.invoice?.vat_amount ? parseFloat(parsed.invoice.vat_amount) : null;
@@ -730,16 +654,17 @@ export async function POST(request: NextRequest) {
     
     // Шаг 2: Получаем текст (OCR для PDF/изображений, извлечение для Office файлов)
     let ocrText: string;
+    const resolvedFields: Record<string, any> = {};
     
     if (isOfficeFile) {
       // Для Excel и Word используем office_to_text.py
       const docType = isExcel ? 'Excel' : 'Word';
       console.log(`📄 Извлечение текста из ${docType}...`);
-      ocrText = await extractTextFromExcel(buffer, file.name);
+      ocrText = await extractTextFromExcel(buffer, file.name, resolvedFields);
     } else {
       // Для PDF/изображений используем OCR
       const isPdf = file.type === 'application/pdf';
-      ocrText = await extractTextFromImage(buffer, isPdf);
+      ocrText = await extractTextFromImage(buffer, isPdf, resolvedFields);
     }
     
     if (!ocrText) {
@@ -747,7 +672,7 @@ export async function POST(request: NextRequest) {
     }
     
     // Шаг 3: Парсинг данных через Python
-    const parsed = await parseInvoiceWithPython(ocrText);
+    const parsed = await parseInvoiceWithPython(ocrText, resolvedFields);
     
     // Шаг 4: Загружаем файл в Storage с умным именем (номер_дата_timestamp)
     let fileUrl: string | null = null;
@@ -0,0 +1,185 @@
+/**
+ * Клиент долгоживущих Python-воркеров (python-scripts/invoice_worker.py)
+ *
+ * Вместо запуска нового python3 на каждый шаг распознавания (извлечение текста,
+ * рендер PDF, Excel/Word, парсер) держим небольшой пул процессов с уже загруженными
+ * PyMuPDF/openpyxl/xlrd и общаемся с ними строками JSON (NDJSON) через stdin/stdout.
+ *
+ * Каждый процесс выполняет один запрос за раз, остальные ждут в общей очереди:
+ * таймаут запроса отсчитывается с момента отправки в процесс, а не с постановки
+ * в очередь. Зависший запрос отклоняется один - его процесс перезапускается,
+ * а запросы других загрузок уходят в свободные процессы.
+ *
+ * Размер пула: PYTHON_WORKER_POOL_SIZE (по умолчанию 2).
+ */
+
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import os from 'os';
+import path from 'path';
+import readline from 'readline';
+
+export type PythonWorkerOp = 'extract_pdf_text' | 'extract_pdf_hybrid' | 'render_pdf' | 'page_ocr_store' | 'office_to_text' | 'excel_fields' | 'parse' | 'parse_stream' | 'ping' | 'cache_stats';
+
+interface QueuedRequest {
+  id: string;
+  op: PythonWorkerOp;
+  line: string;
+  timeoutMs: number;
+  resolve: (value: any) => void;
+  reject: (error: Error) => void;
+}
+
+interface WorkerSlot {
+  index: number;
+  child: ChildProcessWithoutNullStreams | null;
+  current: QueuedRequest | null;
+  timer: NodeJS.Timeout | null;
+}
+
+interface WorkerResponse {
+  id: string | null;
+  ok: boolean;
+  result?: any;
+  error?: string;
+}
+
+const DEFAULT_TIMEOUT_MS = 180_000;
+const DEFAULT_POOL_SIZE = 2;
+
+function poolSize(): number {
+  const size = Number(process.env.PYTHON_WORKER_POOL_SIZE);
+  if (Number.isInteger(size) && size > 0) return size;
+  return Math.max(1, Math.min(DEFAULT_POOL_SIZE, os.cpus().length));
+}
+
+class PythonWorkerPool {
+  private slots: WorkerSlot[];
+  private queue: QueuedRequest[] = [];
+  private nextId = 1;
+
+  constructor(size: number) {
+    this.slots = Array.from({ length: size }, (_, index) => ({ index, child: null, current: null, timer: null }));
+  }
+
+  private start(slot: WorkerSlot): ChildProcessWithoutNullStreams {
+    const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
+    const scriptPath = path.join(process.cwd(), 'python-scripts', 'invoice_worker.py');
+
+    console.log(`🐍 Запуск Python воркера #${slot.index}: ${pythonExecutable} ${scriptPath}`);
+    const child = spawn(pythonExecutable, [scriptPath], {
+      env: { ...process.env, PYTHONIOENCODING: 'utf-8' },
+    });
+
+    const lines = readline.createInterface({ input: child.stdout });
+    lines.on('line', (line) => this.handleLine(slot, child, line));
+
+    child.stderr.on('data', (data) => {
+      console.warn(`⚠️ Python воркер #${slot.index} stderr:`, data.toString().substring(0, 500));
+    });
+
+    // EPIPE при записи в уже завершившийся процесс - сам запрос отклонит обработчик exit
+    child.stdin.on('error', (error) => {
+      console.warn(`⚠️ Python воркер #${slot.index}: ошибка записи в stdin:`, error.message);
+    });
+
+    child.on('exit', (code, signal) => {
+      console.warn(`⚠️ Python воркер #${slot.index} завершился (код ${code}, сигнал ${signal})`);
+      this.detach(slot, child, new Error(`Python воркер завершился (код ${code})`));
+    });
+
+    child.on('error', (error) => {
+      console.error(`❌ Ошибка запуска Python воркера #${slot.index}:`, error);
+      this.detach(slot, child, error);
+    });
+
+    return child;
+  }
+
+  // Процесс слота больше не годится: отклоняем только его текущий запрос, очередь идёт дальше
+  private detach(slot: WorkerSlot, child: ChildProcessWithoutNullStreams, error: Error) {
+    if (slot.child !== child) return;
+    slot.child = null;
+    const request = this.finish(slot);
+    request?.reject(error);
+    this.dispatch();
+  }
+
+  private finish(slot: WorkerSlot): QueuedRequest | null {
+    const request = slot.current;
+    if (slot.timer) clearTimeout(slot.timer);
+    slot.current = null;
+    slot.timer = null;
+    return request;
+  }
+
+  private handleLine(slot: WorkerSlot, child: ChildProcessWithoutNullStreams, line: string) {
+    let response: WorkerResponse;
+    try {
+      response = JSON.parse(line);
+    } catch {
+      console.warn('⚠️ Некорректная строка от Python воркера:', line.substring(0, 200));
+      return;
+    }
+
+    // Сообщение о готовности воркера приходит без id
+    if (response.id === null || response.id === undefined) {
+      if (!response.ok) {
+        console.warn('⚠️ Python воркер:', response.error);
+      }
+      return;
+    }
+
+    if (slot.child !== child || !slot.current || slot.current.id !== String(response.id)) return;
+
+    const request = this.finish(slot)!;
+    if (response.ok) {
+      request.resolve(response.result);
+    } else {
+      request.reject(new Error(response.error || 'Ошибка Python воркера'));
+    }
+    this.dispatch();
+  }
+
+  private dispatch() {
+    for (const slot of this.slots) {
+      if (this.queue.length === 0) return;
+      if (slot.current) continue;
+      this.send(slot, this.queue.shift()!);
+    }
+  }
+
+  private send(slot: WorkerSlot, request: QueuedRequest) {
+    if (!slot.child) {
+      slot.child = this.start(slot);
+    }
+    const child = slot.child;
+
+    slot.current = request;
+    slot.timer = setTimeout(() => {
+      if (slot.current !== request) return;
+      this.finish(slot);
+      request.reject(new Error(`Python воркер не ответил за ${request.timeoutMs} мс (операция ${request.op})`));
+      // Процесс занят зависшим запросом - заменяем его; других запросов в нём нет
+      slot.child = null;
+      child.kill();
+      this.dispatch();
+    }, request.timeoutMs);
+
+    child.stdin.write(request.line);
+  }
+
+  request<T = any>(op: PythonWorkerOp, params: Record<string, unknown> = {}, timeoutMs = DEFAULT_TIMEOUT_MS): Promise<T> {
+    const id = String(this.nextId++);
+    return new Promise<T>((resolve, reject) => {
+      this.queue.push({ id, op, line: JSON.stringify({ id, op, ...params }) + '\n', timeoutMs, resolve, reject });
+      this.dispatch();
+    });
+  }
+}
+
+// Один пул на процесс Node.js (переживает hot reload в dev-режиме)
+const globalForWorker = globalThis as unknown as { pythonWorker?: PythonWorkerPool };
+
+export const pythonWorker = globalForWorker.pythonWorker ?? new PythonWorkerPool(poolSize());
+
+globalForWorker.pythonWorker = pythonWorker;
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Общие настройки тестов: пути к парсеру, python-scripts, scripts и тестовым счетам"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TEST_INVOICES_DIR = PROJECT_ROOT / 'test-invoices'
+
+for path in (PROJECT_ROOT, PROJECT_ROOT / 'python-scripts', PROJECT_ROOT / 'scripts'):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+@pytest.fixture(scope='session')
+def invoice_parser():
+    from ultimate_invoice_parser import UltimateInvoiceParser
+    return UltimateInvoiceParser(debug=False)
+
+
+@pytest.fixture
+def process_cache(tmp_path, monkeypatch):
+    """Кэш результатов процесса (result_cache.get_cache) во временном файле"""
+    import result_cache
+    monkeypatch.setenv('INVOICE_CACHE', '1')
+    monkeypatch.setenv('INVOICE_CACHE_PATH', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(result_cache, '_cache', None)
+    return result_cache.get_cache()
+
+
+@pytest.fixture(scope='session')
+def fixture_texts():
+    """Текст тестовых счетов (PDF с текстовым слоем, Excel) по имени файла"""
+    pytest.importorskip('fitz')
+    from pdf_extract_text import extract_text_from_pdf
+    from office_to_text import extract_text_from_excel
+
+    texts = {}
+    for path in sorted(TEST_INVOICES_DIR.iterdir()):
+        if path.suffix == '.pdf':
+            result = extract_text_from_pdf(str(path))
+            if result.get('success'):
+                texts[path.name] = result['text']
+        elif path.suffix in ('.xls', '.xlsx'):
+            texts[path.name] = extract_text_from_excel(str(path))
+    return texts
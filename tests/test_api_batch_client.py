@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""BatchClient (scripts/api_batch_client.py) против локальной заглушки API из benchmark_batch_client"""
+
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from api_batch_client import BatchClient
+from benchmark_batch_client import StubState, make_handler
+
+
+@pytest.fixture
+def invoice_files(tmp_path):
+    paths = []
+    for index in range(4):
+        path = tmp_path / f'invoice_{index}.pdf'
+        path.write_bytes(b'%PDF-1.4 ' + bytes([index]) * 64)
+        paths.append(str(path))
+    return paths
+
+
+def _run(paths, fail_every, concurrency, retries=3):
+    """Прогон BatchClient против заглушки: (результаты, клиент, состояние заглушки)"""
+    state = StubState(latency_ms=0, capacity=8, fail_every=fail_every)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = BatchClient(f'http://127.0.0.1:{server.server_port}/api/smart-invoice',
+                             concurrency=concurrency, retries=retries, backoff_base=0.001, backoff_cap=0.01)
+        results = asyncio.run(client.run(paths))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results, client, state
+
+
+def test_retry_on_503(invoice_files):
+    # fail_every=1 - первая попытка каждого файла получает 503
+    results, client, state = _run(invoice_files, fail_every=1, concurrency=2)
+
+    assert sorted(result['filename'] for result in results) == [f'invoice_{i}.pdf' for i in range(4)]
+    for result in results:
+        assert result['status'] == 200
+        assert result['error'] is None
+        assert result['attempts'] == 2
+        assert result['data']['success'] is True
+    assert state.failures == 4
+    assert state.requests == client.requests_sent == 8
+
+
+def test_retries_exhausted_keep_last_status(invoice_files):
+    results, _, _ = _run(invoice_files[:1], fail_every=1, concurrency=1, retries=1)
+    assert results[0]['status'] == 503
+    assert results[0]['attempts'] == 1
+    assert results[0]['error'] == 'HTTP 503'
+
+
+def test_keep_alive_reuses_connections(invoice_files):
+    # Все запросы обработчика, включая повторы после 503, идут по одному соединению
+    results, client, state = _run(invoice_files, fail_every=1, concurrency=2)
+    assert len(results) == 4
+    assert state.connections == client.connections_opened == 2
+
+    results, client, state = _run(invoice_files, fail_every=0, concurrency=1)
+    assert all(result['attempts'] == 1 for result in results)
+    assert state.requests == 4
+    assert state.connections == client.connections_opened == 1
+
+
+def test_unreadable_file_is_reported(tmp_path):
+    results, client, state = _run([str(tmp_path / 'missing.pdf')], fail_every=0, concurrency=1)
+    assert results[0]['status'] is None
+    assert results[0]['error'].startswith('Файл не прочитан')
+    assert state.requests == client.requests_sent == 0
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Манифест пакетной обработки (scripts/batch_manifest.py): что пропускается при повторном прогоне"""
+
+import os
+
+import pytest
+
+import batch_manifest
+from batch_manifest import BatchManifest
+
+MTIME = 1_700_000_000.0
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return BatchManifest(str(tmp_path / 'manifest.sqlite'))
+
+
+@pytest.fixture
+def invoice(tmp_path):
+    path = tmp_path / 'invoice.pdf'
+    path.write_bytes(b'%PDF-1.4 invoice 0001')
+    os.utime(path, (MTIME, MTIME))
+    return path
+
+
+@pytest.fixture
+def digests(monkeypatch):
+    """Файлы, для которых считался SHA-256"""
+    hashed = []
+
+    def file_digest(file_path):
+        hashed.append(os.path.basename(file_path))
+        return original(file_path)
+
+    original = batch_manifest.file_digest
+    monkeypatch.setattr(batch_manifest, 'file_digest', file_digest)
+    return hashed
+
+
+def _row(status, **fields):
+    return dict(fields, filename='invoice.pdf', status=status)
+
+
+def test_new_file_is_pending(manifest, invoice):
+    assert manifest.plan([str(invoice)]) == ([str(invoice)], [])
+
+
+def test_unchanged_file_skipped_without_hashing(manifest, invoice, digests):
+    manifest.record(str(invoice), _row('SUCCESS', total_amount=1512.0))
+    digests.clear()
+
+    assert manifest.plan([str(invoice)]) == ([], [str(invoice)])
+    assert digests == []
+    assert manifest.rows([str(invoice)]) == [_row('SUCCESS', total_amount=1512.0)]
+
+
+def test_size_change_is_pending(manifest, invoice, digests):
+    manifest.record(str(invoice), _row('SUCCESS'))
+    digests.clear()
+    invoice.write_bytes(b'%PDF-1.4 invoice 0001 corrected')
+    os.utime(invoice, (MTIME, MTIME))
+
+    assert manifest.plan([str(invoice)]) == ([str(invoice)], [])
+    assert digests == []
+
+
+def test_mtime_change_same_content_is_done(manifest, invoice, digests):
+    manifest.record(str(invoice), _row('SUCCESS'))
+    os.utime(invoice, (MTIME + 60, MTIME + 60))  # touch / копирование
+    digests.clear()
+
+    assert manifest.plan([str(invoice)]) == ([], [str(invoice)])
+    assert digests == ['invoice.pdf']
+    # Новый mtime запомнен - следующий прогон обходится без хэша
+    assert manifest.get(str(invoice))['mtime'] == MTIME + 60
+    digests.clear()
+    assert manifest.plan([str(invoice)]) == ([], [str(invoice)])
+    assert digests == []
+
+
+def test_mtime_change_new_content_is_pending(manifest, invoice):
+    manifest.record(str(invoice), _row('SUCCESS'))
+    invoice.write_bytes(b'%PDF-1.4 invoice 0002')  # тот же размер
+    os.utime(invoice, (MTIME + 60, MTIME + 60))
+
+    assert manifest.plan([str(invoice)]) == ([str(invoice)], [])
+
+
+def test_failed_file_is_retried(manifest, invoice):
+    manifest.record(str(invoice), _row('ERROR', error='HTTP 503'))
+    assert manifest.plan([str(invoice)]) == ([str(invoice)], [])
+
+    manifest.record(str(invoice), _row('SUCCESS'))
+    entry = manifest.get(str(invoice))
+    assert entry['status'] == 'SUCCESS'
+    assert entry['error'] is None
+    assert entry['attempts'] == 2
+    assert manifest.stats() == {'SUCCESS': 1}
+
+
+def test_done_statuses(manifest, invoice):
+    manifest.record(str(invoice), _row('NEEDS_OCR'))
+    assert manifest.plan([str(invoice)]) == ([str(invoice)], [])
+    assert manifest.plan([str(invoice)], done_statuses=('SUCCESS', 'NEEDS_OCR')) == ([], [str(invoice)])
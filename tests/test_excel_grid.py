@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Быстрый разбор листов .xlsx (excel_grid._sheet_rows) против openpyxl iter_rows"""
+
+import datetime
+
+import pytest
+
+from conftest import TEST_INVOICES_DIR
+
+openpyxl = pytest.importorskip('openpyxl')
+
+import excel_grid
+
+
+def _trim(row):
+    # iter_rows дополняет строку пустыми оформленными ячейками справа - быстрый разбор их не видит
+    row = list(row)
+    while row and row[-1] is None:
+        row.pop()
+    return tuple(row)
+
+
+def _assert_rows_match(path):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            sheet.reset_dimensions()
+            fast = [_trim(row) for row in excel_grid._sheet_rows(workbook, sheet)]
+            slow = [_trim(row) for row in sheet.iter_rows(values_only=True)]
+            assert fast == slow, f'{path.name} / {sheet.title}'
+    finally:
+        workbook.close()
+
+
+def test_fast_rows_match_iter_rows_on_fixtures():
+    if not excel_grid._fast_xlsx_supported():
+        pytest.skip(f'openpyxl {openpyxl.__version__}: быстрый разбор отключён')
+    paths = sorted(TEST_INVOICES_DIR.glob('*.xlsx'))
+    assert paths
+    for path in paths:
+        _assert_rows_match(path)
+
+
+def test_iso_date_cells_match_iter_rows(tmp_path):
+    # iso_dates=True - даты пишутся ячейками t="d" со строкой ISO в <v>
+    path = tmp_path / 'dates.xlsx'
+    workbook = openpyxl.Workbook()
+    workbook.iso_dates = True
+    sheet = workbook.active
+    sheet.append(['Счет на оплату', datetime.datetime(2025, 11, 5)])
+    sheet.append(['№', 'Товары', 'Кол-во', 'Ед.', 'Цена', 'Сумма'])
+    sheet.append([1, 'Профиль', 2, 'шт', 756, 1512])
+    sheet.append(['Всего к оплате:', None, None, None, None, 1512])
+    workbook.save(path)
+
+    _assert_rows_match(path)
+    assert excel_grid.extract_excel_items(str(path))[0]['total'] == 1512
+
+
+def test_iter_xlsx_rows_cell_types():
+    xml = (
+        '<sheetData>'
+        '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="inlineStr"><is><r><rPr><b/></rPr><t>Итого</t></r>'
+        '<r><t xml:space="preserve"> к оплате</t></r><rPh sb="0" eb="1"><t>x</t></rPh></is></c></row>'
+        '<row r="3"><c r="A3"><v>12</v></c><c r="B3"><v>1.5</v></c><c r="C3" t="b"><v>1</v></c>'
+        '<c r="D3" t="e"><v>#DIV/0!</v></c><c r="E3" t="str"><f>A3&amp;B3</f><v>a&amp;b</v></c><c r="F3" s="4"/></row>'
+        '</sheetData>'
+    )
+    rows = list(excel_grid.iter_xlsx_rows(xml, ['Товар']))
+    assert rows == [('Товар', None, 'Итого к оплате'), (), (12, 1.5, True, None, 'a&b')]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Протокол NDJSON долгоживущего воркера (python-scripts/invoice_worker.py)"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PROJECT_ROOT
+
+WORKER = PROJECT_ROOT / 'python-scripts' / 'invoice_worker.py'
+
+
+@pytest.fixture(scope='module')
+def worker():
+    pytest.importorskip('fitz')
+    env = dict(os.environ, INVOICE_CACHE='0', PYTHONIOENCODING='utf-8')
+    process = subprocess.Popen([sys.executable, str(WORKER)], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, env=env)
+    ready = json.loads(process.stdout.readline())
+    assert ready['ok'] and ready['result']['ready']
+    yield process
+    process.stdin.close()
+    process.wait(timeout=10)
+
+
+def _ask(worker, line):
+    worker.stdin.write((line + '\n').encode('utf-8'))
+    worker.stdin.flush()
+    return json.loads(worker.stdout.readline().decode('utf-8'))
+
+
+def _request(worker, **request):
+    return _ask(worker, json.dumps(request, ensure_ascii=False))
+
+
+def test_ping(worker):
+    response = _request(worker, id='1', op='ping')
+    assert response['id'] == '1'
+    assert response['ok'] is True
+    assert response['result']['pong'] is True
+
+
+def test_parse_text(worker):
+    text = 'Счет на оплату № 4512 от 05.11.2025\nИНН 7701234567\nИтого: 1 512,00\n'
+    response = _request(worker, id='2', op='parse', text=text)
+    assert response['id'] == '2'
+    assert response['ok'] is True
+    assert response['result']['invoice']['number'] == '4512'
+    assert response['result']['invoice']['total_amount'] == 1512.0
+
+
+def test_errors_keep_worker_alive(worker):
+    response = _request(worker, id='3', op='no_such_op')
+    assert response == {'id': '3', 'ok': False, 'error': 'Неизвестная операция: no_such_op'}
+
+    response = _request(worker, id='4', op='parse')
+    assert response['ok'] is False
+    assert 'file' in response['error']
+
+    response = _ask(worker, '{не json')
+    assert response['id'] is None
+    assert response['ok'] is False
+
+    response = _request(worker, id='5', op='extract_pdf_text', path='/nonexistent/invoice.pdf')
+    assert response['id'] == '5'
+    # Ошибка извлечения - в результате операции, а не в протоколе
+    assert response['ok'] is True
+    assert response['result']['success'] is False
+
+    assert _request(worker, id='6', op='ping')['ok'] is True
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Потоковый разбор (parse_stream) против разбора всего текста (parse_invoice)"""
+
+from ultimate_invoice_parser import iter_text_chunks
+
+
+def _fields(result, fields):
+    return {(section, name): result.get(section, {}).get(name) for section, name in fields}
+
+
+def test_stream_matches_one_shot_on_fixtures(invoice_parser, fixture_texts):
+    assert fixture_texts
+    for name, text in fixture_texts.items():
+        one_shot = invoice_parser.parse_invoice(text)
+        stream = invoice_parser.parse_stream(iter_text_chunks(text))
+        assert ('error' in stream) == ('error' in one_shot), name
+        fields = invoice_parser.STREAM_SETTLE_FIELDS
+        assert _fields(stream, fields) == _fields(one_shot, fields), name
+
+
+def test_no_vat_invoice_settles(invoice_parser):
+    pages = [
+        'Поставщик: ООО "Ромашка" ИНН 7701234567\n'
+        'Счет на оплату № 45 от 05.11.2025\n'
+        'Итого: 7 500,00\n'
+        'Без НДС.\n',
+        'Условия поставки и гарантии\n',
+    ]
+    result = invoice_parser.parse_stream(pages)
+    assert result['invoice']['vat_amount'] is None
+    assert result['_meta']['stream'] == {"chunks_read": 1, "chars_read": len(pages[0]),
+                                         "stop_reason": "fields_settled"}
+
+
+def test_not_invoice_words_in_later_chunk(invoice_parser):
+    # Как parse_invoice: слова анкеты в любой части - документ не счёт
+    pages = ['Счет на оплату № 45 от 05.11.2025\nИтого: 7 500,00\n', 'Анкета участника\n']
+    text = '\n'.join(pages)
+    assert 'error' in invoice_parser.parse_invoice(text)
+    assert 'error' in invoice_parser.parse_stream(pages, settle_fields=(('invoice', 'vat_amount'),))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Регрессии UltimateInvoiceParser на текстах, которые ломались при оптимизациях паттернов"""
+
+# Строки таблицы товаров, склеенные OCR в одну строку (~330 символов)
+ITEMS_LINE = ' '.join(['Кирпич облицовочный М150 шт 1 200 45,00'] * 8)
+
+
+def test_number_far_from_keyword_on_single_line(invoice_parser):
+    # Номер дальше 200 символов от "Счет" в пределах одной строки (_GAP)
+    text = ('Поставщик: ООО "Ромашка" ИНН 7701234567 КПП 770101001 Счет на оплату '
+            + ITEMS_LINE + ' № 4512 Покупатель: ИП Ткачев Итого 54 000,00')
+    result = invoice_parser.parse_invoice(text)
+    assert result['invoice']['number'] == '4512'
+    assert result['invoice']['total_amount'] == 54000.0
+
+
+def test_inn_after_colon_is_not_invoice_number(invoice_parser):
+    # "ИНН: 7839120887" - реквизит, а не номер счета (раньше исключался только "ИНН 7839120887")
+    text = ('Счет на оплату\n'
+            'Поставщик: ООО "СТРОЙМАРКЕТ", ИНН: 7839120887, КПП 783901001\n'
+            'Итого: 1 512,00\n')
+    result = invoice_parser.parse_invoice(text)
+    assert result['invoice']['number'] is None
+    assert result['contractor']['inn'] == '7839120887'
+
+
+def test_total_line_vat_stays_near_vat_label(invoice_parser):
+    # "Итого ... НДС ... сумма": "Без НДС" далеко от "Итого" не даёт суммы НДС из соседнего числа
+    text = ('Счет на оплату № 5 от 01.02.2025\n'
+            'Итого: ' + ' '.join(['Профиль штапика AYPC.C шт'] * 8)
+            + ' Семь тысяч пятьсот рублей 00 копеек. Без НДС. шт 1 Профиль\n')
+    result = invoice_parser.parse_invoice(text)
+    assert result['invoice']['vat_amount'] is None
+    assert result['invoice']['has_vat'] is False
+
+
+def test_resolved_vat_without_rate_gets_rate(invoice_parser):
+    # Сумма НДС из ячеек Excel без ставки рядом - ставка как у текстового пути (extract_vat_info)
+    text = 'Счет на оплату № 7 от 05.11.2025\nИтого: 1 512,00\n'
+    result = invoice_parser.parse_invoice(text, resolved={'total_amount': 1512.0, 'vat_amount': 252.0})
+    assert result['invoice']['vat_rate'] == 20.0
+    result = invoice_parser.parse_invoice(text, resolved={'total_amount': 1100.0, 'vat_amount': 100.0})
+    assert result['invoice']['vat_rate'] == 10.0
+    result = invoice_parser.parse_invoice(text, resolved={'total_amount': 1512.0, 'vat_amount': 77.0})
+    assert result['invoice']['vat_rate'] == 20.0
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Ленивое чтение PDF (extract_text_from_pdf + fields_found_check)"""
+
+import pytest
+
+fitz = pytest.importorskip('fitz')
+
+from pdf_extract_text import extract_text_from_pdf, fields_found_check
+
+# Обязательные поля - на первой странице, НДС и ИНН поставщика - на второй
+PAGES = [
+    ['Поставщик: ООО "Ромашка"',
+     'Счет на оплату № 45 от 05.11.2025',
+     'Итого: 12 000,00'],
+    ['В том числе НДС (20%): 2 000,00',
+     'ИНН 7701234567 КПП 770101001'],
+]
+
+
+def _write_pdf(path, pages):
+    font = fitz.Font('cjk')  # встроенный шрифт PyMuPDF с кириллицей
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        page.insert_font(fontname='F0', fontbuffer=font.buffer)
+        for index, line in enumerate(lines):
+            page.insert_text((50, 80 + 20 * index), line, fontname='F0', fontsize=11)
+    doc.save(str(path))
+    doc.close()
+
+
+def test_lazy_read_keeps_vat_and_inn_from_later_pages(tmp_path, invoice_parser):
+    pdf_path = tmp_path / 'invoice.pdf'
+    _write_pdf(pdf_path, PAGES)
+
+    full = extract_text_from_pdf(str(pdf_path), min_chars=10)
+    lazy = extract_text_from_pdf(str(pdf_path), min_chars=10, stop_when=fields_found_check(invoice_parser))
+
+    assert lazy['text'] == full['text']
+    result = invoice_parser.parse_invoice(lazy['text'])
+    assert result['invoice']['vat_amount'] == 2000.0
+    assert result['contractor']['inn'] == '7701234567'
+
+
+def test_lazy_read_stops_when_all_fields_found(tmp_path, invoice_parser):
+    pdf_path = tmp_path / 'invoice.pdf'
+    _write_pdf(pdf_path, [PAGES[0] + PAGES[1], ['Условия поставки']])
+
+    lazy = extract_text_from_pdf(str(pdf_path), min_chars=10, stop_when=fields_found_check(invoice_parser))
+    assert lazy['stop_reason'] == 'fields_found'
+    assert lazy['pages_skipped'] == 1
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Кэш OCR страниц по отпечатку (pdf_to_png.page_fingerprint + result_cache.put_page_ocr)"""
+
+import pytest
+
+fitz = pytest.importorskip('fitz')
+
+from pdf_to_png import convert_pdf_to_images_pymupdf
+from result_cache import put_page_ocr
+
+DPI = 72
+
+
+def _write_pdf(path, pages):
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        for index, line in enumerate(lines):
+            page.insert_text((50, 80 + 20 * index), line, fontsize=11)
+    doc.save(str(path))
+    doc.close()
+
+
+def test_cached_page_comes_with_ocr_text(tmp_path, process_cache):
+    pdf_path = tmp_path / 'scan.pdf'
+    _write_pdf(pdf_path, [['Invoice 45', 'Total 12 000'], ['Terms of delivery']])
+
+    first = convert_pdf_to_images_pymupdf(str(pdf_path), DPI, ocr_cache=True)
+    assert first['ocr_cache'] == {'enabled': True, 'hits': 0, 'misses': 2, 'hit_rate': 0.0}
+    assert all('base64' in image and 'ocr_text' not in image for image in first['images'])
+
+    assert put_page_ocr(first['images'][0]['page_hash'], 'Счет № 45\nИтого 12 000')
+    second = convert_pdf_to_images_pymupdf(str(pdf_path), DPI, ocr_cache=True)
+    assert second['ocr_cache'] == {'enabled': True, 'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+    cached, rendered = second['images']
+    assert cached['ocr_text'] == 'Счет № 45\nИтого 12 000'
+    assert 'base64' not in cached and cached['size_kb'] == 0
+    assert 'base64' in rendered and 'ocr_text' not in rendered
+    assert process_cache.stats()['session']['page_ocr'] == {'hits': 1, 'misses': 3}
+
+
+def test_same_page_in_another_document_hits(tmp_path, process_cache):
+    # Отпечаток - по пикселям страницы, а не по файлу: та же страница в новой пересылке
+    first_path, second_path = tmp_path / 'first.pdf', tmp_path / 'second.pdf'
+    _write_pdf(first_path, [['Invoice 45', 'Total 12 000']])
+    _write_pdf(second_path, [['Cover letter'], ['Invoice 45', 'Total 12 000']])
+
+    page_hash = convert_pdf_to_images_pymupdf(str(first_path), DPI)['images'][0]['page_hash']
+    put_page_ocr(page_hash, 'Счет № 45')
+
+    result = convert_pdf_to_images_pymupdf(str(second_path), DPI, ocr_cache=True)
+    assert result['ocr_cache']['hits'] == 1
+    assert [image.get('ocr_text') for image in result['images']] == [None, 'Счет № 45']
+
+
+def test_lookup_is_opt_in(tmp_path, process_cache):
+    pdf_path = tmp_path / 'scan.pdf'
+    _write_pdf(pdf_path, [['Invoice 45']])
+    page_hash = convert_pdf_to_images_pymupdf(str(pdf_path), DPI)['images'][0]['page_hash']
+    put_page_ocr(page_hash, 'Счет № 45')
+
+    result = convert_pdf_to_images_pymupdf(str(pdf_path), DPI)
+    assert result['ocr_cache'] == {'enabled': False, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
+    assert 'base64' in result['images'][0] and 'ocr_text' not in result['images'][0]
+    assert 'page_ocr' not in process_cache.stats()['session']
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Кэш результатов (python-scripts/result_cache.py): попадания, LRU-вытеснение, отпечаток кода"""
+
+import itertools
+import types
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # accessed_at строго растёт: порядок LRU не зависит от разрешения часов
+    ticks = itertools.count(1)
+    monkeypatch.setattr(result_cache, 'time', types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def test_cached_hit_and_miss(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"text": "Счет на оплату № 7"}
+
+    first = cache.cached('pdf_text', 'abc', 'v1', compute)
+    second = cache.cached('pdf_text', 'abc', 'v1', compute)
+    assert first == second == {"text": "Счет на оплату № 7"}
+    assert len(calls) == 1
+
+    # Другие параметры вызова - другая запись
+    cache.cached('pdf_text', 'abc', 'v1', compute, params={"min_chars": 10})
+    assert len(calls) == 2
+
+    stats = cache.stats()
+    assert stats['session'] == {'pdf_text': {'hits': 1, 'misses': 2}}
+    assert stats['total'] == {'pdf_text': {'hits': 1, 'misses': 2}}
+    assert stats['entries'] == 2
+
+
+def test_store_if_skips_errors(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"error": "битый файл"}
+
+    for _ in range(2):
+        cache.cached('office', 'abc', 'v1', compute, store_if=lambda result: 'error' not in result)
+    assert len(calls) == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_lru_eviction(tmp_path, clock):
+    value = 'x' * 100
+    entry_size = len(f'"{value}"')
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'), max_bytes=entry_size * 2)
+
+    cache.put('a', 'parse', value)
+    cache.put('b', 'parse', value)
+    assert cache.get('a') == value  # 'a' использована позже 'b'
+    cache.put('c', 'parse', value)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == value
+    assert cache.get('c') == value
+    assert cache.stats()['size_bytes'] == entry_size * 2
+
+    # Запись больше лимита не сохраняется и ничего не вытесняет
+    cache.put('big', 'parse', value * 3)
+    assert cache.get('big') is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_fingerprint_change_invalidates(tmp_path, monkeypatch):
+    source = tmp_path / 'stage.py'
+    source.write_text('VERSION = 1\n', encoding='utf-8')
+    monkeypatch.setattr(result_cache, '_fingerprints', {})
+    old = result_cache.source_fingerprint(str(source))
+
+    source.write_text('VERSION = 2\n', encoding='utf-8')
+    monkeypatch.setattr(result_cache, '_fingerprints', {})
+    new = result_cache.source_fingerprint(str(source))
+    assert old != new
+
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+    cache.cached('parse', 'abc', old, lambda: {"version": 1})
+    assert cache.cached('parse', 'abc', new, lambda: {"version": 2}) == {"version": 2}
+    assert cache.cached('parse', 'abc', old, lambda: {"version": 3}) == {"version": 1}
+
+
+def test_cached_parse_invoice(invoice_parser, process_cache):
+    text = 'Счет на оплату № 4512 от 05.11.2025\nИтого: 1 512,00\n'
+    first = result_cache.cached_parse_invoice(invoice_parser, text)
+    second = result_cache.cached_parse_invoice(invoice_parser, text)
+    assert first == second
+    assert first['invoice']['number'] == '4512'
+    assert process_cache.stats()['session'] == {'parse': {'hits': 1, 'misses': 1}}
+
+    # resolved входит в ключ
+    resolved = result_cache.cached_parse_invoice(invoice_parser, text, {'total_amount': 2000.0})
+    assert resolved['invoice']['total_amount'] == 2000.0
+    assert process_cache.stats()['session'] == {'parse': {'hits': 1, 'misses': 2}}
+
+
+def test_cache_disabled(monkeypatch, invoice_parser):
+    monkeypatch.setenv('INVOICE_CACHE', '0')
+    assert result_cache.get_cache() is None
+    assert result_cache.put_page_ocr('abc', 'текст') is False
+    assert result_cache.get_page_ocr('abc') is None
+    text = 'Счет на оплату № 4512\n'
+    assert result_cache.cached_parse_invoice(invoice_parser, text)['invoice']['number'] == '4512'
@@ -8,13 +8,633 @@ import re
 import json
 import argparse
 import sys
-from typing import Dict, List, Any, Optional
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Any, Iterable, Iterator, Optional, NamedTuple, Pattern
+
+
+# ============================================================================
+# РЕЕСТР ПАТТЕРНОВ
+# Все регулярные выражения компилируются один раз при импорте модуля.
+# Внутренний кэш модуля re (512 записей) не рассчитан на 100+ паттернов
+# парсера и вытесняется в долгоживущих воркерах.
+# ============================================================================
+
+# Якорные слова документа (в нижнем регистре). Паттерн с якорем ищется только
+# в окнах вокруг вхождений своих якорей, а не по всему тексту.
+ANCHOR_KINDS: Dict[str, str] = {
+    'schet': r'сч[её]т',
+    'sch': r'сч',  # Сокращение "Сч." в реквизитах
+    'schet_ocr': r'с[чт]',  # OCR-искажение "СТ" вместо "СЧ" - встречается почти в каждой строке
+    'nomer': r'№',
+    'order': r'заказ',
+    'spec': r'спецификац',
+    'invoice_en': r'invoice',
+    'inn': r'инн|и\.н\.н\.',
+    'bik': r'бик|б\.и\.к\.',
+    'settlement': r'р/с',
+    'vat': r'ндс',
+    'including': r'том\s*числе',
+    'total': r'итого|всего|к\s*оплате|к\s*доплате|total|на\s+сумму|общая\s*стоимость|сумма',
+    'supplier': r'поставщик',
+    'seller': r'продавец',
+    'receiver': r'получатель',
+    'llc': r'ооо',
+    'sole_trader': r'индивидуальный\s+предприниматель|ип',
+}
+
+_ANCHOR_REGEXES = {kind: re.compile(source) for kind, source in ANCHOR_KINDS.items()}
+_ANCHOR_REGEXES_IGNORECASE = {kind: re.compile(source, re.IGNORECASE) for kind, source in ANCHOR_KINDS.items()}
+
+# Ключевые слова проверок (не якоря паттернов): тип документа, покупатель, фрагменты,
+# которые не могут быть названием поставщика. Только литералы в нижнем регистре -
+# ищутся str.find, для нескольких литералов это в 3 раза быстрее альтернации в re.
+KEYWORD_KINDS: Dict[str, tuple] = {
+    'invoice_doc': ('итого', 'всего к оплате', 'к доплате', 'общая стоимость'),
+    'not_invoice': ('информационная карта', 'участника торгов', 'участника подрядных торгов',
+                    'анкета', 'заявка', 'справка о деятельности', 'реквизиты организации'),
+    # Покупатель (Ткачев С.О.) - его название и ИНН не принимаются за поставщика
+    'buyer': ('ткачев', 'tkachev', '784802613697'),
+    # Явное указание, что НДС в счёте нет: суммы НДС искать бесполезно
+    'no_vat': ('без ндс', 'без налога (ндс)', 'ндс не облагается', 'не облагается ндс'),
+    # Для фильтра названий достаточно надмножества: "наличии" покрывает "при наличии" с любыми пробелами
+    'not_company': ('самовывоз', 'наличии', 'доверенности', 'паспорта'),
+}
+
+_KEYWORD_REGEXES_IGNORECASE = {kind: re.compile('|'.join(map(re.escape, words)), re.IGNORECASE)
+                               for kind, words in KEYWORD_KINDS.items()}
+
+# Реквизиты: метка и все цифры после неё. Вид -> (паттерн, сколько первых цифр - реквизит).
+# Такие числа не могут быть ни суммой, ни номером счета.
+REQUISITE_KINDS: Dict[str, tuple] = {
+    'inn': (r'(?:инн|и\.н\.н\.)[\s:]*(\d+)', 12),  # ИНН - 10 или 12 цифр
+    'kpp': (r'кпп[\s:]*(\d+)', 9),
+    'bik': (r'(?:бик|б\.и\.к\.)[\s:]*(\d+)', 9),
+    'account': (r'(?:сч(?:[её]т)?\.?\s*№?|р/с)[\s:№]*(\d+)', 20),
+}
+# Минимальная длина числа реквизита (ИНН юрлица - 10 цифр)
+_REQUISITE_MIN_DIGITS = {'inn': 10, 'kpp': 9, 'bik': 9, 'account': 20}
+
+_REQUISITE_REGEXES = {kind: re.compile(source) for kind, (source, _) in REQUISITE_KINDS.items()}
+_REQUISITE_REGEXES_IGNORECASE = {kind: re.compile(source, re.IGNORECASE) for kind, (source, _) in REQUISITE_KINDS.items()}
+
+# Сколько символов после якоря входит в окно (окно затем расширяется до конца следующей строки)
+ANCHOR_WINDOW_TAIL = 200
+
+
+class InvoicePattern(NamedTuple):
+    """Скомпилированный паттерн реестра"""
+    id: str           # Стабильный идентификатор: "<группа>.<имя>"
+    priority: int     # Порядок применения внутри группы (0 - наивысший)
+    regex: Pattern[str]
+    anchors: Optional[tuple]  # Виды якорей из ANCHOR_KINDS; None - поиск по всему тексту
+
+
+def _register(group: str, flags: int, specs: List[tuple], anchors: Optional[tuple] = None) -> List[InvoicePattern]:
+    """
+    Компилирует группу паттернов. Приоритет определяется порядком в списке.
+    Элемент specs: (имя, паттерн) или (имя, паттерн, якоря) - якоря паттерна
+    переопределяют якоря группы.
+    """
+    names = [spec[0] for spec in specs]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Дублирующиеся идентификаторы паттернов в группе {group}")
+
+    compiled = []
+    for priority, spec in enumerate(specs):
+        name, source = spec[0], spec[1]
+        pattern_anchors = spec[2] if len(spec) > 2 else anchors
+        unknown = set(pattern_anchors or ()) - set(ANCHOR_KINDS)
+        if unknown:
+            raise ValueError(f"Неизвестные якоря {unknown} у паттерна {group}.{name}")
+        compiled.append(InvoicePattern(f"{group}.{name}", priority, re.compile(source, flags), pattern_anchors))
+    return compiled
+
+
+# Общий фрагмент суммы: 19034.7 (Excel) или 19 034,70 (OCR)
+_AMOUNT = r'(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)'
+
+# Промежуток между ключевым словом и значением в пределах строки. Раньше здесь был
+# .*? - на длинной строке с повторяющимися ключевыми словами (OCR-дамп без переносов)
+# каждое вхождение просматривало строку до конца, и время росло квадратично.
+# Граница 1000 символов: в OCR-тексте, склеенном в одну строку, номер и НДС бывают
+# в сотнях символов от ключевого слова (при 200 часть таких счетов теряла номер).
+# Проверка: scripts/benchmark_regex.py, tests/test_parser_regressions.py
+_GAP = r'.{0,1000}?'
+# Узкий промежуток - для паттернов с двумя промежутками подряд (Итого .. НДС .. сумма)
+_NEAR_GAP = r'.{0,200}?'
+
+PATTERNS: Dict[str, List[InvoicePattern]] = {
+    'invoice_number': _register('invoice_number', re.IGNORECASE | re.UNICODE, anchors=('schet',), specs=[
+        # ПЕТРОВИЧ И ДРУГИЕ: Буквенно-цифровые номера БЕЗ дефиса (СЭ00846838, ТВЭ01037849) - НАИВЫСШИЙ ПРИОРИТЕТ!
+        ('alnum_after_schet', r'(?:Счёт|Счет|СЧЁТ|СЧЕТ)\s*([А-ЯЁA-Z]{1,4}\d{6,12})'),  # Счёт СЭ00846838
+        ('alnum_order', r'(?:Заказ|ЗАКАЗ)' + _GAP + r'№\s*([А-ЯЁA-Z]{1,4}\d{6,12})', ('order',)),  # Заказ покупателя № ТВЭ01037849
+        ('alnum_before_ot', r'№\s*([А-ЯЁA-Z]{1,4}\d{6,12})\s*от', ('nomer',)),  # № СЭ00846838 от
+
+        # СПЕЦИФИКАЦИЯ (АЛЮТЕХ и др.) - ОЧЕНЬ ВЫСОКИЙ ПРИОРИТЕТ!
+        ('spec_upper', r'СПЕЦИФИКАЦИЯ\s*№\s*(\d+)', ('spec',)),
+        ('spec', r'Спецификация\s*№\s*(\d+)', ('spec',)),
+
+        # Буквенно-цифровые номера С ДЕФИСОМ (УТ-784, А-123, и т.д.) - ВЫСОКИЙ ПРИОРИТЕТ!
+        ('dash_prefix', r'№\s*([А-ЯЁA-Z]+-\d+)', ('nomer',)),
+        ('dash_prefix_letters', r'№\s*([ABCDEFGHIJKLMNOPQRSTUVWXYZАВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ]+-\d+)', ('nomer',)),
+        ('dash_schyot_upper', r'СЧЁТ' + _GAP + r'№\s*([А-ЯA-Z]+-\d+)'),
+        ('dash_schet_upper', r'СЧЕТ' + _GAP + r'№\s*([А-ЯA-Z]+-\d+)'),
+        ('dash_ocr', r'С[ЧТ]' + _GAP + r'№\s*([А-ЯA-Z]+-\d+)', ('schet_ocr',)),
+        ('dash_schyot', r'счёт' + _GAP + r'№\s*([А-ЯA-Z]+-\d+)'),
+        ('dash_schet', r'счет' + _GAP + r'№\s*([А-ЯA-Z]+-\d+)'),
+
+        # КРИТИЧНЫЙ ПРИОРИТЕТ: Короткие номера 1-6 цифр (должны быть ПЕРЕД длинными!)
+        # Специальный формат "Счет и Бух-НОМЕР" (из OCR)
+        ('schet_i_buh', r'Счет\s+и\s+Бух[-\s]*(\d+)'),
+        ('schet_i_buh_upper', r'СЧЕТ\s+И\s+БУХ[-\s]*(\d+)'),
+
+        # Паттерны с "от" в той же строке
+        ('short_schyot_upper_ot', r'СЧЁТ\s*№\s*(\d{1,6})\s*от'),
+        ('short_schet_upper_ot', r'СЧЕТ\s*№\s*(\d{1,6})\s*от'),
+        ('short_ocr_ot', r'С[ЧТ]\s*№\s*(\d{1,6})\s*от', ('schet_ocr',)),
+        ('short_schyot_ot', r'счёт\s*№\s*(\d{1,6})\s*от'),
+        ('short_schet_ot', r'счет\s*№\s*(\d{1,6})\s*от'),
+        # Паттерны БЕЗ "от" - только если после номера НЕ идут 4+ цифр подряд (не БИК/счет)
+        ('short_schyot_upper', r'СЧЁТ\s*№\s*(\d{1,6})(?!\d)'),
+        ('short_schet_upper', r'СЧЕТ\s*№\s*(\d{1,6})(?!\d)'),
+        ('short_ocr', r'С[ЧТ]\s*№\s*(\d{1,6})(?!\d)', ('schet_ocr',)),
+
+        # Счет-договор с номером (из логов: № 22980)
+        ('contract_schyot', r'СЧЁТ[-\s]*ДОГОВОР' + _GAP + r'№\s*(\d+)'),
+        ('contract_schet', r'СЧЕТ[-\s]*ДОГОВОР' + _GAP + r'№\s*(\d+)'),
+
+        # Номер с нулями в начале (из логов: 00000007898, 00000007883) - НИЗКИЙ ПРИОРИТЕТ
+        ('zeros_before_ot', r'№\s*(0{4,}\d+)\s*от', ('nomer',)),  # Минимум 4 нуля в начале
+        ('zeros_schyot', r'СЧЁТ' + _GAP + r'№\s*(0{4,}\d+)'),
+        ('zeros_schet', r'СЧЕТ' + _GAP + r'№\s*(0{4,}\d+)'),
+        ('zeros_ocr', r'С[ЧТ]' + _GAP + r'№\s*(0{4,}\d+)', ('schet_ocr',)),
+
+        # Обычный счет (НИЗКИЙ ПРИОРИТЕТ - могут ловить БИК)
+        ('any_schyot_upper', r'СЧЁТ' + _GAP + r'№\s*(\d+)'),
+        ('any_schet_upper', r'СЧЕТ' + _GAP + r'№\s*(\d+)'),
+        ('any_ocr', r'С[ЧТ]' + _GAP + r'№\s*(\d+)', ('schet_ocr',)),    # OCR искажения
+        ('any_schyot', r'счёт' + _GAP + r'№\s*(\d+)'),
+        ('any_schet', r'счет' + _GAP + r'№\s*(\d+)'),
+        ('number_ot_date', r'№\s*(\d+)\s*от\s*\d', ('nomer',)),
+        ('invoice_en', r'Invoice' + _GAP + r'№\s*(\d+)', ('invoice_en',)),
+
+        # Универсальные паттерны (с учетом потери символов при OCR/консоли)
+        ('ocr_ot', r'С[ЧТ]\s+(\d+)\s+от', ('schet_ocr',)),  # "СТ 00000007883 от"
+        ('ocr_long', r'С[ЧТ]' + _GAP + r'(\d{5,})', ('schet_ocr',)),     # "СТ" + длинное число
+
+        # Номер в начале документа (расширенный диапазон) - ПОСЛЕДНИЙ ПРИОРИТЕТ
+        ('number_ot', r'№\s*(\d{2,10})\s*от', ('nomer',)),
+    ]),
+
+    'date': _register('date', re.IGNORECASE | re.UNICODE, [
+        ('russian_month', r'(\d{1,2})\s+(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(\d{4})'),
+        ('dotted', r'(\d{1,2})\.(\d{1,2})\.(\d{4})'),
+        ('slashed', r'(\d{1,2})/(\d{1,2})/(\d{4})'),
+        ('iso', r'(\d{4})-(\d{1,2})-(\d{1,2})'),
+    ]),
+
+    'due_date': _register('due_date', re.IGNORECASE | re.UNICODE, [
+        ('pay_not_later', r'(?:оплатить|оплата)' + _GAP + r'не\s+позднее\s+(\d{1,2})\.(\d{1,2})\.(\d{4})'),
+        ('not_later', r'не\s+позднее\s+(\d{1,2})\.(\d{1,2})\.(\d{4})'),
+    ]),
+
+    # 1. ВЫСШИЙ ПРИОРИТЕТ: Прямое указание "Поставщик:" в начале строки
+    # Формат: "Поставщик: Акционерное Общество "Балтийское Стекло", ИНН 7801514385"
+    'contractor_direct': _register('contractor_direct', re.IGNORECASE | re.MULTILINE, anchors=('supplier',), specs=[
+        # АО/ОАО/ЗАО/ПАО с кавычками
+        ('joint_stock_quoted', r'Поставщик:\s*((?:Акционерное\s+Общество|АО|ОАО|ЗАО|ПАО)\s*["""«]([^"""»\n]{3,60})["""»])'),
+        # ООО с кавычками
+        ('llc_quoted', r'Поставщик:\s*(ООО\s*["""«]([^"""»\n]{3,60})["""»])'),
+        # Любая орг. форма + название до запятой/ИНН
+        ('any_form_until_inn', r'Поставщик:\s*((?:АО|ОАО|ЗАО|ПАО|ООО)\s*["""«]?[^,\n]{3,60}?)(?:,\s*ИНН|\s+ИНН)'),
+        # Акционерное Общество полностью
+        ('joint_stock_full', r'Поставщик:\s*(Акционерное\s+Общество\s*["""«]?[^,\n]{3,60}?)(?:,|\s+ИНН)'),
+    ]),
+
+    # 2. Приоритетные известные компании (точные совпадения из логов)
+    'contractor_known': _register('contractor_known', re.IGNORECASE | re.UNICODE, [
+        ('baltic_glass', r'Балтийское\s+Стекло'),  # Добавлено!
+        ('metallmaster', r'МЕТАЛЛМАСТЕР-М'),
+        ('alrus', r'АлРус'),
+        ('expert_rental', r'Эксперт\s+Рентал\s+Инжиниринг'),
+        ('expert_rental_ocr', r'ксперт\s+ентал\s+нжиниринг'),  # OCR часто пропускает первые буквы
+        ('petrovich', r'Петрович'),
+        ('ozerov', r'ОЗЕРОВ\s+МАКСИМ\s+НИКОЛАЕВИЧ'),
+        ('specmash_llc', r'ООО\s*["""«]?Спецмаш["""»]?'),
+        ('specmash', r'Спецмаш'),
+    ]),
+
+    # 3. КРИТИЧНО ДЛЯ EXCEL: Ищем поставщика в строке с "Получатель:" (это ПРОДАВЕЦ!)
+    # В вашем формате счетов:
+    # Получатель: ООО "Группа компаний "СтиС"" - это ПОСТАВЩИК (продавец)
+    # Заказчик: ИП Ткачев С.О. - это ПОКУПАТЕЛЬ (вы)
+    'contractor_excel': _register('contractor_excel', re.IGNORECASE | re.MULTILINE, [
+        # Получатель - это поставщик в данном формате
+        ('receiver_with_account', r'Получатель[:\s]*\n?\s*(\d+/\d+)\s+((?:ООО|ИП|АО|ЗАО)[^,\n]{3,80})', ('receiver',)),  # С номером счета
+        ('receiver', r'Получатель[:\s]*\n?\s*((?:ООО|ИП|АО|ЗАО)\s+["""«]?[^"""»\n]{3,60}["""»]?)', ('receiver',)),
+
+        # Продавец/Поставщик с организационной формой
+        ('seller_form_name', r'(?:Продавец|Поставщик):\s*(ООО|ИП|АО|ЗАО)\s*["""«]?([^"""»\n,]{3,50})["""»]?(?:,|\s*ИНН)', ('seller', 'supplier')),
+        ('seller_until_inn', r'(?:Продавец|Поставщик):\s*([^\n,]+?)(?:,\s*ИНН|\s+ИНН)', ('seller', 'supplier')),
+    ]),
+
+    # 4. Ищем в строках с "Получатель", "Продавец", "Поставщик" - избегаем фрагментов про самовывоз
+    'contractor_context': _register('contractor_context', re.IGNORECASE | re.MULTILINE | re.DOTALL, anchors=('receiver', 'seller', 'supplier'), specs=[
+        ('role_then_form', r'(?:Получатель|Продавец|Поставщик)[\s:]*\n?\s*((?:ООО|ИП|АО|ЗАО|ПАО)\s*["""«]?[^"""»\n]{3,50}["""»]?)'),
+        ('role_line_quoted', r'(?:Получатель|Продавец|Поставщик)[^\n]{0,200}?((?:ООО|ИП|АО)\s*["""«][^"""»\n]{3,50}["""»])'),
+    ]),
+
+    # 5. ООО в кавычках по всему тексту
+    'contractor_generic': _register('contractor_generic', re.IGNORECASE | re.MULTILINE | re.UNICODE, [
+        # ООО с вложенными кавычками - жадный захват до последней кавычки
+        ('llc_nested_quotes', r'ООО\s*"(.*)"', ('llc',)),
+        ('llc_quoted', r'ООО\s*["""«]([^"""»\n,]{3,40})["""»]', ('llc',)),
+        ('llc_zero_typo', r'000\s*["""«]([^"""»\n,]{3,40})["""»]'),  # частая опечатка
+
+        # ИП - продавец (с ФИО)
+        ('sole_trader', r'(?:ИП|Индивидуальный предприниматель)\s+([А-ЯЁ][а-яё]+\s+[А-ЯЁ][а-яё]+\s+[А-ЯЁ][а-яё]+)', ('sole_trader',)),
+
+        # Поставщик с двоеточием
+        ('supplier_colon', r'Поставщик:\s*([А-ЯЁа-яё\s\-"«»]{3,50})(?:,|\s*ИНН|\n)', ('supplier',)),
+    ]),
+
+    # ПРИОРИТЕТ 0 (ВЫСШИЙ): ИНН в строке "Поставщик:"
+    # Формат: "Поставщик: Акционерное Общество "Балтийское Стекло", ИНН 7801514385"
+    'inn_supplier_line': _register('inn_supplier_line', re.IGNORECASE | re.MULTILINE, anchors=('supplier',), specs=[
+        ('inn_label', r'Поставщик:[^\n]*?ИНН[:\s]*(\d{10,12})'),
+        ('inn_kpp', r'Поставщик:[^\n]*?(\d{10})\s*/\s*\d{9}'),  # ИНН/КПП
+    ]),
+
+    # ПРИОРИТЕТ 1: ИНН из строки "Получатель:" (это поставщик в некоторых форматах счетов!)
+    'inn_receiver': _register('inn_receiver', re.IGNORECASE | re.MULTILINE, anchors=('receiver',), specs=[
+        ('right_after', r'Получатель[:\s]*\n?\s*(\d{10,12})'),  # ИНН сразу после "Получатель"
+        ('same_line', r'Получатель[^\n]{0,100}?ИНН[:\s]*(\d{10,12})'),
+    ]),
+
+    # ПРИОРИТЕТ 2: ИНН СРАЗУ после "Продавец:" в той же строке
+    'inn_seller': _register('inn_seller', re.IGNORECASE | re.MULTILINE, anchors=('seller',), specs=[
+        ('same_line', r'(?:Продавец):[^\n]{0,100}?ИНН[:\s]*(\d{10,12})'),
+    ]),
+
+    # ПРИОРИТЕТ 3: ИНН в контексте "Продавец", "Поставщик" (НЕ "Заказчик"!)
+    'inn_context': _register('inn_context', re.IGNORECASE | re.MULTILINE | re.DOTALL, [
+        ('role_before', r'(?:Продавец|Поставщик)[^\n]{0,200}?ИНН[:\s]*(\d{10,12})', ('seller', 'supplier')),
+        ('role_after', r'ИНН[:\s]*(\d{10,12})[^\n]{0,100}?(?:Продавец|Поставщик)', ('inn',)),
+    ]),
+
+    # ПРИОРИТЕТ 4: Все ИНН в документе (но исключаем ИНН покупателя!)
+    'inn_all': _register('inn_all', re.IGNORECASE | re.MULTILINE, [
+        ('label_colon', r'ИНН[:\s]*(\d{10,12})', ('inn',)),
+        ('label_space', r'ИНН\s+(\d{10,12})', ('inn',)),
+        ('inn_kpp', r'(\d{10})\s*/\s*\d{9}'),  # ИНН/КПП формат
+        ('sole_trader', r'(\d{12})\s*(?:ИП|Индивидуальный предприниматель)', ('sole_trader',)),
+    ]),
+
+    'total_amount': _register('total_amount', re.IGNORECASE | re.MULTILINE, anchors=('total',), specs=[
+        # ПРИОРИТЕТ 1: "Всего наименований ... на сумму ... RUB/руб"
+        ('items_count_sum', r'Всего\s+наименований\s+\d+,?\s*на\s+сумму[\s:]*(\d+(?:[\.,]\d{1,2})?)\s*(?:RUB|руб)'),
+
+        # ПРИОРИТЕТ 2: Всего к оплате (Excel формат: 19034.7 или OCR формат: 19 034,70)
+        ('to_pay', r'(?:всего\s*к\s*оплате|к\s*оплате)[\s:|]*' + _AMOUNT),
+
+        # ПРИОРИТЕТ 3: Итого с НДС
+        ('total_with_vat', r'(?:итого\s*с\s*ндс)[\s:|]*' + _AMOUNT),
+
+        # ПРИОРИТЕТ 4: Итого (любой регистр, с символом |)
+        ('total', r'(?:итого|ИТОГО|Total)[\s:|]*\|?\s*' + _AMOUNT),
+
+        # ПРИОРИТЕТ 5: Всего ... руб (с контекстом)
+        ('all_rub', r'(?:всего|ВСЕГО)[\s\w]{0,100}?' + _AMOUNT + r'[\s]*руб'),
+
+        # ПРИОРИТЕТ 6: "на сумму ... руб"
+        ('for_sum_rub', r'на\s+сумму[\s:]*' + _AMOUNT + r'\s*руб'),
+
+        # ПРИОРИТЕТ 7: К доплате
+        ('to_surcharge', r'(?:к\s*доплате)[\s:|]*' + _AMOUNT),
+
+        # ПРИОРИТЕТ 8: Общая стоимость
+        ('total_cost', r'(?:общая\s*стоимость)[\s:|]*' + _AMOUNT),
+
+        # ПРИОРИТЕТ 9: Сумма к доплате с НДС
+        ('surcharge_with_vat', r'(?:сумма\s*к\s*доплате\s*с\s*ндс)[\s:|]*' + _AMOUNT),
+    ]),
+
+    # Сначала ищем конкретную сумму НДС
+    'vat_amount': _register('vat_amount', re.IGNORECASE | re.UNICODE, anchors=('vat',), specs=[
+        # ПРИОРИТЕТ 1: "НДС 20% - 9 161 руб. 86 коп." (прописью с пробелами)
+        ('rate_rub_kop', r'НДС\s*(\d+)%\s*[-–—:]\s*([0-9]{1,3}(?:\s[0-9]{3})*)\s*руб\.?\s*(\d{2})\s*коп'),
+
+        # ПРИОРИТЕТ 2: "В том числе НДС (20%): СУММА" (Excel: 3172.45 или OCR: 3 172,45)
+        ('including_rate', r'[вВ]\s*том\s*числе\s*НДС\s*\(?\s*(\d+)%?\)?[\s:|]*' + _AMOUNT, ('including',)),
+
+        # ПРИОРИТЕТ 3: "В том числе НДС: СУММА" (без процента)
+        ('including', r'[вВ]\s*том\s*числе\s*НДС[\s:|]*' + _AMOUNT, ('including',)),
+
+        # ПРИОРИТЕТ 4: "НДС 20% - СУММА" или "НДС 20%: СУММА"
+        ('rate_dash', r'НДС\s*(\d+)%\s*[-–—:]\s*' + _AMOUNT),
+
+        # ПРИОРИТЕТ 5: "НДС (20%): СУММА"
+        ('rate_parens', r'НДС\s*\((\d+)%\)[\s:|]*' + _AMOUNT),
+
+        # ПРИОРИТЕТ 6: "НДС 20% СУММА" (без разделителя)
+        ('rate_space', r'НДС\s*(\d+)%[\s]+' + _AMOUNT),
+
+        # ПРИОРИТЕТ 7: "НДС: СУММА" (без процента)
+        ('plain', r'НДС[\s:|]+' + _AMOUNT),
+
+        # ПРИОРИТЕТ 8: НДС в строке с "Итого"
+        # Два промежутка: оба ограничены узко (_NEAR_GAP и не больше 50 символов без цифр до суммы) -
+        # на строке из повторов "Итого НДС" время растёт как произведение их ширин
+        ('total_line', r'(?:Итого|ИТОГО)' + _NEAR_GAP + r'НДС[^\d\n]{0,50}?' + _AMOUNT, ('total',)),
+    ]),
+
+    # Паттерны для определения НДС (упрощенные - только определяем наличие)
+    'vat_presence': _register('vat_presence', re.IGNORECASE | re.UNICODE, [
+        # НДС с указанием процента - ГЛАВНЫЙ ИНДИКАТОР
+        ('rate', r'НДС\s*(\d+)%', ('vat',)),
+        ('rate_ocr', r'Н?ДС\s*(\d+)%'),  # искажения OCR
+        ('rate_ocr_short', r'С\s*(\d+)%'),     # НДС -> С
+
+        # НДС в строках "В том числе НДС"
+        ('including', r'(?:в\s*том\s*числе\s*|В\s*ТОМ\s*ЧИСЛЕ\s*)НДС', ('including',)),
+        ('including_ocr', r'(?:в\s*том\s*числе\s*|том\s*числе\s*)Н?ДС', ('including',)),
+        ('including_ocr_short', r'(?:в\s*том\s*числе\s*|том\s*числе\s*)С', ('including',)),
+
+        # Простое упоминание НДС
+        ('mention', r'НДС[:\s]+[0-9]', ('vat',)),
+        ('mention_ocr', r'Н?ДС[:\s]+[0-9]'),
+        ('mention_ocr_short', r'(?<!\w)С[:\s]+[0-9]'),  # избегаем ложных срабатываний
+    ]),
+}
+
+# Вспомогательные выражения для очистки и проверок
+_RE_WHITESPACE = re.compile(r'\s+')
+_RE_NEWLINE = re.compile(r'\n')
+_RE_NON_AMOUNT_CHARS = re.compile(r'[^\d\.]')
+_RE_DASH_KOPEKS = re.compile(r'^\d+-\d{2}$')
+_RE_BANK_KEYWORD = re.compile(r'БИК|Банк|БАНК|К/С|Кор', re.IGNORECASE)
+_RE_KPP_TAIL = re.compile(r',?\s*КПП.*$', re.IGNORECASE)
+_RE_JOINT_STOCK_PREFIX = re.compile(r'^акционерное\s+общество\s*', re.IGNORECASE)
+_RE_PHONE_TAIL = re.compile(r',?\s*тел\..*$', re.IGNORECASE)
+_RE_ACCOUNT_TAIL = re.compile(r'\s+Сч\.?\s*№?\s*\d+.*$', re.IGNORECASE)
+_RE_BIK_TAIL = re.compile(r'\s+БИК.*$', re.IGNORECASE)
+_RE_BANK_TAIL = re.compile(r'\s+Банк.*$', re.IGNORECASE)
+_RE_REQUISITES_TAIL = re.compile(r'\s*(?:ИНН|БИК|КПП).*$', re.IGNORECASE)
+_RE_STOP_WORD_NAME = re.compile(r'^(Банк|Счет|Дата|руб|город)$', re.IGNORECASE)
+_RE_ORG_FORM_PREFIX = re.compile(r'^(ООО|ИП|АО|ЗАО|ПАО)', re.IGNORECASE)
+
+
+def _find_keywords(lowered: str, words: tuple) -> List[tuple]:
+    """Позиции (start, end) всех вхождений слов в порядке документа"""
+    positions = []
+    for word in words:
+        index = lowered.find(word)
+        while index != -1:
+            positions.append((index, index + len(word)))
+            index = lowered.find(word, index + len(word))
+    positions.sort()
+    return positions
+
+
+class AnchorIndex:
+    """
+    Контекст документа: индекс якорных и ключевых слов, строится один раз на документ.
+    Его позициями пользуются все проверки: тип документа, наличие итоговых слов,
+    фильтры названия поставщика. По запросу (и тоже один раз) считаются начала строк
+    и реквизиты - ИНН, КПП, БИК, расчётные счета с позициями.
+
+    Паттерн с якорями ищется только в окнах вокруг вхождений якорей: окно
+    начинается с ближайшей непустой строки перед строкой якоря (пустые строки
+    между ними паттерн может пройти через пробельные символы) и заканчивается концом
+    строки, следующей за позицией (конец якоря + ANCHOR_WINDOW_TAIL). Пересекающиеся
+    окна склеиваются, поэтому каждый паттерн просматривает текст не более одного раза,
+    а совпадения возвращаются в порядке документа.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.positions: Dict[str, List[tuple]] = {}
+        self._windows: Dict[tuple, List[tuple]] = {}
+        self._line_starts: Optional[List[int]] = None
+        self._requisites: Optional[Dict[str, List[tuple]]] = None
+
+        self.lowered = lowered = text.lower()
+        # lower() может изменить длину строки (например, 'İ') - тогда ищем без понижения регистра
+        if len(lowered) == len(text):
+            regexes, haystack = _ANCHOR_REGEXES, lowered
+        else:
+            regexes, haystack = _ANCHOR_REGEXES_IGNORECASE, text
+
+        for kind, regex in regexes.items():
+            self.positions[kind] = [(m.start(), m.end()) for m in regex.finditer(haystack)]
+
+        for kind, words in KEYWORD_KINDS.items():
+            if haystack is lowered:
+                self.positions[kind] = _find_keywords(lowered, words)
+            else:
+                self.positions[kind] = [(m.start(), m.end()) for m in _KEYWORD_REGEXES_IGNORECASE[kind].finditer(text)]
+
+    def has(self, kind: str) -> bool:
+        """Есть ли в документе хотя бы один якорь данного вида"""
+        return bool(self.positions.get(kind))
+
+    def within(self, kind: str, start: int, end: int) -> bool:
+        """Есть ли слово данного вида целиком внутри text[start:end]"""
+        positions = self.positions.get(kind)
+        if not positions:
+            return False
+        # Вхождения разных слов одного вида могут пересекаться - смотрим все, начатые до end
+        for index in range(bisect_left(positions, (start,)), len(positions)):
+            position_start, position_end = positions[index]
+            if position_start >= end:
+                break
+            if position_end <= end:
+                return True
+        return False
+
+    @property
+    def line_starts(self) -> List[int]:
+        """Позиции начала строк текста (первая - 0)"""
+        if self._line_starts is None:
+            self._line_starts = [0] + [m.end() for m in _RE_NEWLINE.finditer(self.text)]
+        return self._line_starts
+
+    def line_of(self, pos: int) -> int:
+        """Номер строки (с нуля), в которой стоит символ pos"""
+        return bisect_right(self.line_starts, pos) - 1
+
+    def line_start(self, pos: int) -> int:
+        """Начало строки, в которой стоит символ pos"""
+        return self.line_starts[self.line_of(pos)]
+
+    @property
+    def requisites(self) -> Dict[str, List[tuple]]:
+        """Реквизиты документа: вид ('inn', 'kpp', 'bik', 'account') -> [(позиция, цифры)]"""
+        if self._requisites is None:
+            # По тексту в нижнем регистре без IGNORECASE - в несколько раз быстрее
+            if len(self.lowered) == len(self.text):
+                regexes, haystack = _REQUISITE_REGEXES, self.lowered
+            else:
+                regexes, haystack = _REQUISITE_REGEXES_IGNORECASE, self.text
+            self._requisites = {kind: [(m.start(1), m.group(1)) for m in regex.finditer(haystack)]
+                                for kind, regex in regexes.items()}
+        return self._requisites
+
+    def requisite_numbers(self) -> set:
+        """
+        Числа реквизитов (ИНН, КПП, БИК, расчётные счета) - для исключения из сумм.
+        Как у паттерна "ИНН[\\s:]*(\\d{10,12})": берутся первые цифры нужной длины.
+        """
+        numbers = set()
+        for kind, tokens in self.requisites.items():
+            length, min_digits = REQUISITE_KINDS[kind][1], _REQUISITE_MIN_DIGITS[kind]
+            numbers.update(digits[:length] for _, digits in tokens if len(digits) >= min_digits)
+        return numbers
+
+    def windows(self, kinds: tuple) -> List[tuple]:
+        """Склеенные окна (start, end) вокруг всех якорей указанных видов"""
+        if kinds in self._windows:
+            return self._windows[kinds]
+
+        text_length = len(self.text)
+        line_starts = self.line_starts
+        spans = sorted(span for kind in kinds for span in self.positions[kind])
+        merged: List[list] = []
+        for start, end in spans:
+            # С ближайшей непустой строки перед строкой якоря
+            line = max(self.line_of(start) - 1, 0)
+            while line > 0 and not self.text[line_starts[line]:line_starts[line + 1]].strip():
+                line -= 1
+            window_start = line_starts[line]
+
+            # До конца строки, следующей за строкой позиции (конец якоря + хвост)
+            next_line = self.line_of(min(end + ANCHOR_WINDOW_TAIL, text_length)) + 2
+            window_end = line_starts[next_line] - 1 if next_line < len(line_starts) else text_length
+
+            if merged and window_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], window_end)
+            else:
+                merged.append([window_start, window_end])
+
+        result = [tuple(window) for window in merged]
+        self._windows[kinds] = result
+        return result
+
+    def search(self, pattern: InvoicePattern) -> Optional['re.Match']:
+        """Первое совпадение паттерна (в окнах его якорей или по всему тексту)"""
+        if pattern.anchors is None:
+            return pattern.regex.search(self.text)
+        for start, end in self.windows(pattern.anchors):
+            match = pattern.regex.search(self.text, start, end)
+            if match:
+                return match
+        return None
+
+    def finditer(self, pattern: InvoicePattern):
+        """Все совпадения паттерна в порядке документа"""
+        if pattern.anchors is None:
+            yield from pattern.regex.finditer(self.text)
+            return
+        for start, end in self.windows(pattern.anchors):
+            yield from pattern.regex.finditer(self.text, start, end)
+
+    def findall(self, pattern: InvoicePattern) -> list:
+        """Аналог re.findall с учетом окон якорей"""
+        if pattern.anchors is None:
+            return pattern.regex.findall(self.text)
+        found = []
+        for start, end in self.windows(pattern.anchors):
+            found.extend(pattern.regex.findall(self.text, start, end))
+        return found
+
+    def accept(self, pattern: InvoicePattern) -> None:
+        """Извлекатель принял совпадение паттерна (учитывается только в TracingAnchorIndex)"""
+
+    def measure(self, name: str, func, *args):
+        """Вызов извлекателя (TracingAnchorIndex дополнительно замеряет время)"""
+        return func(*args)
+
+
+class TracingAnchorIndex(AnchorIndex):
+    """
+    AnchorIndex для parse_invoice(timings=True): для каждого извлекателя замеряет
+    время (нс), считает опробованные паттерны и запоминает принятый паттерн.
+    Без timings парсер использует обычный AnchorIndex и за замеры не платит.
+    """
+
+    def __init__(self, text: str):
+        started = time.perf_counter_ns()
+        super().__init__(text)
+        self.timings: Dict[str, Dict[str, Any]] = {"anchor_index": {"ns": time.perf_counter_ns() - started}}
+        self._current: Optional[Dict[str, Any]] = None
+
+    def measure(self, name: str, func, *args):
+        entry = {"ns": 0, "patterns_tried": 0, "matched_pattern": None, "matched_index": None}
+        self.timings[name] = entry
+        self._current = entry
+        started = time.perf_counter_ns()
+        try:
+            return func(*args)
+        finally:
+            entry["ns"] = time.perf_counter_ns() - started
+            self._current = None
+
+    def _tried(self):
+        if self._current is not None:
+            self._current["patterns_tried"] += 1
+
+    def search(self, pattern: InvoicePattern) -> Optional['re.Match']:
+        self._tried()
+        return super().search(pattern)
+
+    def finditer(self, pattern: InvoicePattern):
+        self._tried()
+        return super().finditer(pattern)
+
+    def findall(self, pattern: InvoicePattern) -> list:
+        self._tried()
+        return super().findall(pattern)
+
+    def accept(self, pattern: InvoicePattern) -> None:
+        if self._current is not None:
+            self._current["matched_pattern"] = pattern.id
+            self._current["matched_index"] = pattern.priority
+
+
+# Сколько символов конца предыдущей части добавляется к следующей при потоковом разборе
+STREAM_OVERLAP_CHARS = 500
+
+# Строки-разделители частей в тексте PDF (pdf_extract_text) и Excel (office_to_text)
+_RE_CHUNK_BOUNDARY = re.compile(r'^=== (?:СЛЕДУЮЩАЯ СТРАНИЦА|ЛИСТ: .*) ===$', re.MULTILINE)
+
+# Порядок групп в реестре = порядок каскада извлекателей (раньше - надёжнее)
+_GROUP_ORDER = {group: order for order, group in enumerate(PATTERNS)}
+
+
+def _pattern_rank(entry: Dict[str, Any]) -> tuple:
+    """Ранг принятого паттерна по записи TracingAnchorIndex.timings (меньше - лучше)"""
+    if entry.get("matched_pattern") is None:
+        return (len(_GROUP_ORDER), 0)
+    group = entry["matched_pattern"].split('.', 1)[0]
+    return (_GROUP_ORDER[group], entry["matched_index"])
+
+
+def iter_text_chunks(text: str) -> Iterator[str]:
+    """
+    Делит уже склеенный текст на части для parse_stream: по разделителям страниц PDF
+    ("=== СЛЕДУЮЩАЯ СТРАНИЦА ===") и листов Excel ("=== ЛИСТ: ... ==="). Части
+    отдаются лениво, разделители листов остаются в начале своей части.
+    """
+    start = 0
+    for match in _RE_CHUNK_BOUNDARY.finditer(text):
+        if match.start() > start:
+            yield text[start:match.start()]
+        # Заголовок листа несёт имя листа - оставляем, разделитель страниц - отбрасываем
+        start = match.start() if 'ЛИСТ' in match.group() else match.end()
+    if start < len(text):
+        yield text[start:]
 
-# Устанавливаем кодировку stdout для Windows
-if sys.platform == 'win32':
-    import codecs
-    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
-    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.detach())
 
 class UltimateInvoiceParser:
     """Окончательная версия парсера счетов с максимально точным распознаванием"""
@@ -34,78 +654,17 @@ class UltimateInvoiceParser:
             return ""
 
         # Заменяем различные виды пробелов и переносов
-        text = re.sub(r'\s+', ' ', text)
+        text = _RE_WHITESPACE.sub(' ', text)
         text = text.replace('\xa0', ' ')  # Неразрывный пробел
         text = text.replace('\u00a0', ' ')
 
         return text.strip()
 
-    def extract_invoice_number(self, text: str) -> Optional[str]:
+    def extract_invoice_number(self, text: str, anchors: Optional[AnchorIndex] = None) -> Optional[str]:
         """Извлекает номер счета"""
-        patterns = [
-            # ПЕТРОВИЧ И ДРУГИЕ: Буквенно-цифровые номера БЕЗ дефиса (СЭ00846838, ТВЭ01037849) - НАИВЫСШИЙ ПРИОРИТЕТ!
-            r'(?:Счёт|Счет|СЧЁТ|СЧЕТ)\s*([А-ЯЁA-Z]{1,4}\d{6,12})',  # Счёт СЭ00846838
-            r'(?:Заказ|ЗАКАЗ).*?№\s*([А-ЯЁA-Z]{1,4}\d{6,12})',  # Заказ покупателя № ТВЭ01037849
-            r'№\s*([А-ЯЁA-Z]{1,4}\d{6,12})\s*от',  # № СЭ00846838 от
-            
-            # СПЕЦИФИКАЦИЯ (АЛЮТЕХ и др.) - ОЧЕНЬ ВЫСОКИЙ ПРИОРИТЕТ!
-            r'СПЕЦИФИКАЦИЯ\s*№\s*(\d+)',
-            r'Спецификация\s*№\s*(\d+)',
-            
-            # Буквенно-цифровые номера С ДЕФИСОМ (УТ-784, А-123, и т.д.) - ВЫСОКИЙ ПРИОРИТЕТ!
-            r'№\s*([А-ЯЁA-Z]+-\d+)',  
-            r'№\s*([ABCDEFGHIJKLMNOPQRSTUVWXYZАВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ]+-\d+)',
-            r'СЧЁТ.*?№\s*([А-ЯA-Z]+-\d+)',
-            r'СЧЕТ.*?№\s*([А-ЯA-Z]+-\d+)',
-            r'С[ЧТ].*?№\s*([А-ЯA-Z]+-\d+)',
-            r'счёт.*?№\s*([А-ЯA-Z]+-\d+)',
-            r'счет.*?№\s*([А-ЯA-Z]+-\d+)',
-
-            # КРИТИЧНЫЙ ПРИОРИТЕТ: Короткие номера 1-6 цифр (должны быть ПЕРЕД длинными!)
-            # Специальный формат "Счет и Бух-НОМЕР" (из OCR)
-            r'Счет\s+и\s+Бух[-\s]*(\d+)',
-            r'СЧЕТ\s+И\s+БУХ[-\s]*(\d+)',
-            
-            # Паттерны с "от" в той же строке
-            r'СЧЁТ\s*№\s*(\d{1,6})\s*от',
-            r'СЧЕТ\s*№\s*(\d{1,6})\s*от',
-            r'С[ЧТ]\s*№\s*(\d{1,6})\s*от',
-            r'счёт\s*№\s*(\d{1,6})\s*от',
-            r'счет\s*№\s*(\d{1,6})\s*от',
-            # Паттерны БЕЗ "от" - только если после номера НЕ идут 4+ цифр подряд (не БИК/счет)
-            r'СЧЁТ\s*№\s*(\d{1,6})(?!\d)',
-            r'СЧЕТ\s*№\s*(\d{1,6})(?!\d)',
-            r'С[ЧТ]\s*№\s*(\d{1,6})(?!\d)',
-
-            # Счет-договор с номером (из логов: № 22980)
-            r'СЧЁТ[-\s]*ДОГОВОР.*?№\s*(\d+)',
-            r'СЧЕТ[-\s]*ДОГОВОР.*?№\s*(\d+)',
-
-            # Номер с нулями в начале (из логов: 00000007898, 00000007883) - НИЗКИЙ ПРИОРИТЕТ
-            r'№\s*(0{4,}\d+)\s*от',  # Минимум 4 нуля в начале
-            r'СЧЁТ.*?№\s*(0{4,}\d+)',
-            r'СЧЕТ.*?№\s*(0{4,}\d+)',
-            r'С[ЧТ].*?№\s*(0{4,}\d+)',
-
-            # Обычный счет (НИЗКИЙ ПРИОРИТЕТ - могут ловить БИК)
-            r'СЧЁТ.*?№\s*(\d+)',
-            r'СЧЕТ.*?№\s*(\d+)',
-            r'С[ЧТ].*?№\s*(\d+)',    # OCR искажения
-            r'счёт.*?№\s*(\d+)',
-            r'счет.*?№\s*(\d+)',
-            r'№\s*(\d+)\s*от\s*\d',
-            r'Invoice.*?№\s*(\d+)',
-
-            # Универсальные паттерны (с учетом потери символов при OCR/консоли)
-            r'С[ЧТ]\s+(\d+)\s+от',  # "СТ 00000007883 от"
-            r'С[ЧТ].*?(\d{5,})',     # "СТ" + длинное число
-
-            # Номер в начале документа (расширенный диапазон) - ПОСЛЕДНИЙ ПРИОРИТЕТ
-            r'№\s*(\d{2,10})\s*от',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.UNICODE)
+        anchors = anchors or AnchorIndex(text)
+        for pattern in PATTERNS['invoice_number']:
+            match = anchors.search(pattern)
             if match:
                 number = match.group(1).strip()
 
@@ -120,36 +679,48 @@ class UltimateInvoiceParser:
                 # Исключаем ИНН (обычно 10 или 12 цифр)
                 if number.isdigit() and len(number) in [10, 12]:
                     # Проверяем, что это не ИНН
-                    if re.search(rf'ИНН\s*{re.escape(number)}', text, re.IGNORECASE):
+                    if self._follows_inn_label(anchors, number):
                         continue
                 
                 # Исключаем БИК (9 цифр, обычно начинается с 04)
                 if number.isdigit() and len(number) == 9 and number.startswith('04'):
                     # Проверяем контекст - если рядом "БИК" или "Банк"
-                    if re.search(rf'(?:БИК|Банк|БАНК|К/С|Кор).*?{re.escape(number)}', text, re.IGNORECASE):
+                    if self._follows_bank_keyword(anchors, number):
                         continue
                     # Или если БИК упоминается в том же блоке
-                    context = text[max(0, text.find(number) - 100):text.find(number) + 100]
-                    if re.search(r'БИК|Банк|К/С|Кор', context, re.IGNORECASE):
+                    pos = text.find(number)
+                    context = text[max(0, pos - 100):pos + 100]
+                    if _RE_BANK_KEYWORD.search(context):
                         continue
 
                 if self.debug:
                     print(f"Найден номер счета: {number}")
+                anchors.accept(pattern)
                 return number
 
         return None
 
-    def extract_date(self, text: str) -> Optional[str]:
+    def _follows_inn_label(self, anchors: AnchorIndex, number: str) -> bool:
+        """
+        Стоит ли число сразу после метки "ИНН" (по ИНН из контекста документа). Метка -
+        как в REQUISITE_KINDS: "ИНН 7839120887", "ИНН: 7839120887", "И.Н.Н. 7839120887"
+        """
+        return any(digits.startswith(number) for _, digits in anchors.requisites['inn'])
+
+    def _follows_bank_keyword(self, anchors: AnchorIndex, number: str) -> bool:
+        """Есть ли в той же строке перед числом БИК/Банк/К/С (аналог поиска (?:БИК|...).*?<число>)"""
+        text = anchors.text
+        pos = text.find(number)
+        while pos != -1:
+            if _RE_BANK_KEYWORD.search(text, anchors.line_start(pos), pos):
+                return True
+            pos = text.find(number, pos + 1)
+        return False
+
+    def extract_date(self, text: str, anchors: Optional[AnchorIndex] = None) -> Optional[str]:
         """Извлекает дату счета"""
-        patterns = [
-            r'(\d{1,2})\s+(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(\d{4})',
-            r'(\d{1,2})\.(\d{1,2})\.(\d{4})',
-            r'(\d{1,2})/(\d{1,2})/(\d{4})',
-            r'(\d{4})-(\d{1,2})-(\d{1,2})',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.UNICODE)
+        for pattern in PATTERNS['date']:
+            match = anchors.search(pattern) if anchors else pattern.regex.search(text)
             if match:
                 groups = match.groups()
                 if len(groups) == 3:
@@ -161,71 +732,57 @@ class UltimateInvoiceParser:
                         date_str = f"{year}-{month_num}-{day.zfill(2)}"
                         if self.debug:
                             print(f"Найдена дата: {date_str}")
+                        if anchors:
+                            anchors.accept(pattern)
                         return date_str
                     # Если месяц - число
                     elif month.isdigit():
                         date_str = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
                         if self.debug:
                             print(f"Найдена дата: {date_str}")
+                        if anchors:
+                            anchors.accept(pattern)
                         return date_str
 
         return None
 
-    def extract_due_date(self, text: str) -> Optional[str]:
+    def extract_due_date(self, text: str, anchors: Optional[AnchorIndex] = None) -> Optional[str]:
         """Извлекает дату оплаты"""
-        patterns = [
-            r'(?:оплатить|оплата).*?не\s+позднее\s+(\d{1,2})\.(\d{1,2})\.(\d{4})',
-            r'не\s+позднее\s+(\d{1,2})\.(\d{1,2})\.(\d{4})',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.UNICODE)
+        for pattern in PATTERNS['due_date']:
+            match = anchors.search(pattern) if anchors else pattern.regex.search(text)
             if match:
                 day, month, year = match.groups()
                 date_str = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
                 if self.debug:
                     print(f"Найдена дата оплаты: {date_str}")
+                if anchors:
+                    anchors.accept(pattern)
                 return date_str
 
         return None
 
-    def extract_contractor_name(self, text: str) -> Optional[str]:
+    def extract_contractor_name(self, text: str, anchors: Optional[AnchorIndex] = None) -> Optional[str]:
         """Извлекает название организации-поставщика"""
-        
-        # ИНН покупателя для исключения (Ткачев С.О.)
-        buyer_inn = '784802613697'
-        buyer_patterns = ['ткачев', 'tkachev', buyer_inn]
+        anchors = anchors or AnchorIndex(text)
 
         # 1. ВЫСШИЙ ПРИОРИТЕТ: Прямое указание "Поставщик:" в начале строки
-        # Формат: "Поставщик: Акционерное Общество "Балтийское Стекло", ИНН 7801514385"
-        direct_supplier_patterns = [
-            # АО/ОАО/ЗАО/ПАО с кавычками
-            r'Поставщик:\s*((?:Акционерное\s+Общество|АО|ОАО|ЗАО|ПАО)\s*["""«]([^"""»\n]{3,60})["""»])',
-            # ООО с кавычками
-            r'Поставщик:\s*(ООО\s*["""«]([^"""»\n]{3,60})["""»])',
-            # Любая орг. форма + название до запятой/ИНН
-            r'Поставщик:\s*((?:АО|ОАО|ЗАО|ПАО|ООО)\s*["""«]?[^,\n]{3,60}?)(?:,\s*ИНН|\s+ИНН)',
-            # Акционерное Общество полностью
-            r'Поставщик:\s*(Акционерное\s+Общество\s*["""«]?[^,\n]{3,60}?)(?:,|\s+ИНН)',
-        ]
-        
-        for pattern in direct_supplier_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        for pattern in PATTERNS['contractor_direct']:
+            match = anchors.search(pattern)
             if match:
                 company_name = match.group(1).strip()
                 
                 # Проверяем, что это НЕ покупатель
-                if any(buyer in company_name.lower() for buyer in buyer_patterns):
+                if self._name_has(anchors, match, company_name, 'buyer'):
                     continue
                 
                 # Очистка
-                company_name = re.sub(r'\s+', ' ', company_name)
-                company_name = re.sub(r',?\s*КПП.*$', '', company_name, flags=re.IGNORECASE)
+                company_name = _RE_WHITESPACE.sub(' ', company_name)
+                company_name = _RE_KPP_TAIL.sub('', company_name)
                 company_name = company_name.strip('"«»""')
                 
                 # Нормализация АО
                 if company_name.lower().startswith('акционерное общество'):
-                    name_part = re.sub(r'^акционерное\s+общество\s*', '', company_name, flags=re.IGNORECASE).strip('"«»"" ')
+                    name_part = _RE_JOINT_STOCK_PREFIX.sub('', company_name).strip('"«»"" ')
                     company_name = f'АО "{name_part}"'
                 elif company_name.startswith('АО ') and '"' not in company_name:
                     name_part = company_name[3:].strip()
@@ -234,23 +791,12 @@ class UltimateInvoiceParser:
                 if len(company_name) >= 5:
                     if self.debug:
                         print(f"Найдено название поставщика (прямое указание): '{company_name}'")
+                    anchors.accept(pattern)
                     return company_name
 
         # 2. Приоритетные известные компании (точные совпадения из логов)
-        known_companies = [
-            r'Балтийское\s+Стекло',  # Добавлено!
-            r'МЕТАЛЛМАСТЕР-М',
-            r'АлРус',
-            r'Эксперт\s+Рентал\s+Инжиниринг',
-            r'ксперт\s+ентал\s+нжиниринг',  # OCR часто пропускает первые буквы
-            r'Петрович',
-            r'ОЗЕРОВ\s+МАКСИМ\s+НИКОЛАЕВИЧ',
-            r'ООО\s*["""«]?Спецмаш["""»]?',
-            r'Спецмаш',
-        ]
-
-        for pattern in known_companies:
-            match = re.search(pattern, text, re.IGNORECASE | re.UNICODE)
+        for pattern in PATTERNS['contractor_known']:
+            match = anchors.search(pattern)
             if match:
                 company_name = match.group().strip()
 
@@ -264,24 +810,12 @@ class UltimateInvoiceParser:
 
                 if self.debug:
                     print(f"Найдено название: '{company_name}'")
+                anchors.accept(pattern)
                 return company_name
 
         # 3. КРИТИЧНО ДЛЯ EXCEL: Ищем поставщика в строке с "Получатель:" (это ПРОДАВЕЦ!)
-        # В вашем формате счетов:
-        # Получатель: ООО "Группа компаний "СтиС"" - это ПОСТАВЩИК (продавец)
-        # Заказчик: ИП Ткачев С.О. - это ПОКУПАТЕЛЬ (вы)
-        excel_supplier_patterns = [
-            # Получатель - это поставщик в данном формате
-            r'Получатель[:\s]*\n?\s*(\d+/\d+)\s+((?:ООО|ИП|АО|ЗАО)[^,\n]{3,80})',  # С номером счета
-            r'Получатель[:\s]*\n?\s*((?:ООО|ИП|АО|ЗАО)\s+["""«]?[^"""»\n]{3,60}["""»]?)',
-            
-            # Продавец/Поставщик с организационной формой
-            r'(?:Продавец|Поставщик):\s*(ООО|ИП|АО|ЗАО)\s*["""«]?([^"""»\n,]{3,50})["""»]?(?:,|\s*ИНН)',
-            r'(?:Продавец|Поставщик):\s*([^\n,]+?)(?:,\s*ИНН|\s+ИНН)',
-        ]
-        
-        for pattern in excel_supplier_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        for pattern in PATTERNS['contractor_excel']:
+            match = anchors.search(pattern)
             if match:
                 if len(match.groups()) == 2 and match.group(1) and '/' in match.group(1):
                     # Формат с номером счета: пропускаем номер, берем название
@@ -294,15 +828,15 @@ class UltimateInvoiceParser:
                     company_name = match.group(1).strip()
                 
                 # Очистка от номеров счетов и банковских реквизитов
-                company_name = re.sub(r'\s+', ' ', company_name)
-                company_name = re.sub(r',?\s*тел\..*$', '', company_name, flags=re.IGNORECASE)  # Убираем ", тел."
-                company_name = re.sub(r'\s+Сч\.?\s*№?\s*\d+.*$', '', company_name, flags=re.IGNORECASE)  # Убираем "Сч. № 123456..."
-                company_name = re.sub(r'\s+БИК.*$', '', company_name, flags=re.IGNORECASE)  # Убираем "БИК..."
-                company_name = re.sub(r'\s+Банк.*$', '', company_name, flags=re.IGNORECASE)  # Убираем "Банк..."
+                company_name = _RE_WHITESPACE.sub(' ', company_name)
+                company_name = _RE_PHONE_TAIL.sub('', company_name)  # Убираем ", тел."
+                company_name = _RE_ACCOUNT_TAIL.sub('', company_name)  # Убираем "Сч. № 123456..."
+                company_name = _RE_BIK_TAIL.sub('', company_name)  # Убираем "БИК..."
+                company_name = _RE_BANK_TAIL.sub('', company_name)  # Убираем "Банк..."
                 company_name = company_name.strip('"«»""')
                 
                 # Исключаем покупателя (вас)
-                if any(buyer in company_name.lower() for buyer in buyer_patterns):
+                if self._name_has(anchors, match, company_name, 'buyer'):
                     continue
                 
                 if len(company_name) >= 5:
@@ -313,70 +847,52 @@ class UltimateInvoiceParser:
                     
                     if self.debug:
                         print(f"Найдено название поставщика (Excel формат): '{company_name}'")
+                    anchors.accept(pattern)
                     return company_name
 
-        # 4. Ищем в строках с "Получатель", "Продавец", "Поставщик" - избегаем фрагментов про самовывоз
-        supplier_context_patterns = [
-            r'(?:Получатель|Продавец|Поставщик)[\s:]*\n?\s*((?:ООО|ИП|АО|ЗАО|ПАО)\s*["""«]?[^"""»\n]{3,50}["""»]?)',
-            r'(?:Получатель|Продавец|Поставщик)[^\n]{0,200}?((?:ООО|ИП|АО)\s*["""«][^"""»\n]{3,50}["""»])',
-        ]
-        
-        for pattern in supplier_context_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+        # 4. Ищем в строках с "Получатель", "Продавец", "Поставщик"
+        for pattern in PATTERNS['contractor_context']:
+            match = anchors.search(pattern)
             if match:
                 company_name = match.group(1).strip()
                 
                 # Исключаем покупателя
-                if any(buyer in company_name.lower() for buyer in buyer_patterns):
+                if self._name_has(anchors, match, company_name, 'buyer'):
                     continue
                 
                 # Очистка
-                company_name = re.sub(r'\s+', ' ', company_name)
-                company_name = re.sub(r'\s*(?:ИНН|БИК|КПП).*$', '', company_name, flags=re.IGNORECASE)
+                company_name = _RE_WHITESPACE.sub(' ', company_name)
+                company_name = _RE_REQUISITES_TAIL.sub('', company_name)
                 company_name = company_name.strip('"«»""')
                 
                 # Исключаем неподходящие фрагменты
                 if (len(company_name) >= 5 and
-                    'самовывоз' not in company_name.lower() and
-                    'доверенности' not in company_name.lower() and
-                    'паспорта' not in company_name.lower()):
+                    not self._name_has(anchors, match, company_name, 'not_company',
+                                       ('самовывоз', 'доверенности', 'паспорта'))):
                     if self.debug:
                         print(f"Найдено название поставщика (с контекстом): '{company_name}'")
+                    anchors.accept(pattern)
                     return company_name
 
         # 5. ООО в кавычках по всему тексту
-        patterns = [
-            # ООО с вложенными кавычками - жадный захват до последней кавычки
-            r'ООО\s*"(.*)"',
-            r'ООО\s*["""«]([^"""»\n,]{3,40})["""»]',
-            r'000\s*["""«]([^"""»\n,]{3,40})["""»]',  # частая опечатка
-
-            # ИП - продавец (с ФИО)
-            r'(?:ИП|Индивидуальный предприниматель)\s+([А-ЯЁ][а-яё]+\s+[А-ЯЁ][а-яё]+\s+[А-ЯЁ][а-яё]+)',
-
-            # Поставщик с двоеточием
-            r'Поставщик:\s*([А-ЯЁа-яё\s\-"«»]{3,50})(?:,|\s*ИНН|\n)',
-        ]
-
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE | re.UNICODE)
+        for pattern in PATTERNS['contractor_generic']:
+            matches = anchors.finditer(pattern)
             for match in matches:
                 company_name = match.group(1).strip().strip('"«»""')
 
                 # Очистка и валидация
-                company_name = re.sub(r'\s+', ' ', company_name)  # Нормализуем пробелы
-                company_name = re.sub(r'\s*(?:ИНН|БИК|КПП).*$', '', company_name, flags=re.IGNORECASE)
+                company_name = _RE_WHITESPACE.sub(' ', company_name)  # Нормализуем пробелы
+                company_name = _RE_REQUISITES_TAIL.sub('', company_name)
 
                 # Исключаем неподходящие фрагменты
                 if (len(company_name) >= 3 and
                     not company_name.isdigit() and
-                    'самовывоз' not in company_name.lower() and
-                    'при наличии' not in company_name.lower() and
-                    'доверенности' not in company_name.lower() and
-                    not re.match(r'^(Банк|Счет|Дата|руб|город)$', company_name, re.IGNORECASE)):
+                    not self._name_has(anchors, match, company_name, 'not_company',
+                                       ('самовывоз', 'при наличии', 'доверенности')) and
+                    not _RE_STOP_WORD_NAME.match(company_name)):
 
                     # Добавляем префикс ООО/ИП если его нет
-                    if not re.match(r'^(ООО|ИП|АО|ЗАО|ПАО)', company_name, re.IGNORECASE):
+                    if not _RE_ORG_FORM_PREFIX.match(company_name):
                         if 'ИП' in text or 'Индивидуальный предприниматель' in text:
                             company_name = f'ИП {company_name}'
                         else:
@@ -396,98 +912,91 @@ class UltimateInvoiceParser:
                     
                     if self.debug:
                         print(f"Найдено название: '{company_name}'")
+                    anchors.accept(pattern)
                     return company_name
 
         return None
 
-    def extract_inn(self, text: str) -> Optional[list]:
+    def _name_has(self, anchors: AnchorIndex, match: 're.Match', company_name: str,
+                  kind: str, words: Optional[tuple] = None) -> bool:
+        """
+        Есть ли в названии одно из слов words (по умолчанию - слова вида kind из
+        KEYWORD_KINDS). Сначала по индексу: если внутри совпадения нет ключевых слов
+        вида kind, их нет и в очищенном названии - lower() и поиск подстрок не нужны.
+        """
+        if not anchors.within(kind, match.start(), match.end()):
+            return False
+        company_name = company_name.lower()
+        return any(word in company_name for word in words or KEYWORD_KINDS[kind])
+
+    def extract_inn(self, text: str, anchors: Optional[AnchorIndex] = None) -> Optional[list]:
         """Извлекает ИНН поставщика и покупателя (приоритет поставщику)"""
+        anchors = anchors or AnchorIndex(text)
         
         # ИСКЛЮЧАЕМ ИНН Ткачева (это покупатель, а не поставщик!)
         buyer_inn = '784802613697'
         
         supplier_inn = None
         
-        # ПРИОРИТЕТ 0 (ВЫСШИЙ): ИНН в строке "Поставщик:" 
-        # Формат: "Поставщик: Акционерное Общество "Балтийское Стекло", ИНН 7801514385"
-        direct_postavschik_patterns = [
-            r'Поставщик:[^\n]*?ИНН[:\s]*(\d{10,12})',
-            r'Поставщик:[^\n]*?(\d{10})\s*/\s*\d{9}',  # ИНН/КПП
-        ]
-        
-        for pattern in direct_postavschik_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        # ПРИОРИТЕТ 0 (ВЫСШИЙ): ИНН в строке "Поставщик:"
+        for pattern in PATTERNS['inn_supplier_line']:
+            match = anchors.search(pattern)
             if match:
                 found_inn = match.group(1)
                 if found_inn != buyer_inn and len(found_inn) in [10, 12]:
                     supplier_inn = found_inn
                     if self.debug:
                         print(f"Найден ИНН поставщика (строка Поставщик): {supplier_inn}")
+                    anchors.accept(pattern)
                     break
         
         # ПРИОРИТЕТ 1: ИНН из строки "Получатель:" (это поставщик в некоторых форматах счетов!)
         if not supplier_inn:
-            receiver_patterns = [
-                r'Получатель[:\s]*\n?\s*(\d{10,12})',  # ИНН сразу после "Получатель"
-                r'Получатель[^\n]{0,100}?ИНН[:\s]*(\d{10,12})',
-            ]
-            
-            for pattern in receiver_patterns:
-                match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+            for pattern in PATTERNS['inn_receiver']:
+                match = anchors.search(pattern)
                 if match:
                     found_inn = match.group(1)
                     if found_inn != buyer_inn and len(found_inn) in [10, 12]:
                         supplier_inn = found_inn
                         if self.debug:
                             print(f"Найден ИНН поставщика (Получатель): {supplier_inn}")
+                        anchors.accept(pattern)
                         break
         
         # ПРИОРИТЕТ 2: ИНН СРАЗУ после "Продавец:" в той же строке
         if not supplier_inn:
-            direct_supplier_patterns = [
-                r'(?:Продавец):[^\n]{0,100}?ИНН[:\s]*(\d{10,12})',
-            ]
-            
-            for pattern in direct_supplier_patterns:
-                match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+            for pattern in PATTERNS['inn_seller']:
+                match = anchors.search(pattern)
                 if match:
                     found_inn = match.group(1)
                     if found_inn != buyer_inn:
                         supplier_inn = found_inn
                         if self.debug:
                             print(f"Найден ИНН поставщика (прямое указание): {supplier_inn}")
+                        anchors.accept(pattern)
                         break
         
         # ПРИОРИТЕТ 3: ИНН в контексте "Продавец", "Поставщик" (НЕ "Заказчик"!)
         if not supplier_inn:
-            supplier_context_patterns = [
-                r'(?:Продавец|Поставщик)[^\n]{0,200}?ИНН[:\s]*(\d{10,12})',
-                r'ИНН[:\s]*(\d{10,12})[^\n]{0,100}?(?:Продавец|Поставщик)',
-            ]
-            
-            for pattern in supplier_context_patterns:
-                match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+            for pattern in PATTERNS['inn_context']:
+                match = anchors.search(pattern)
                 if match:
                     found_inn = match.group(1)
                     if found_inn != buyer_inn:
                         supplier_inn = found_inn
                         if self.debug:
                             print(f"Найден ИНН поставщика (с контекстом): {supplier_inn}")
+                        anchors.accept(pattern)
                         break
         
         # ПРИОРИТЕТ 4: Все ИНН в документе (но исключаем ИНН покупателя!)
-        inn_patterns = [
-            r'ИНН[:\s]*(\d{10,12})',
-            r'ИНН\s+(\d{10,12})',
-            r'(\d{10})\s*/\s*\d{9}',  # ИНН/КПП формат
-            r'(\d{12})\s*(?:ИП|Индивидуальный предприниматель)',
-        ]
-
         found_inns = []
-        for pattern in inn_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
+        for pattern in PATTERNS['inn_all']:
+            matches = anchors.findall(pattern)
             for match in matches:
                 if len(match) in [10, 12]:  # Валидная длина ИНН
+                    if not supplier_inn and not found_inns:
+                        anchors.accept(pattern)
                     found_inns.append(match)
 
         # Убираем дубликаты, сохраняя порядок
@@ -510,100 +1019,33 @@ class UltimateInvoiceParser:
             print(f"Все найденные ИНН: {result} (первый - поставщик)")
         return result
 
-    def extract_total_amount(self, text: str) -> Optional[float]:
+    def extract_total_amount(self, text: str, anchors: Optional[AnchorIndex] = None) -> Optional[float]:
         """Извлекает общую сумму"""
-        # Сначала найдем все ИНН и БИК в тексте, чтобы исключить их
-        inn_patterns = [
-            r'ИНН[\s:]*(\d{10,12})',
-            r'инн[\s:]*(\d{10,12})',
-            r'И\.Н\.Н\.[\s:]*(\d{10,12})',
-        ]
-
-        # Паттерны для БИК (всегда 9 цифр)
-        bik_patterns = [
-            r'БИК[\s:]*(\d{9})',
-            r'бик[\s:]*(\d{9})',
-            r'Б\.И\.К\.[\s:]*(\d{9})',
-        ]
-
-        # Паттерны для номеров счетов (обычно 20 цифр)
-        account_patterns = [
-            r'Сч\.?\s*№?\s*(\d{20})',
-            r'сч\.?\s*№?\s*(\d{20})',
-            r'счет[\s№]*(\d{20})',
-            r'р/с[\s:]*(\d{20})',
-        ]
-
-        excluded_numbers = set()
-
-        # Собираем все ИНН
-        for pattern in inn_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                excluded_numbers.add(match)
-
-        # Собираем все БИК
-        for pattern in bik_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                excluded_numbers.add(match)
-
-        # Собираем номера счетов
-        for pattern in account_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                excluded_numbers.add(match)
+        anchors = anchors or AnchorIndex(text)
+        # ИНН, КПП, БИК и номера счетов из контекста документа - их исключаем
+        excluded_numbers = anchors.requisite_numbers()
 
         if self.debug:
-            print(f"Исключаемые числа (ИНН, БИК, счета): {excluded_numbers}")
-
-        patterns = [
-            # ПРИОРИТЕТ 1: "Всего наименований ... на сумму ... RUB/руб"
-            r'Всего\s+наименований\s+\d+,?\s*на\s+сумму[\s:]*(\d+(?:[\.,]\d{1,2})?)\s*(?:RUB|руб)',
-            
-            # ПРИОРИТЕТ 2: Всего к оплате (Excel формат: 19034.7 или OCR формат: 19 034,70)
-            r'(?:всего\s*к\s*оплате|к\s*оплате)[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 3: Итого с НДС
-            r'(?:итого\s*с\s*ндс)[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 4: Итого (любой регистр, с символом |)
-            r'(?:итого|ИТОГО|Total)[\s:|]*\|?\s*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 5: Всего ... руб (с контекстом)
-            r'(?:всего|ВСЕГО)[\s\w]*?(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)[\s]*руб',
-            
-            # ПРИОРИТЕТ 6: "на сумму ... руб"
-            r'на\s+сумму[\s:]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)\s*руб',
-            
-            # ПРИОРИТЕТ 7: К доплате
-            r'(?:к\s*доплате)[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 8: Общая стоимость
-            r'(?:общая\s*стоимость)[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 9: Сумма к доплате с НДС
-            r'(?:сумма\s*к\s*доплате\s*с\s*ндс)[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-        ]
-        
+            print(f"Исключаемые числа (ИНН, КПП, БИК, счета): {excluded_numbers}")
+
         # Проверяем наличие ключевых слов для итоговой суммы
-        has_total_keywords = bool(re.search(r'итого|всего|к\s*оплате|total|сумма', text, re.IGNORECASE))
+        has_total_keywords = anchors.has('total')
 
-        for i, pattern in enumerate(patterns):
-            matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
+        for pattern in PATTERNS['total_amount']:
+            matches = anchors.findall(pattern)
             if matches:
                 # Берем первое найденное совпадение (приоритет по порядку паттернов)
-                amount_str = matches[0] if isinstance(matches[0], str) else matches[0]
+                amount_str = matches[0]
                 try:
                     # Специальная обработка формата с дефисом (например, 168897-22)
-                    if '-' in amount_str and re.match(r'^\d+-\d{2}$', amount_str):
+                    if '-' in amount_str and _RE_DASH_KOPEKS.match(amount_str):
                         # Заменяем дефис на точку для правильного формата
                         amount_clean = amount_str.replace('-', '.')
                     else:
                         # Очищаем и конвертируем сумму
                         amount_clean = amount_str.replace(' ', '').replace(',', '.')
                         # Убираем лишние символы
-                        amount_clean = re.sub(r'[^\d\.]', '', amount_clean)
+                        amount_clean = _RE_NON_AMOUNT_CHARS.sub('', amount_clean)
 
                     amount = float(amount_clean)
 
@@ -631,6 +1073,7 @@ class UltimateInvoiceParser:
                     if amount > 100:  # Минимальная разумная сумма счета
                         if self.debug:
                             print(f"Найдена сумма: {amount}")
+                        anchors.accept(pattern)
                         return amount
                 except ValueError:
                     continue
@@ -642,41 +1085,16 @@ class UltimateInvoiceParser:
         
         return None
 
-    def extract_vat_info(self, text: str) -> tuple[Optional[float], Optional[float]]:
+    def extract_vat_info(self, text: str, anchors: Optional[AnchorIndex] = None) -> tuple[Optional[float], Optional[float]]:
         """Определяет наличие НДС в счете и извлекает сумму НДС"""
+        anchors = anchors or AnchorIndex(text)
         vat_rate = None
         vat_amount = None
         has_vat = False
 
         # Сначала ищем конкретную сумму НДС
-        vat_amount_patterns = [
-            # ПРИОРИТЕТ 1: "НДС 20% - 9 161 руб. 86 коп." (прописью с пробелами)
-            r'НДС\s*(\d+)%\s*[-–—:]\s*([0-9]{1,3}(?:\s[0-9]{3})*)\s*руб\.?\s*(\d{2})\s*коп',
-            
-            # ПРИОРИТЕТ 2: "В том числе НДС (20%): СУММА" (Excel: 3172.45 или OCR: 3 172,45)
-            r'[вВ]\s*том\s*числе\s*НДС\s*\(?\s*(\d+)%?\)?[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 3: "В том числе НДС: СУММА" (без процента)
-            r'[вВ]\s*том\s*числе\s*НДС[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 4: "НДС 20% - СУММА" или "НДС 20%: СУММА"
-            r'НДС\s*(\d+)%\s*[-–—:]\s*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 5: "НДС (20%): СУММА"
-            r'НДС\s*\((\d+)%\)[\s:|]*(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 6: "НДС 20% СУММА" (без разделителя)
-            r'НДС\s*(\d+)%[\s]+(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 7: "НДС: СУММА" (без процента)
-            r'НДС[\s:|]+(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-            
-            # ПРИОРИТЕТ 8: НДС в строке с "Итого"
-            r'(?:Итого|ИТОГО).*?НДС.*?(\d+(?:[\s,\.]\d{3})*(?:[\.,]\d{1,2})?)',
-        ]
-
-        for pattern in vat_amount_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.UNICODE)
+        for pattern in PATTERNS['vat_amount']:
+            match = anchors.search(pattern)
             if match:
                 has_vat = True
                 try:
@@ -688,63 +1106,49 @@ class UltimateInvoiceParser:
                         vat_amount = float(f"{rubles}.{kopeks}")
                         if self.debug:
                             print(f"Найден НДС прописью: ставка {vat_rate}%, сумма {vat_amount}")
+                        anchors.accept(pattern)
                         return vat_amount, vat_rate
                     elif len(groups) == 2:  # НДС с процентом и суммой
                         vat_rate = float(groups[0])
                         vat_amount_str = groups[1].replace(' ', '').replace(',', '.')
-                        vat_amount_str = re.sub(r'[^\d\.]', '', vat_amount_str)
+                        vat_amount_str = _RE_NON_AMOUNT_CHARS.sub('', vat_amount_str)
                         vat_amount = float(vat_amount_str)
                         if self.debug:
                             print(f"Найден НДС: ставка {vat_rate}%, сумма {vat_amount}")
+                        anchors.accept(pattern)
                         return vat_amount, vat_rate
                     elif len(groups) == 1:  # Только сумма НДС
                         vat_amount_str = groups[0].replace(' ', '').replace(',', '.')
-                        vat_amount_str = re.sub(r'[^\d\.]', '', vat_amount_str)
+                        vat_amount_str = _RE_NON_AMOUNT_CHARS.sub('', vat_amount_str)
                         vat_amount = float(vat_amount_str)
                         if self.debug:
                             print(f"Найдена сумма НДС: {vat_amount}")
+                        anchors.accept(pattern)
                         break
                 except (IndexError, ValueError) as e:
                     if self.debug:
                         print(f"Ошибка парсинга НДС: {e}, groups: {groups}")
                     continue
 
-        # Паттерны для определения НДС (упрощенные - только определяем наличие)
-        vat_patterns = [
-            # НДС с указанием процента - ГЛАВНЫЙ ИНДИКАТОР
-            r'НДС\s*(\d+)%',
-            r'Н?ДС\s*(\d+)%',  # искажения OCR
-            r'С\s*(\d+)%',     # НДС -> С
-
-            # НДС в строках "В том числе НДС"
-            r'(?:в\s*том\s*числе\s*|В\s*ТОМ\s*ЧИСЛЕ\s*)НДС',
-            r'(?:в\s*том\s*числе\s*|том\s*числе\s*)Н?ДС',
-            r'(?:в\s*том\s*числе\s*|том\s*числе\s*)С',
-
-            # Простое упоминание НДС
-            r'НДС[:\s]+[0-9]',
-            r'Н?ДС[:\s]+[0-9]',
-            r'(?<!\w)С[:\s]+[0-9]',  # избегаем ложных срабатываний
-        ]
-
         # Если сумма НДС не найдена, ищем хотя бы ставку
         if not has_vat:
-            for i, pattern in enumerate(vat_patterns):
-                match = re.search(pattern, text, re.IGNORECASE | re.UNICODE)
+            for pattern in PATTERNS['vat_presence']:
+                match = anchors.search(pattern)
                 if match:
                     has_vat = True
+                    anchors.accept(pattern)
                     try:
                         # Если найден процент, извлекаем его
                         if match.groups() and match.group(1).isdigit():
                             vat_rate = float(match.group(1))
                             if self.debug:
-                                print(f"Найден НДС: ставка {vat_rate}% (паттерн {i})")
+                                print(f"Найден НДС: ставка {vat_rate}% (паттерн {pattern.id})")
                             break
                     except (IndexError, ValueError):
                         pass
 
                     if self.debug:
-                        print(f"Найден НДС без ставки (паттерн {i})")
+                        print(f"Найден НДС без ставки (паттерн {pattern.id})")
                     # Если процент не найден, но НДС есть, ставим стандартную ставку
                     if not vat_rate:
                         vat_rate = 20.0  # Стандартная ставка в России
@@ -767,78 +1171,141 @@ class UltimateInvoiceParser:
         return None
 
     def extract_items(self, text: str) -> List[Dict[str, Any]]:
-        """Извлекает товарные позиции - ВРЕМЕННО ОТКЛЮЧЕНО"""
+        """
+        Товарные позиции по тексту не извлекаются: колонки таблицы в плоском тексте
+        теряются. Для Excel позиции читаются из ячеек (python-scripts/excel_grid.py)
+        и передаются в parse_invoice(resolved={"items": [...]}).
+        """
         if self.debug:
-            print("Парсинг товаров временно отключен - сосредоточимся на основных полях")
+            print("Товарные позиции по тексту не извлекаются (для Excel - из ячеек, resolved['items'])")
         return []
 
-    def is_invoice_document(self, text: str) -> bool:
-        """Проверяет, является ли документ счетом-фактурой"""
-        # Ключевые слова для счетов
-        invoice_keywords = [
-            'счёт', 'счет', 'счёт-фактура', 'счет-фактура', 'invoice',
-            'итого', 'всего к оплате', 'к доплате', 'общая стоимость'
-        ]
-
-        # Ключевые слова для НЕ счетов (исключения)
-        exclusion_keywords = [
-            'информационная карта', 'участника торгов', 'участника подрядных торгов',
-            'анкета', 'заявка', 'справка о деятельности', 'реквизиты организации'
-        ]
-
-        text_lower = text.lower()
+    def is_invoice_document(self, text: str, anchors: Optional[AnchorIndex] = None) -> bool:
+        """
+        Проверяет, является ли документ счетом-фактурой: есть ключевые слова счета
+        ("счет", "invoice", "итого", "всего к оплате", "к доплате", "общая стоимость")
+        и нет слов анкет, заявок и карточек организации (вид 'not_invoice').
+        """
+        anchors = anchors or AnchorIndex(text)
 
         # Проверяем на исключения
-        for keyword in exclusion_keywords:
-            if keyword in text_lower:
-                return False
+        if anchors.has('not_invoice'):
+            return False
 
         # Проверяем наличие ключевых слов счета
-        invoice_score = 0
-        for keyword in invoice_keywords:
-            if keyword in text_lower:
-                invoice_score += 1
-
-        return invoice_score >= 1
-
-    def parse_invoice(self, text: str) -> Dict[str, Any]:
-        """Основной метод парсинга счета"""
+        return anchors.has('schet') or anchors.has('invoice_en') or anchors.has('invoice_doc')
+
+    def parse_invoice(self, text: str, timings: bool = False,
+                      resolved: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Основной метод парсинга счета.
+        timings=True добавляет в результат блок _meta.timings: время каждого
+        извлекателя в наносекундах, число опробованных паттернов и принятый паттерн.
+        resolved - поля, уже найденные без регулярных выражений (по координатам слов PDF,
+        по ячейкам Excel): total_amount, vat_amount (+ vat_rate), inn (+ all_inns), items.
+        Извлекатели этих полей по тексту не запускаются.
+        """
         if self.debug:
             print(f"Parsing text length: {len(text)} characters")
             print(f"First 200 chars: {repr(text[:200])}")  # Показываем raw содержимое
 
-        # Проверяем, является ли документ счетом
-        if not self.is_invoice_document(text):
-            return {
-                "error": "Загруженный документ не является счетом",
-                "document_type": "unknown",
-                "message": "Пожалуйста, загрузите файл со счетом-фактурой или коммерческим предложением"
-            }
+        started = time.perf_counter_ns() if timings else 0
 
         # НЕ применяем clean_text к основному тексту - нужны переносы строк для таблиц
         # text = self.clean_text(text)
 
-        # Извлекаем все данные
-        invoice_number = self.extract_invoice_number(text)
-        invoice_date = self.extract_date(text)
-        due_date = self.extract_due_date(text)
-        contractor_name = self.extract_contractor_name(text)
-        total_amount = self.extract_total_amount(text)
-        vat_amount, vat_rate = self.extract_vat_info(text)
-        inns = self.extract_inn(text)
+        # Один проход по тексту: позиции якорей и ключевых слов для всех проверок и извлекателей
+        anchors = TracingAnchorIndex(text) if timings else AnchorIndex(text)
 
-        # НДС теперь просто определяет наличие, не вычисляем сумму
-        items = self.extract_items(text)
+        # Проверяем, является ли документ счетом
+        detect_started = time.perf_counter_ns() if timings else 0
+        is_invoice = self.is_invoice_document(text, anchors)
+        if timings:
+            detect_ns = time.perf_counter_ns() - detect_started
+
+        if not is_invoice:
+            result = self._not_invoice_result()
+            if timings:
+                result["_meta"] = {"timings": {"total_ns": time.perf_counter_ns() - started,
+                                               "is_invoice_document": {"ns": detect_ns},
+                                               **anchors.timings}}
+            return result
+
+        # Извлекаем все данные
+        result = self._build_result(self._extract_fields(text, anchors, resolved))
 
         if self.debug:
-            print(f"Invoice number: {invoice_number}")
-            print(f"Contractor: {contractor_name}")
-            print(f"VAT amount: {vat_amount}, rate: {vat_rate}")
-            print(f"Total: {total_amount}")
-            print(f"Items found: {len(items)}")
-
-        # Формируем результат
-        result = {
+            invoice, contractor = result['invoice'], result['contractor']
+            print(f"Invoice number: {invoice['number']}")
+            print(f"Contractor: {contractor['name']}")
+            print(f"VAT amount: {invoice['vat_amount']}, rate: {invoice['vat_rate']}")
+            print(f"Total: {invoice['total_amount']}")
+            print(f"Items found: {len(result['items'])}")
+
+        if timings:
+            result["_meta"] = {"timings": {"total_ns": time.perf_counter_ns() - started,
+                                           "is_invoice_document": {"ns": detect_ns},
+                                           **anchors.timings}}
+
+        return result
+
+    def _not_invoice_result(self) -> Dict[str, Any]:
+        return {
+            "error": "Загруженный документ не является счетом",
+            "document_type": "unknown",
+            "message": "Пожалуйста, загрузите файл со счетом-фактурой или коммерческим предложением"
+        }
+
+    def _extract_fields(self, text: str, anchors: AnchorIndex,
+                        resolved: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Запускает все извлекатели: имя извлекателя -> найденное значение"""
+        measure = anchors.measure
+        resolved = resolved or {}
+
+        if 'total_amount' in resolved:
+            total_amount = resolved['total_amount']
+        else:
+            total_amount = measure('total_amount', self.extract_total_amount, text, anchors)
+
+        if 'vat_amount' in resolved:
+            vat_amount, vat_rate = resolved['vat_amount'], resolved.get('vat_rate')
+            # Ставка не указана рядом с суммой - как в extract_vat_info: по сумме или стандартная
+            if vat_amount is not None and not vat_rate:
+                vat_rate = self.calculate_vat_rate(vat_amount, total_amount) or 20.0
+            vat_info = (vat_amount, vat_rate)
+        else:
+            vat_info = measure('vat_info', self.extract_vat_info, text, anchors)
+
+        if 'inn' in resolved:
+            # ИНН поставщика первым, как в extract_inn
+            inns = [resolved['inn']] + [inn for inn in resolved.get('all_inns') or [] if inn != resolved['inn']]
+        else:
+            inns = measure('inn', self.extract_inn, text, anchors)
+
+        return {
+            'invoice_number': measure('invoice_number', self.extract_invoice_number, text, anchors),
+            'date': measure('date', self.extract_date, text, anchors),
+            'due_date': measure('due_date', self.extract_due_date, text, anchors),
+            'contractor_name': measure('contractor_name', self.extract_contractor_name, text, anchors),
+            'total_amount': total_amount,
+            'vat_info': vat_info,
+            'inn': inns,
+            # НДС теперь просто определяет наличие, не вычисляем сумму
+            'items': resolved['items'] if 'items' in resolved else measure('items', self.extract_items, text),
+        }
+
+    def _build_result(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Собирает результат parse_invoice из значений извлекателей"""
+        invoice_number = fields['invoice_number']
+        invoice_date = fields['date']
+        due_date = fields['due_date']
+        contractor_name = fields['contractor_name']
+        total_amount = fields['total_amount']
+        vat_amount, vat_rate = fields['vat_info']
+        inns = fields['inn']
+        items = fields['items']
+
+        return {
             "invoice": {
                 "number": invoice_number,
                 "date": invoice_date,
@@ -858,13 +1325,144 @@ class UltimateInvoiceParser:
             "items": items
         }
 
+    # Поля, без которых счёт не считается распознанным: (раздел результата, поле)
+    REQUIRED_FIELDS = (
+        ('invoice', 'number'),
+        ('invoice', 'date'),
+        ('invoice', 'total_amount'),
+        ('contractor', 'name'),
+    )
+
+    # Поля, после нахождения которых потоковый разбор перестаёт читать документ:
+    # обязательные плюс НДС и ИНН (все поля, которые забирает /api/smart-invoice).
+    # В счёте "без НДС" сумма НДС не ждётся (InvoiceStream.settled)
+    STREAM_SETTLE_FIELDS = REQUIRED_FIELDS + (
+        ('invoice', 'vat_amount'),
+        ('contractor', 'inn'),
+    )
+
+    def has_required_fields(self, result: Optional[Dict[str, Any]], fields: Optional[tuple] = None) -> bool:
+        """Найдены ли в результате parse_invoice все обязательные поля (номер, дата, сумма, поставщик)"""
+        if not result or 'error' in result:
+            return False
+        return all(result.get(section, {}).get(field) for section, field in fields or self.REQUIRED_FIELDS)
+
+    def start_stream(self, overlap: int = STREAM_OVERLAP_CHARS) -> 'InvoiceStream':
+        """Пустое состояние потокового разбора - части подаются через feed"""
+        return InvoiceStream(self, overlap)
+
+    def parse_stream(self, chunks: Iterable[str], overlap: int = STREAM_OVERLAP_CHARS,
+                     settle_fields: Optional[tuple] = None) -> Dict[str, Any]:
+        """
+        Потоковый разбор длинного документа по частям (страницы PDF, листы Excel).
+
+        Каждая часть разбирается вместе с хвостом предыдущей (overlap символов),
+        чтобы не терять поля на стыке. По каждому полю хранится лучший кандидат:
+        побеждает паттерн, стоящий раньше в каскаде PATTERNS, при равенстве -
+        более раннее вхождение (как при разборе всего текста). Чтение частей
+        прекращается, как только найдены все поля settle_fields (по умолчанию
+        STREAM_SETTLE_FIELDS), поэтому время и память зависят от прочитанной части
+        документа, а не от его размера.
+
+        Результат - как у parse_invoice, плюс _meta.stream: chunks_read, chars_read,
+        stop_reason ("fields_settled" или None - документ прочитан целиком).
+        """
+        settle_fields = settle_fields or self.STREAM_SETTLE_FIELDS
+        stream = self.start_stream(overlap)
+        stop_reason = None
+
+        for chunk in chunks:
+            stream.feed(chunk)
+            if stream.settled(settle_fields):
+                stop_reason = "fields_settled"
+                break
+
         if self.debug:
-            print(f"Parsed: {invoice_number}, {invoice_date}, {contractor_name}")
-            print(f"VAT: {vat_amount}, Rate: {vat_rate}, Items: {len(items)}")
+            print(f"Потоковый разбор: прочитано частей {stream.chunks_read}, символов {stream.chars_read}, "
+                  f"остановка: {stop_reason}")
 
+        result = stream.result()
+        result["_meta"] = {"stream": {"chunks_read": stream.chunks_read, "chars_read": stream.chars_read,
+                                      "stop_reason": stop_reason}}
         return result
 
 
+class InvoiceStream:
+    """
+    Состояние потокового разбора (parse_stream): части подаются по одной через feed,
+    каждая разбирается вместе с хвостом предыдущей, по каждому полю хранится лучший
+    кандидат. Уже прочитанный текст повторно не разбирается, поэтому проверка
+    "все поля найдены" после каждой страницы стоит одну страницу, а не весь документ.
+    """
+
+    def __init__(self, parser: 'UltimateInvoiceParser', overlap: int = STREAM_OVERLAP_CHARS):
+        self.parser = parser
+        self.overlap = overlap
+        self.best: Dict[str, tuple] = {}  # извлекатель -> (ранг паттерна, значение)
+        self.all_inns: List[str] = []
+        # Признаки типа документа копятся по всем частям: счёт - есть слова счёта и
+        # нигде нет слов анкет и заявок (как is_invoice_document по всему тексту)
+        self.has_invoice_words = False
+        self.has_not_invoice = False
+        self.no_vat = False
+        self.tail = ''
+        self.chunks_read = 0
+        self.chars_read = 0
+
+    def feed(self, chunk: str) -> None:
+        self.chunks_read += 1
+        self.chars_read += len(chunk)
+        window = self.tail + chunk
+        self.tail = window[-self.overlap:] if self.overlap else ''
+
+        anchors = TracingAnchorIndex(window)
+        self.has_not_invoice = self.has_not_invoice or anchors.has('not_invoice')
+        self.has_invoice_words = self.has_invoice_words or self.parser.is_invoice_document(window, anchors)
+        self.no_vat = self.no_vat or anchors.has('no_vat')
+        for name, value in self.parser._extract_fields(window, anchors).items():
+            if not value or value == (None, None):
+                continue
+            if name == 'inn':
+                self.all_inns.extend(inn for inn in value if inn not in self.all_inns)
+            rank = _pattern_rank(anchors.timings[name])
+            if name not in self.best or rank < self.best[name][0]:
+                self.best[name] = (rank, value)
+
+    @property
+    def is_invoice(self) -> bool:
+        return self.has_invoice_words and not self.has_not_invoice
+
+    def settled(self, fields: tuple) -> bool:
+        """
+        Документ - счёт, и все поля fields уже найдены. Для счёта "без НДС" сумма НДС
+        считается найденной: её нет в документе, дочитывать его ради неё незачем
+        """
+        if not self.is_invoice:
+            return False
+        if self.no_vat:
+            fields = tuple(field for field in fields if field != ('invoice', 'vat_amount'))
+        return self.parser.has_required_fields(self.result(), fields)
+
+    def result(self) -> Dict[str, Any]:
+        """Результат по прочитанным частям - как у parse_invoice"""
+        if not self.is_invoice:
+            return self.parser._not_invoice_result()
+        return self.parser._build_result(self._fields())
+
+    def _fields(self) -> Dict[str, Any]:
+        """Значения извлекателей из лучших кандидатов"""
+        fields = {name: value for name, (rank, value) in self.best.items()}
+        if 'inn' in fields:
+            # ИНН поставщика - из лучшего кандидата, остальные - в порядке появления
+            supplier_inn = fields['inn'][0]
+            fields['inn'] = [supplier_inn] + [inn for inn in self.all_inns if inn != supplier_inn]
+        fields.setdefault('vat_info', (None, None))
+        fields.setdefault('items', [])
+        for name in ('invoice_number', 'date', 'due_date', 'contractor_name', 'total_amount', 'inn'):
+            fields.setdefault(name, None)
+        return fields
+
+
 def parse_invoice_text(text: str) -> Dict[str, Any]:
     """Функция для использования в API"""
     parser = UltimateInvoiceParser(debug=False)
@@ -872,6 +1470,12 @@ def parse_invoice_text(text: str) -> Dict[str, Any]:
 
 
 def main():
+    # Устанавливаем кодировку stdout для Windows (только для CLI - при импорте модуля потоки не трогаем)
+    if sys.platform == 'win32':
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.detach())
+
     parser = argparse.ArgumentParser(description='Парсер счетов-фактур')
 
     # Группа взаимоисключающих аргументов - либо текст, либо файл
@@ -882,6 +1486,10 @@ def main():
     parser.add_argument('--output-format', choices=['json', 'readable'], default='readable',
                        help='Формат вывода')
     parser.add_argument('--debug', action='store_true', help='Включить отладочный вывод')
+    parser.add_argument('--timings', action='store_true',
+                        help='Добавить в результат _meta.timings (время и паттерны каждого извлекателя)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Разбирать текст по страницам/листам и остановиться, когда все поля найдены')
 
     args = parser.parse_args()
 
@@ -902,7 +1510,10 @@ def main():
     invoice_parser = UltimateInvoiceParser()
     invoice_parser.debug = debug_mode
 
-    result = invoice_parser.parse_invoice(text)
+    if args.stream:
+        result = invoice_parser.parse_stream(iter_text_chunks(text))
+    else:
+        result = invoice_parser.parse_invoice(text, timings=args.timings)
 
     if result is None:
         print("Ошибка: парсер вернул None")
@@ -918,6 +1529,16 @@ def main():
         print(f"Поставщик: {result['contractor']['name']}")
         print(f"Товаров: {len(result['items'])}")
 
+        if args.timings and '_meta' in result and 'timings' in result['_meta']:
+            print("\nВремя извлекателей:")
+            for name, entry in result['_meta']['timings'].items():
+                if name == 'total_ns':
+                    continue
+                matched = entry.get('matched_pattern') or '-'
+                tried = entry.get('patterns_tried', '-')
+                print(f"  {name:20} {entry['ns'] / 1e6:8.3f} мс  паттернов: {tried:>3}  принят: {matched}")
+            print(f"  {'всего':20} {result['_meta']['timings']['total_ns'] / 1e6:8.3f} мс")
+
 
 if __name__ == "__main__":
     main()